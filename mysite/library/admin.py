@@ -1,36 +1,189 @@
 from django.contrib import admin
-from django.db.models import F
+from django.db import transaction
+from django.db.models import Q
+from django.http import QueryDict
+from django.urls import reverse
 
-from .models import Book, Person, Rent
+from . import cache
+from .circulation import return_rents
+from .models import Book, Person, Rent, Title
+from .pagination import EstimatedCountPaginator
 
 # admin.site.register(Person)
 # admin.site.register(Book)
 # admin.site.register(Rent)
 
 
+class AutocompleteFilter(admin.SimpleListFilter):
+    """
+    Filter by related object id picked with autocomplete instead of a list of all objects.
+    """
+
+    template = "admin/library/autocomplete_filter.html"
+    related_model = None
+    url = None
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(**{f"{self.parameter_name}_id": self.value()})
+        return queryset
+
+    def choices(self, changelist):
+        query = changelist.get_query_string(remove=[self.parameter_name])
+        selected = None
+        if self.value() and self.value().isdigit():
+            selected = self.related_model.objects.filter(pk=self.value()).first()
+        yield {
+            "selected": selected,
+            "url": reverse(self.url),
+            "parameter_name": self.parameter_name,
+            "hidden": [
+                (name, value)
+                for name, values in QueryDict(query.lstrip("?")).lists()
+                for value in values
+            ],
+            "query_string": query,
+        }
+
+
+class UserFilter(AutocompleteFilter):
+    title = "user"
+    parameter_name = "user"
+    related_model = Person
+    url = "library:authors_autocomplete"
+
+
+class BookFilter(AutocompleteFilter):
+    title = "book"
+    parameter_name = "book"
+    related_model = Book
+    url = "library:all_books_autocomplete"
+
+
+class StatusFilter(admin.SimpleListFilter):
+    title = "status"
+    parameter_name = "status"
+
+    def lookups(self, request, model_admin):
+        return [("opened", "Ongoing"), ("closed", "Returned")]
+
+    def queryset(self, request, queryset):
+        if self.value() == "opened":
+            return queryset.opened()
+        if self.value() == "closed":
+            return queryset.closed()
+        return queryset
+
+
 class RentAdmin(admin.ModelAdmin):
-    list_display = ["book", "user", "borrow_date", "return_date"]
-    ordering = [F("return_date").desc(nulls_first=True), "borrow_date"]
-    list_filter = [
-        "user",
-        "book",
-    ]
+    list_display = ["book", "user", "borrow_date", "due_date", "return_date"]
+    list_select_related = ["book", "user"]
+    # newest first, read backwards from rent_borrow_date_idx without sorting
+    ordering = ["-borrow_date", "-id"]
+    list_filter = [StatusFilter, UserFilter, BookFilter]
+    date_hierarchy = "borrow_date"
+    autocomplete_fields = ["book", "user"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ["mark_returned"]
+
+    class Media:
+        js = ["library/js/autocomplete.js"]
+
+    @admin.action(description="Mark selected rents as returned")
+    def mark_returned(self, request, queryset):
+        number = return_rents(queryset)
+        self.message_user(request, f"{number} rents marked as returned.")
 
 
 class OwnershipInline(admin.TabularInline):
     model = Book.authors.through
+    autocomplete_fields = ["person", "book"]
     extra = 1
 
 
-class PersonAdmin(admin.ModelAdmin):
+class SearchAdmin(admin.ModelAdmin):
+    """
+    Admin searching with full-text index and counting rows only up to a limit.
+    """
+
+    ordering = ["id"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [OwnershipInline]
+    actions = ["deactivate"]
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.search(search_term), False
 
-class BookAdmin(admin.ModelAdmin):
-    inlines = [OwnershipInline]
+    @admin.action(description="Deactivate selected %(verbose_name_plural)s")
+    def deactivate(self, request, queryset):
+        # search joins fts table which plain UPDATE can not refer to
+        queryset = self.model.objects.filter(pk__in=queryset.values("pk"))
+        number = queryset.deactivate()
+        cache.bump(cache.BOOKS, cache.PERSONS)
+        self.message_user(request, f"{number} objects deactivated.")
+
+
+class PersonAdmin(SearchAdmin):
+    list_display = ["name", "surname", "birth_date", "is_active"]
+    list_filter = ["is_active"]
+    search_fields = ["name", "second_name", "surname"]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # inline saves ownerships without m2m_changed signal of Book.authors
+        person = form.instance
+        Title.objects.filter(
+            Q(authors=person) | Q(copies__authors=person)
+        ).distinct().sync_authors()
+        cache.bump(cache.BOOKS, cache.PERSONS)
+
+
+class BookAdmin(SearchAdmin):
+    list_display = ["title", "is_active", "is_borrowed"]
+    list_filter = ["is_active", "is_borrowed"]
+    search_fields = ["title"]
     exclude = ["authors"]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # inline saves ownerships without m2m_changed signal of Book.authors
+        Title.objects.filter(pk=form.instance.catalogue_title_id).sync_authors()
+        cache.bump(cache.BOOKS, cache.PERSONS)
+
+    def delete_queryset(self, request, queryset):
+        # queryset delete skips Book.delete(), so titles are recounted here
+        with transaction.atomic():
+            title_ids = list(queryset.values_list("catalogue_title", flat=True))
+            super().delete_queryset(request, queryset)
+            Title.objects.filter(pk__in=title_ids).sync_copies()
+
+
+class TitleAdmin(admin.ModelAdmin):
+    list_display = ["name", "copies_available", "copies_total"]
+    # authors are authors of copies, edited on books
+    readonly_fields = ["authors", "copies_available", "copies_total"]
+    search_fields = ["name"]
+    ordering = ["id"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.search(search_term), False
+
 
 admin.site.register(Rent, RentAdmin)
+admin.site.register(Title, TitleAdmin)
 admin.site.register(Book, BookAdmin)
 admin.site.register(Person, PersonAdmin)
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def install_search(sender, using, **kwargs):
+    from . import search
+
+    search.install(connections[using])
 
 
 class LibraryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'library'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # migrations remaking library tables on SQLite drop search triggers
+        post_migrate.connect(install_search, sender=self)
@@ -0,0 +1,70 @@
+"""
+Archiving of old closed rents.
+
+Closed rents never change again, but every query of the Rent table has to
+skip them. archive_rents() moves rents returned before given day into
+ArchivedRent table in chunks, each in its own transaction, so the live table
+keeps only ongoing and recent rents. Archived rents still count in rents
+counters of persons and in rollups, and are read back by
+RentQuerySet.for_books() and for_users() with include_archive=True.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from . import cache
+from .models import ArchivedRent, Rent
+
+ARCHIVE_AFTER_DAYS = 365
+BATCH_SIZE = 1000
+
+
+def archive_before() -> datetime.date:
+    """
+    Returns the day rents returned before are archived by default.
+    """
+    days = getattr(settings, "LIBRARY_ARCHIVE_AFTER_DAYS", ARCHIVE_AFTER_DAYS)
+    return datetime.date.today() - datetime.timedelta(days)
+
+
+def archive_rents(before: datetime.date = None, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Moves closed rents returned before given day to ArchivedRent in chunks of
+    batch_size rents, returns number of moved rents.
+    """
+    before = before or archive_before()
+    moved = 0
+    while number := _archive_chunk(before, batch_size):
+        moved += number
+    return moved
+
+
+def _archive_chunk(before: datetime.date, batch_size: int) -> int:
+    """
+    Help function moving one chunk of rents in one transaction, returns its size.
+    """
+    with transaction.atomic():
+        rents = list(
+            Rent.objects.closed()
+            .filter(return_date__lt=before)
+            .order_by("return_date", "id")
+            .values(*[e.attname for e in ArchivedRent._meta.concrete_fields])[
+                :batch_size
+            ]
+        )
+        if not rents:
+            return 0
+        ArchivedRent.objects.bulk_create([ArchivedRent(**rent) for rent in rents])
+        # closed rents do not affect books and counters, so per-row delete
+        # signals of QuerySet.delete() are skipped
+        connection = connections[router.db_for_write(Rent)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(Rent._meta.db_table)} "
+                f"WHERE id IN ({', '.join(['%s'] * len(rents))})",
+                [rent["id"] for rent in rents],
+            )
+        cache.bump(cache.RENTS, *{cache.user_rents(rent["user_id"]) for rent in rents})
+    return len(rents)
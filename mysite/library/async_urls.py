@@ -0,0 +1,30 @@
+"""
+library/urls.py with read only views replaced by their async versions,
+included instead of it when LIBRARY_ASYNC_VIEWS is set (ASGI deployments).
+"""
+
+from django.urls import path
+from library import async_views, urls
+from library.decorators import login_required
+
+app_name = "library"
+
+ASYNC_VIEWS = {
+    "authors": async_views.authors,
+    "author_status": async_views.author_status,
+    "users": async_views.users,
+    "user_status": async_views.user_status,
+    "books": async_views.books,
+    "book_status": async_views.book_status,
+    "rents": async_views.rents,
+    "rent_status": async_views.rent_status,
+}
+
+urlpatterns = [
+    (
+        path(str(e.pattern), login_required(ASYNC_VIEWS[e.name]), name=e.name)
+        if e.name in ASYNC_VIEWS
+        else e
+    )
+    for e in urls.urlpatterns
+]
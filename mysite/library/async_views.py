@@ -0,0 +1,148 @@
+"""
+Async versions of read only views, served by async_urls.py under ASGI.
+
+They share cached data with the sync views in views.py and use the async
+ORM, so a request waiting for the database does not hold a worker thread.
+"""
+
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.db.models import prefetch_related_objects
+from django.http import Http404
+from django.shortcuts import render
+
+from . import search
+from .cache import BOOKS, PERSONS, RENTS, acached, user_rents
+from .models import Book, Person, Rent, Title
+from .pagination import apaginate
+
+
+async def aget_object_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+
+
+async def authors(request):
+    queryset = Person.objects.authors()
+    ordering = ["id"]
+    if request.GET.get("q"):
+        queryset = queryset.search(request.GET["q"])
+        ordering = search.RANKED
+    authors_list = await acached(
+        "authors",
+        [PERSONS, BOOKS],
+        lambda: apaginate(request, queryset, ordering),
+        request.GET.urlencode(),
+    )
+    context = {"authors_list": authors_list, "page": authors_list}
+    return render(request, "library/authors.html", context)
+
+
+async def author_status(request, person_id):
+    async def build():
+        author = await aget_object_or_404(Person.objects.all(), pk=person_id)
+        books = [e async for e in author.book_set.values("title").distinct()]
+        return {"author": author, "books": books}
+
+    context = await acached("author_status", [PERSONS, BOOKS], build, person_id)
+    return render(request, "library/author_status.html", context)
+
+
+async def users(request):
+    queryset = Person.objects.active()
+    ordering = ["-opened_rents_number", "-id"]
+    if request.GET.get("q"):
+        queryset = queryset.search(request.GET["q"])
+        ordering = search.RANKED
+    users_list = await acached(
+        "users",
+        [PERSONS, RENTS],
+        lambda: apaginate(request, queryset, ordering),
+        request.GET.urlencode(),
+    )
+    context = {"users_list": users_list, "page": users_list}
+    return render(request, "library/users.html", context)
+
+
+async def user_status(request, person_id):
+    rents = Rent.objects.for_users(person_id).select_related("book")
+    # history lists archived rents too, as summary counts them
+    history_rents = Rent.objects.closed().for_users(person_id, include_archive=True)
+
+    async def build():
+        user = await aget_object_or_404(Person.objects.all(), pk=person_id)
+        loans = [e async for e in rents.opened().order_by("due_date", "id")]
+        summary = await sync_to_async(Rent.objects.summary)(
+            include_archive=True, user=person_id
+        )
+        return {"user": user, "loans": loans, "summary": summary}
+
+    async def build_history():
+        page = await apaginate(request, history_rents, ["-return_date", "-id"])
+        # union queryset can't select related books
+        await sync_to_async(prefetch_related_objects)(page.object_list, "book")
+        return page
+
+    scopes = [PERSONS, BOOKS, user_rents(person_id)]
+    context = await acached("user_status", scopes, build, person_id)
+    history = await acached(
+        "user_history", scopes, build_history, person_id, request.GET.urlencode()
+    )
+    context = dict(context, history=history, page=history, today=datetime.date.today())
+    return render(request, "library/user_status.html", context)
+
+
+async def books(request):
+    queryset = Title.objects.active().prefetch_related("authors")
+    ordering = ["id"]
+    if request.GET.get("q"):
+        queryset = queryset.search(request.GET["q"])
+        ordering = search.RANKED
+    books = await acached(
+        "books",
+        [BOOKS, PERSONS, RENTS],
+        lambda: apaginate(request, queryset, ordering),
+        request.GET.urlencode(),
+    )
+    context = {"books": books, "page": books}
+    return render(request, "library/books.html", context)
+
+
+async def book_status(request, book_id):
+    queryset = Book.objects.filter(id=book_id).status().prefetch_related("authors")
+    book = await acached(
+        "book_status",
+        [BOOKS, PERSONS, RENTS],
+        lambda: aget_object_or_404(queryset),
+        book_id,
+    )
+    context = {"book": book}
+    return render(request, "library/book_status.html", context)
+
+
+async def rents(request):
+    rents_list = await acached(
+        "rents",
+        [RENTS, BOOKS, PERSONS],
+        lambda: apaginate(
+            request, Rent.objects.select_related("book", "user"), ["return_date", "id"]
+        ),
+        request.GET.urlencode(),
+    )
+    context = {"rents_list": rents_list, "page": rents_list}
+    return render(request, "library/rents.html", context)
+
+
+async def rent_status(request, rent_id):
+    queryset = Rent.objects.filter(id=rent_id).select_related("book", "user")
+    rent = await acached(
+        "rent_status",
+        [RENTS, BOOKS, PERSONS],
+        lambda: aget_object_or_404(queryset),
+        rent_id,
+    )
+    context = {"rent": rent}
+    return render(request, "library/rent_status.html", context)
@@ -0,0 +1,83 @@
+"""
+Short-lived cache of users authenticated by session.
+
+Django loads request.user from auth_user on every request. get_user() keeps
+the user for LIBRARY_USER_CACHE_SECONDS in LIBRARY_USER_CACHE_ALIAS cache,
+process-local memory by default, so password hashes of users never reach a
+cache shared with other processes. Pages of logged in librarians then read
+only the session, and with cached_db or signed_cookies session engine not
+even that. Cached users are keyed with generation of their scope in the
+shared versioned cache (see cache.py), which saving or deleting the user
+bumps (see signals.py), so every process drops its copy. Session auth hash
+is still compared with the cached user, so password changes log other
+sessions out as before. Sessions of backends not listed in
+AUTHENTICATION_BACKENDS or with a mismatched hash take the uncached path,
+which flushes them.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+
+from . import cache
+
+USER_CACHE_SECONDS = 60
+
+
+def get_users_cache():
+    return caches[getattr(settings, "LIBRARY_USER_CACHE_ALIAS", "users")]
+
+
+def user_scope(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def user_key(user_id) -> str:
+    """
+    Returns key of cached user under current generation of its scope.
+    """
+    (generation,) = cache.generations([user_scope(user_id)])
+    return f"library:user:{user_id}:{generation}"
+
+
+def get_user(request):
+    """
+    Returns user of the request session, from cache when possible.
+    """
+    timeout = getattr(settings, "LIBRARY_USER_CACHE_SECONDS", USER_CACHE_SECONDS)
+    user_id = request.session.get(auth.SESSION_KEY)
+    backend = request.session.get(auth.BACKEND_SESSION_KEY)
+    if (
+        not timeout
+        or user_id is None
+        or backend not in settings.AUTHENTICATION_BACKENDS
+    ):
+        return auth.get_user(request)
+    users = get_users_cache()
+    key = user_key(user_id)
+    user = users.get(key)
+    if user is not None and constant_time_compare(
+        request.session.get(auth.HASH_SESSION_KEY), user.get_session_auth_hash()
+    ):
+        user.backend = backend
+        return user
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        users.set(key, user, timeout)
+    return user
+
+
+async def aget_user(request):
+    """
+    Async version of get_user().
+    """
+    return await sync_to_async(get_user)(request)
+
+
+def forget_user(user_id):
+    """
+    Drops cached user in all processes, called when the user changes.
+    """
+    cache.bump(user_scope(user_id))
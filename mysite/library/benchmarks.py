@@ -0,0 +1,396 @@
+"""
+Benchmark harness timing custom queryset methods and library views.
+
+Every public method of PersonQuerySet, TitleQuerySet, BookQuerySet and
+RentQuerySet and every URL of library/urls.py is run against the current
+database, each repetition with a cold cache and inside a transaction rolled
+back afterwards, so write methods and views leave the data unchanged. Results
+(median and min time, query count) are plain dicts, saved as JSON by the
+benchmark command and compared between commits.
+
+throughput() compares concurrent readers of sync views served through
+WSGI handler with async views served through ASGI handler, using this
+module as URLconf. contention() measures checkouts and returns of the same
+books by concurrent writers. sessions() compares queries and writes of
+logged in page views between session engines and authentication middlewares.
+All of them run with their own local memory caches (BENCHMARK_SETTINGS).
+"""
+
+import asyncio
+import datetime
+import statistics
+import subprocess
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.db.models import QuerySet
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+
+from . import async_urls, urls
+from .cache import get_cache
+from .circulation import checkout, return_rent
+from .models import Book, Person, Rent, Title
+
+MODELS = [Person, Title, Book, Rent]
+SAMPLE_SIZE = 10
+PAGE_SIZE = 50
+REGRESSION_RATIO = 1.2
+SESSION_ENGINES = ["db", "cached_db", "signed_cookies"]
+AUTH_MIDDLEWARES = {
+    "auth": "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "cached_auth": "library.middleware.CachedAuthenticationMiddleware",
+}
+WRITES = ("INSERT", "UPDATE", "DELETE")
+# benchmarks clear caches, so they never touch the configured (shared) ones
+BENCHMARK_SETTINGS = {
+    "CACHES": {
+        alias: {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": f"library-benchmark-{alias}",
+        }
+        for alias in ["default", "users"]
+    },
+    "LIBRARY_CACHE_ALIAS": "default",
+    "LIBRARY_USER_CACHE_ALIAS": "users",
+}
+
+# project URLs are kept for links rendered by templates
+urlpatterns = [
+    path("sync/", include((urls.urlpatterns, "library"), namespace="sync")),
+    path("async/", include((async_urls.urlpatterns, "library"), namespace="async")),
+    path("", include(settings.ROOT_URLCONF)),
+]
+
+
+def queryset_methods(model) -> list:
+    """
+    Returns names of public methods defined by custom queryset of given model.
+    """
+    queryset_class = type(model.objects.all())
+    return sorted(
+        name
+        for name, value in vars(queryset_class).items()
+        if callable(value) and not name.startswith("_")
+    )
+
+
+def sample_ids() -> dict:
+    """
+    Returns ids of objects used as arguments of benchmarked methods and views.
+    """
+    rent = Rent.objects.opened().order_by("id").first() or Rent.objects.first()
+    book = rent.book if rent else Book.objects.first()
+    return {
+        "person_id": rent.user_id if rent else Person.objects.first().id,
+        "book_id": book.id,
+        "title_id": book.catalogue_title_id,
+        "rent_id": rent.id if rent else 0,
+        "books": list(
+            Book.objects.borrowed().values_list("id", flat=True)[:SAMPLE_SIZE]
+        ),
+        "users": list(
+            Person.objects.filter(opened_rents_number__gt=0).values_list(
+                "id", flat=True
+            )[:SAMPLE_SIZE]
+        ),
+    }
+
+
+def method_arguments(sample: dict) -> dict:
+    """
+    Returns positional arguments of queryset methods which need them.
+    """
+    today = datetime.date.today()
+    return {
+        "Person.search": ["anna"],
+        "Title.search": ["dom"],
+        "Book.search": ["dom"],
+        "Book.set_borrowed": [False],
+        "Rent.for_books": sample["books"],
+        "Rent.for_users": sample["users"],
+        "Rent.borrows_greater_than": [today - datetime.timedelta(365)],
+        "Rent.borrows_less_than": [datetime.date(2016, 1, 1)],
+    }
+
+
+def view_arguments(pattern, sample: dict) -> dict:
+    """
+    Returns keyword arguments of URL pattern filled with sample ids.
+    """
+    values = dict(sample, name="rents")
+    return {name: values[name] for name in pattern.pattern.converters}
+
+
+def measure(function, repeat: int) -> dict:
+    """
+    Returns median and min time and query count of function run repeat times.
+    """
+    timings = []
+    for _ in range(repeat):
+        get_cache().clear()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                function()
+                timings.append(time.perf_counter() - start)
+            transaction.set_rollback(True)
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+        "queries": len(queries),
+    }
+
+
+def evaluate(result):
+    """
+    Fetches first page of returned queryset, as list views do.
+    """
+    if isinstance(result, QuerySet):
+        list(result[:PAGE_SIZE])
+
+
+def get_response(client, url):
+    response = client.get(url)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    response.close()
+    return response
+
+
+@override_settings(**BENCHMARK_SETTINGS)
+def run(repeat: int = 3) -> dict:
+    """
+    Returns results of all queryset methods and views, keyed with their names.
+    """
+    sample = sample_ids()
+    arguments = method_arguments(sample)
+    results = {}
+    for model in MODELS:
+        for name in queryset_methods(model):
+            key = f"{model.__name__}.{name}"
+            method = getattr(model.objects, name)
+            results[key] = measure(
+                lambda: evaluate(method(*arguments.get(key, []))), repeat
+            )
+    client = Client()
+    user, _ = User.objects.get_or_create(username="benchmark")
+    client.force_login(user)
+    for pattern in urls.urlpatterns:
+        url = reverse(
+            f"{urls.app_name}:{pattern.name}", kwargs=view_arguments(pattern, sample)
+        )
+        results[f"{urls.app_name}:{pattern.name}"] = measure(
+            lambda: get_response(client, url), repeat
+        )
+    return results
+
+
+def _shares(requests: int, readers: int) -> list:
+    share, remainder = divmod(requests, readers)
+    return [share + (i < remainder) for i in range(readers)]
+
+
+def _rate(requests: int, seconds: float) -> dict:
+    return {
+        "requests": requests,
+        "seconds": round(seconds, 3),
+        "per_second": round(requests / seconds, 1),
+    }
+
+
+def sync_readers(url: str, user, readers: int, requests: int) -> dict:
+    """
+    Returns throughput of sync clients reading url from readers threads.
+    """
+    clients = []
+    for _ in range(readers):
+        clients.append(Client())
+        clients[-1].force_login(user)
+
+    def read(client, number):
+        try:
+            for _ in range(number):
+                client.get(url)
+        finally:
+            connections.close_all()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(readers) as executor:
+        list(executor.map(read, clients, _shares(requests, readers)))
+    return _rate(requests, time.perf_counter() - start)
+
+
+def async_readers(url: str, user, readers: int, requests: int) -> dict:
+    """
+    Returns throughput of async clients reading url concurrently in one event loop.
+    """
+    clients = []
+    for _ in range(readers):
+        clients.append(AsyncClient())
+        clients[-1].force_login(user)
+
+    async def read(client, number):
+        for _ in range(number):
+            await client.get(url)
+
+    async def main():
+        await asyncio.gather(
+            *(read(c, n) for c, n in zip(clients, _shares(requests, readers)))
+        )
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return _rate(requests, time.perf_counter() - start)
+
+
+@override_settings(**BENCHMARK_SETTINGS)
+def throughput(readers: int = 8, requests: int = 200) -> dict:
+    """
+    Returns sync and async throughput of every view having async version.
+    Needs committed data, readers use their own connections.
+    """
+    sample = sample_ids()
+    user, _ = User.objects.get_or_create(username="benchmark")
+    patterns = {e.name: e for e in urls.urlpatterns}
+    results = {}
+    with override_settings(ROOT_URLCONF=__name__):
+        for name in async_urls.ASYNC_VIEWS:
+            kwargs = view_arguments(patterns[name], sample)
+            results[name] = {}
+            for namespace, readers_function in [
+                ("library", sync_readers),
+                ("async", async_readers),
+            ]:
+                get_cache().clear()
+                url = reverse(f"{namespace}:{name}", kwargs=kwargs)
+                results[name][namespace.replace("library", "sync")] = readers_function(
+                    url, user, readers, requests
+                )
+    return results
+
+
+@override_settings(**BENCHMARK_SETTINGS)
+def contention(writers: int = 8, attempts: int = 200, books: int = 2) -> dict:
+    """
+    Returns throughput of writers threads checking out given number of the
+    same available books for different users and returning them, with numbers
+    of checkouts and conflicts. Needs committed data, writers use their own
+    connections.
+    """
+    book_ids = list(
+        Book.objects.active()
+        .available()
+        .order_by("id")
+        .values_list("id", flat=True)[:books]
+    )
+    users = list(Person.objects.active().order_by("id")[:writers])
+    if not book_ids or not users:
+        return {}
+
+    def write(user, number):
+        counts = Counter()
+        try:
+            for i in range(number):
+                result = checkout(user, book_ids[i % len(book_ids)])
+                counts.update(
+                    checkouts=len(result.rents), conflicts=len(result.conflicts)
+                )
+                for rent in result.rents:
+                    return_rent(rent)
+        finally:
+            connections.close_all()
+        return counts
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(writers) as executor:
+        counts = sum(
+            executor.map(
+                write,
+                [users[i % len(users)] for i in range(writers)],
+                _shares(attempts, writers),
+            ),
+            Counter(),
+        )
+    return dict(_rate(attempts, time.perf_counter() - start), **counts)
+
+
+@override_settings(**BENCHMARK_SETTINGS)
+def sessions(requests: int = 200) -> dict:
+    """
+    Returns time, queries and writes per request of a logged in client reading
+    the index page, for every session engine with plain and cached
+    authentication middleware. Writes take the SQLite lock circulation writes
+    wait for.
+    """
+    user, _ = User.objects.get_or_create(username="benchmark")
+    results = {}
+    for engine in SESSION_ENGINES:
+        for name, auth_middleware in AUTH_MIDDLEWARES.items():
+            middleware = [
+                auth_middleware if e in AUTH_MIDDLEWARES.values() else e
+                for e in settings.MIDDLEWARE
+            ]
+            with override_settings(
+                SESSION_ENGINE=f"django.contrib.sessions.backends.{engine}",
+                MIDDLEWARE=middleware,
+            ):
+                get_cache().clear()
+                client = Client()
+                client.force_login(user)
+                url = reverse("library:index")
+                # the first request fills caches
+                client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for _ in range(requests):
+                        client.get(url)
+                    seconds = time.perf_counter() - start
+            writes = [e for e in queries if e["sql"].lstrip().startswith(WRITES)]
+            results[f"{engine}/{name}"] = {
+                "ms_per_request": round(seconds * 1000 / requests, 3),
+                "queries_per_request": round(len(queries) / requests, 2),
+                "writes_per_request": round(len(writes) / requests, 2),
+            }
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: dict, new: dict) -> list:
+    """
+    Returns report lines comparing benchmark results of the same scales, marking
+    with ! entries slower by REGRESSION_RATIO or with more queries.
+    """
+    lines = []
+    for scale, results in new["scales"].items():
+        old_results = old.get("scales", {}).get(scale, {}).get("results", {})
+        lines.append(f"[{scale}]")
+        for name, result in results["results"].items():
+            if name not in old_results:
+                lines.append(f"  {name}: new")
+                continue
+            before = old_results[name]
+            ratio = result["median_ms"] / max(before["median_ms"], 0.001)
+            regression = (
+                ratio > REGRESSION_RATIO or result["queries"] > before["queries"]
+            )
+            lines.append(
+                f"{'!' if regression else ' '} {name}: "
+                f"{before['median_ms']:.1f} -> {result['median_ms']:.1f} ms "
+                f"(x{ratio:.2f}), queries {before['queries']} -> {result['queries']}"
+            )
+    return lines
@@ -0,0 +1,146 @@
+"""
+Versioned cache of data shown by list and status pages.
+
+Every cached value is keyed with generation counters of the data scopes
+(books, persons, rents, rents of one user) it was built from. Writes bump
+the generations of touched scopes (see signals.py and RentEvent log), so
+stale values are never read again and simply expire. Rendering stays per request, because pages carry per user
+CSRF tokens.
+"""
+
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+BOOKS = "books"
+PERSONS = "persons"
+RENTS = "rents"
+
+TIMEOUT = 300
+
+_MISSING = object()
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def get_cache():
+    return caches[getattr(settings, "LIBRARY_CACHE_ALIAS", "default")]
+
+
+def user_rents(user_id) -> str:
+    """
+    Returns scope of rents of one user, bumped with their rent events.
+    """
+    return f"{RENTS}:user:{user_id}"
+
+
+def _generation_key(scope: str) -> str:
+    return f"library:generation:{scope}"
+
+
+def generations(scopes) -> list:
+    """
+    Returns current generations of given scopes, starting missing ones.
+    """
+    cache = get_cache()
+    keys = [_generation_key(scope) for scope in scopes]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            # nanoseconds as start value never collide with evicted generations
+            cache.add(key, time.time_ns(), timeout=None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def _bump(scopes):
+    cache = get_cache()
+    for scope in scopes:
+        try:
+            cache.incr(_generation_key(scope))
+        except ValueError:
+            cache.add(_generation_key(scope), time.time_ns(), timeout=None)
+
+
+def bump(*scopes: str):
+    """
+    Invalidates values built from given scopes, now and once transaction commits.
+    """
+    _bump(scopes)
+    # second bump drops values cached by readers that saw pre-commit data
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def _value_key(name: str, key_parts, generations) -> str:
+    parts = [str(e) for e in (*key_parts, *generations)]
+    digest = hashlib.md5(":".join(parts).encode()).hexdigest()
+    return f"library:view:{name}:{digest}"
+
+
+def cached(name: str, scopes, build, *key_parts):
+    """
+    Returns value of build() cached under view name, key parts and scope generations.
+    """
+    cache = get_cache()
+    key = _value_key(name, key_parts, generations(scopes))
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        _count(name, "misses")
+        value = build()
+        cache.set(key, value, getattr(settings, "LIBRARY_CACHE_TIMEOUT", TIMEOUT))
+    else:
+        _count(name, "hits")
+    return value
+
+
+async def agenerations(scopes) -> list:
+    """
+    Async version of generations().
+    """
+    cache = get_cache()
+    keys = [_generation_key(scope) for scope in scopes]
+    values = await cache.aget_many(keys)
+    for key in keys:
+        if key not in values:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            values[key] = await cache.aget(key)
+    return [values[key] for key in keys]
+
+
+async def acached(name: str, scopes, build, *key_parts):
+    """
+    Async version of cached(), build is awaited. Shares cached values with cached().
+    """
+    cache = get_cache()
+    key = _value_key(name, key_parts, await agenerations(scopes))
+    value = await cache.aget(key, _MISSING)
+    if value is _MISSING:
+        _count(name, "misses")
+        value = await build()
+        await cache.aset(
+            key, value, getattr(settings, "LIBRARY_CACHE_TIMEOUT", TIMEOUT)
+        )
+    else:
+        _count(name, "hits")
+    return value
+
+
+def _count(name: str, kind: str):
+    with _stats_lock:
+        _stats[name, kind] += 1
+
+
+def stats() -> dict:
+    """
+    Returns hits and misses per view counted by this process.
+    """
+    with _stats_lock:
+        result = {}
+        for (name, kind), value in _stats.items():
+            result.setdefault(name, {"hits": 0, "misses": 0})[kind] = value
+        return result
@@ -0,0 +1,380 @@
+"""
+Circulation desk operations: renting books out and taking them back.
+"""
+
+import datetime
+import random
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import F
+
+from . import cache
+from .models import Book, Person, Rent, RentEvent, Reservation
+
+LOCKED_RETRIES = 5
+RETRY_DELAY = 0.05
+
+
+@dataclass
+class BatchResult:
+    """
+    Result of batch operation: processed rents and book ids rejected with a
+    reason, rents of returned books handed off to reservations and made
+    reservations.
+    """
+
+    rents: list = field(default_factory=list)
+    conflicts: dict = field(default_factory=dict)
+    handed_off: list = field(default_factory=list)
+    reservations: list = field(default_factory=list)
+
+
+def _create_rents(rents: list, result: BatchResult) -> list:
+    """
+    Help function inserting rents in one query, falling back to one savepoint
+    per rent when unique_book_rent rejects the batch.
+    """
+    try:
+        with transaction.atomic():
+            return Rent.objects.bulk_create(rents)
+    except IntegrityError:
+        pass
+    created = []
+    for rent in rents:
+        try:
+            with transaction.atomic():
+                Rent.objects.bulk_create([rent])
+        except IntegrityError:
+            result.conflicts[rent.book_id] = "is already borrowed"
+        else:
+            created.append(rent)
+    return created
+
+
+def bulk_checkout(user: Person, book_ids) -> BatchResult:
+    """
+    Rents all given books to user in one transaction, conflicting books are skipped.
+    """
+    result = BatchResult()
+    book_ids = list(dict.fromkeys(book_ids))
+    if not user.is_active:
+        result.conflicts = dict.fromkeys(book_ids, "user is not active")
+        return result
+    with transaction.atomic():
+        books = {
+            id: (is_active, is_borrowed)
+            for id, is_active, is_borrowed in Book.objects.filter(id__in=book_ids)
+            .select_for_update()
+            .values_list("id", "is_active", "is_borrowed")
+        }
+        rents = []
+        for id in book_ids:
+            if id not in books:
+                result.conflicts[id] = "does not exist"
+            elif not books[id][0]:
+                result.conflicts[id] = "is not in library"
+            elif books[id][1]:
+                result.conflicts[id] = "is already borrowed"
+            else:
+                rents.append(Rent(book_id=id, user=user))
+        result.conflicts.update(_serve_queues(user, [rent.book_id for rent in rents]))
+        rents = [rent for rent in rents if rent.book_id not in result.conflicts]
+        result.rents = _create_rents(rents, result)
+        if result.rents:
+            RentEvent.objects.record(
+                RentEvent.Kind.BORROWED, result.rents, datetime.date.today()
+            )
+            Book.objects.filter(
+                id__in=[rent.book_id for rent in result.rents]
+            ).set_borrowed(True)
+            Person.objects.filter(pk=user.pk).add_rents_numbers(
+                opened=len(result.rents), total=len(result.rents)
+            )
+            cache.bump(cache.RENTS)
+    return result
+
+
+def bulk_return(book_ids, user: Person = None) -> BatchResult:
+    """
+    Closes ongoing rents of all given books (borrowed by user, if given) in one transaction.
+    """
+    result = BatchResult()
+    book_ids = list(dict.fromkeys(book_ids))
+    with transaction.atomic():
+        rents = Rent.objects.opened().for_books(*book_ids).select_for_update()
+        if user is not None:
+            rents = rents.for_users(user.pk)
+        by_book = {rent.book_id: rent for rent in rents.only("id", "book", "user")}
+        for id in book_ids:
+            if id not in by_book:
+                result.conflicts[id] = "is not borrowed"
+        result.rents = list(by_book.values())
+        if result.rents:
+            today = datetime.date.today()
+            Rent.objects.filter(id__in=[rent.id for rent in result.rents]).update(
+                return_date=today
+            )
+            RentEvent.objects.record(RentEvent.Kind.RETURNED, result.rents, today)
+            Book.objects.filter(id__in=by_book).set_borrowed(False)
+            for user_id, number in Counter(
+                rent.user_id for rent in result.rents
+            ).items():
+                Person.objects.filter(pk=user_id).add_rents_numbers(opened=-number)
+            result.handed_off = _hand_off(list(by_book))
+            cache.bump(cache.RENTS)
+            for rent in result.rents:
+                rent.return_date = today
+    return result
+
+
+def return_rents(rents) -> int:
+    """
+    Closes ongoing rents among given ones with single update queries, returns their number.
+    """
+    with transaction.atomic():
+        opened = Rent.objects.opened().filter(pk__in=rents.values("pk"))
+        users = Person.objects.filter(pk__in=opened.values("user"))
+        users.update(
+            opened_rents_number=F("opened_rents_number") - users._count_rents(opened)
+        )
+        closed = list(opened.only("id", "book", "user"))
+        book_ids = [rent.book_id for rent in closed]
+        Book.objects.filter(pk__in=book_ids).set_borrowed(False)
+        number = opened.update(return_date=datetime.date.today())
+        RentEvent.objects.record(RentEvent.Kind.RETURNED, closed, datetime.date.today())
+        if number:
+            _hand_off(book_ids)
+            cache.bump(cache.RENTS)
+    return number
+
+
+def _retry_locked(function):
+    """
+    Help function calling function again while the database is locked by
+    other writer, at most LIBRARY_LOCKED_RETRIES times with growing random
+    delays. Inside outer transaction the error is raised at once, as the
+    transaction can not continue.
+    """
+    retries = getattr(settings, "LIBRARY_LOCKED_RETRIES", LOCKED_RETRIES)
+    for attempt in range(retries + 1):
+        try:
+            return function()
+        except OperationalError as e:
+            if (
+                "is locked" not in str(e)
+                or attempt == retries
+                or transaction.get_connection().in_atomic_block
+            ):
+                raise
+        time.sleep(RETRY_DELAY * 2**attempt * random.uniform(0.5, 1))
+
+
+def _book_conflict(book_id: int, reason: str = "is already borrowed") -> str:
+    """
+    Help function returning reason why book can not be rented (or reserved,
+    with reason for active books given).
+    """
+    is_active = Book.objects.filter(pk=book_id).values_list("is_active", flat=True)
+    if not is_active:
+        return "does not exist"
+    return reason if is_active[0] else "is not in library"
+
+
+def _serve_queues(user: Person, book_ids: list) -> dict:
+    """
+    Help function keeping reservation queues of books on shelf about to be
+    rented to user. Returns books whose first reservation of an active user
+    is not the user's one, with a reason. Queues of other books are served up
+    to the reservation of the user, reservations of inactive users ahead are
+    skipped as by _hand_off().
+    """
+    today = datetime.date.today()
+    conflicts = {}
+    queues = defaultdict(list)
+    waiting = (
+        Reservation.objects.waiting()
+        .filter(book__in=book_ids)
+        .select_related("user")
+        .order_by("ticket")
+    )
+    for reservation in waiting:
+        queues[reservation.book_id].append(reservation)
+    for book_id, queue in queues.items():
+        served = []
+        for reservation in queue:
+            served.append(reservation)
+            if reservation.user.is_active:
+                break
+        if served[-1].user.is_active and served[-1].user_id != user.pk:
+            conflicts[book_id] = "is reserved by other user"
+            continue
+        for reservation in served:
+            status = (
+                Reservation.Status.FULFILLED
+                if reservation.user_id == user.pk
+                else Reservation.Status.SKIPPED
+            )
+            Reservation.objects.filter(pk=reservation.pk).update(
+                status=status, served_date=today
+            )
+        Book.objects.filter(pk=book_id).update(reservations_served=served[-1].ticket)
+    return conflicts
+
+
+def _checkout(user: Person, book_id: int) -> BatchResult:
+    result = BatchResult()
+    with transaction.atomic():
+        # writing first takes SQLite write lock at once: read lock of deferred
+        # transaction can not be upgraded while other transaction writes
+        books = Book.objects.filter(pk=book_id, is_active=True, is_borrowed=False)
+        if not books.set_borrowed(True):
+            result.conflicts[book_id] = _book_conflict(book_id)
+            return result
+        result.conflicts = _serve_queues(user, [book_id])
+        if result.conflicts:
+            transaction.set_rollback(True)
+            return result
+        try:
+            with transaction.atomic():
+                result.rents = Rent.objects.bulk_create(
+                    [Rent(book_id=book_id, user=user)]
+                )
+        except IntegrityError:
+            # open rent of the book exists despite its flag, unique_book_rent wins
+            transaction.set_rollback(True)
+            result.conflicts[book_id] = "is already borrowed"
+            return result
+        Person.objects.filter(pk=user.pk).add_rents_numbers(opened=1, total=1)
+        RentEvent.objects.record(
+            RentEvent.Kind.BORROWED, result.rents, datetime.date.today()
+        )
+        cache.bump(cache.RENTS)
+    return result
+
+
+def checkout(user: Person, book_id: int) -> BatchResult:
+    """
+    Rents book to user in one short transaction, retried while the database
+    is locked. Rejected book is returned in conflicts with a reason.
+    """
+    if not user.is_active:
+        return BatchResult(conflicts={book_id: "user is not active"})
+    return _retry_locked(lambda: _checkout(user, book_id))
+
+
+def _return_rent(rent: Rent) -> BatchResult:
+    result = BatchResult()
+    today = datetime.date.today()
+    with transaction.atomic():
+        # closing the rent first takes the write lock, see _checkout()
+        if not Rent.objects.opened().filter(pk=rent.pk).update(return_date=today):
+            result.conflicts[rent.book_id] = "is not borrowed"
+            return result
+        Book.objects.filter(pk=rent.book_id).set_borrowed(False)
+        Person.objects.filter(pk=rent.user_id).add_rents_numbers(opened=-1)
+        RentEvent.objects.record(RentEvent.Kind.RETURNED, [rent], today)
+        result.handed_off = _hand_off([rent.book_id])
+        cache.bump(cache.RENTS)
+    rent.return_date = today
+    result.rents = [rent]
+    return result
+
+
+def return_rent(rent: Rent) -> BatchResult:
+    """
+    Closes given rent in one short transaction, retried while the database
+    is locked. Already closed rent is returned in conflicts by its book id.
+    """
+    return _retry_locked(lambda: _return_rent(rent))
+
+
+def _hand_off(book_ids: list) -> list:
+    """
+    Help function renting returned books to users of the first reservations
+    in their queues, in the transaction of return. Reservations of inactive
+    users are skipped, whole queues of inactive books too. Returns created
+    rents.
+    """
+    today = datetime.date.today()
+    rents = []
+    while book_ids:
+        skipped = []
+        heads = Reservation.objects.heads(*book_ids).select_related("user", "book")
+        for reservation in heads:
+            if not reservation.book.is_active:
+                # removed book stays on shelf for good, nobody gets it
+                Reservation.objects.waiting().filter(book=reservation.book_id).update(
+                    status=Reservation.Status.SKIPPED, served_date=today
+                )
+                Book.objects.filter(pk=reservation.book_id).update(
+                    reservations_served=F("reservations_issued")
+                )
+                continue
+            if reservation.user.is_active:
+                status = Reservation.Status.FULFILLED
+                rents.append(Rent(book_id=reservation.book_id, user=reservation.user))
+            else:
+                status = Reservation.Status.SKIPPED
+                skipped.append(reservation.book_id)
+            Reservation.objects.filter(pk=reservation.pk).update(
+                status=status, served_date=today
+            )
+            Book.objects.filter(pk=reservation.book_id).update(
+                reservations_served=reservation.ticket
+            )
+        book_ids = skipped
+    if rents:
+        Rent.objects.bulk_create(rents)
+        RentEvent.objects.record(RentEvent.Kind.BORROWED, rents, today)
+        Book.objects.filter(id__in=[rent.book_id for rent in rents]).set_borrowed(True)
+        for user_id, number in Counter(rent.user_id for rent in rents).items():
+            Person.objects.filter(pk=user_id).add_rents_numbers(
+                opened=number, total=number
+            )
+    return rents
+
+
+def _reserve(user: Person, book_id: int) -> BatchResult:
+    result = BatchResult()
+    with transaction.atomic():
+        # taking a ticket first takes the write lock, see _checkout()
+        if not Book.objects.filter(pk=book_id, is_active=True, is_borrowed=True).update(
+            reservations_issued=F("reservations_issued") + 1
+        ):
+            result.conflicts[book_id] = _book_conflict(book_id, "is on shelf")
+            return result
+        if Rent.objects.opened().filter(book=book_id, user=user).exists():
+            transaction.set_rollback(True)
+            result.conflicts[book_id] = "is borrowed by the user"
+            return result
+        ticket = Book.objects.values_list("reservations_issued", flat=True).get(
+            pk=book_id
+        )
+        try:
+            with transaction.atomic():
+                result.reservations = [
+                    Reservation.objects.create(
+                        book_id=book_id, user=user, ticket=ticket
+                    )
+                ]
+        except IntegrityError:
+            transaction.set_rollback(True)
+            result.conflicts[book_id] = "is already reserved by the user"
+            return result
+        cache.bump(cache.RENTS)
+    return result
+
+
+def reserve(user: Person, book_id: int) -> BatchResult:
+    """
+    Puts user at the end of reservation queue of borrowed book in one short
+    transaction, retried while the database is locked. Rejected book is
+    returned in conflicts with a reason.
+    """
+    if not user.is_active:
+        return BatchResult(conflicts={book_id: "user is not active"})
+    return _retry_locked(lambda: _reserve(user, book_id))
@@ -0,0 +1,25 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth import decorators
+from django.contrib.auth.views import redirect_to_login
+
+
+def login_required(view):
+    """
+    login_required working with sync and async views. Async views get the user
+    with request.auser(), so checking it does not block the event loop.
+    """
+    if not iscoroutinefunction(view):
+        return decorators.login_required(view)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        # templates read request.user, which would load the user again synchronously
+        request.user = user
+        return await view(request, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,57 @@
+"""
+Incremental consumers of the rent events log.
+
+Every change of circulation appends RentEvent rows in its own transaction
+(see RentEventQuerySet.record()), so consumers (stats, caches, exports,
+notifications) read only events after the last one they handled instead of
+querying rents again. after() reads one batch by primary key range,
+consume() keeps named consumer offsets in EventConsumer and stores them in
+transaction of the handled batch, so database work of handlers is done
+exactly once and other side effects at least once.
+"""
+
+from django.db import transaction
+
+from .models import EventConsumer, RentEvent
+
+BATCH_SIZE = 1000
+
+
+def after(offset: int, limit: int = BATCH_SIZE) -> list:
+    """
+    Returns at most limit events following the one with given id, in order.
+    """
+    return list(RentEvent.objects.after(offset)[:limit])
+
+
+def offset(name: str) -> int:
+    """
+    Returns id of the last event handled by given consumer, 0 for new ones.
+    """
+    return (
+        EventConsumer.objects.filter(name=name).values_list("offset", flat=True).first()
+        or 0
+    )
+
+
+def consume(name: str, handler, batch_size: int = BATCH_SIZE, batches=None) -> int:
+    """
+    Calls handler with batches of events not handled by given consumer yet,
+    at most batches times if given, returns number of handled events.
+    """
+    handled = 0
+    while batches is None or batches > 0:
+        with transaction.atomic():
+            consumer, _ = EventConsumer.objects.select_for_update().get_or_create(
+                name=name
+            )
+            events = after(consumer.offset, batch_size)
+            if not events:
+                break
+            handler(events)
+            consumer.offset = events[-1].id
+            consumer.save(update_fields=["offset", "updated"])
+        handled += len(events)
+        if batches is not None:
+            batches -= 1
+    return handled
@@ -0,0 +1,90 @@
+"""
+Streaming CSV and JSON lines exports of rents, books and persons.
+
+Rows are read with values_list().iterator(), so only one chunk of rows
+is held in memory no matter how large the export is.
+"""
+
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Book, Person, Rent
+
+CHUNK_SIZE = 2000
+
+EXPORT_FIELDS = {
+    "rents": [
+        "id",
+        "book_id",
+        "book__title",
+        "user_id",
+        "user__name",
+        "user__surname",
+        "borrow_date",
+        "return_date",
+    ],
+    "books": ["id", "title", "is_active", "is_borrowed"],
+    "persons": [
+        "id",
+        "name",
+        "second_name",
+        "surname",
+        "birth_date",
+        "death_date",
+        "is_active",
+    ],
+}
+
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+class Echo:
+    """
+    File-like object returning written value, lets csv.writer feed a generator.
+    """
+
+    def write(self, value):
+        return value
+
+
+def rents_queryset(users=(), books=(), borrowed_after=None, borrowed_before=None):
+    """
+    Returns rents filtered with RentQuerySet methods, empty filters are skipped.
+    """
+    queryset = Rent.objects.all()
+    if users:
+        queryset = queryset.for_users(*users)
+    if books:
+        queryset = queryset.for_books(*books)
+    if borrowed_after:
+        queryset = queryset.borrows_greater_than(borrowed_after)
+    if borrowed_before:
+        queryset = queryset.borrows_less_than(borrowed_before)
+    return queryset
+
+
+def export_queryset(name: str, **filters):
+    """
+    Returns queryset of given export, filters apply to rents only.
+    """
+    if name == "rents":
+        return rents_queryset(**filters)
+    return {"books": Book.objects.all(), "persons": Person.objects.all()}[name]
+
+
+def export_lines(name: str, queryset, file_format: str, chunk_size=CHUNK_SIZE):
+    """
+    Yields lines of export in given format, rows are streamed in id order.
+    """
+    fields = EXPORT_FIELDS[name]
+    rows = queryset.order_by("id").values_list(*fields).iterator(chunk_size=chunk_size)
+    if file_format == "csv":
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + "\n"
@@ -1,7 +1,22 @@
+import re
+
+from django.conf import settings
 from django.contrib.auth.forms import AuthenticationForm
-from django.forms import CharField, ModelForm, PasswordInput, TextInput
+from django.forms import (
+    CharField,
+    ChoiceField,
+    Form,
+    IntegerField,
+    ModelChoiceField,
+    ModelForm,
+    PasswordInput,
+    Textarea,
+    TextInput,
+    ValidationError,
+)
 
-from .models import Book, Person
+from .models import Book, Person, Rent
+from .widgets import AutocompleteSelect, AutocompleteSelectMultiple
 
 
 class AuthorForm(ModelForm):
@@ -18,9 +33,14 @@ class AuthorForm(ModelForm):
 
 
 class BookForm(ModelForm):
+    copies = IntegerField(min_value=1, initial=1, help_text="Number of copies.")
+
     class Meta:
         model = Book
         fields = ["authors", "title"]
+        widgets = {
+            "authors": AutocompleteSelectMultiple("library:authors_autocomplete")
+        }
 
 
 class BookInAuthorForm(ModelForm):
@@ -29,6 +49,60 @@ class BookInAuthorForm(ModelForm):
         fields = ["title"]
 
 
+class RentForm(ModelForm):
+    class Meta:
+        model = Rent
+        fields = ["book", "user"]
+        widgets = {
+            "book": AutocompleteSelect("library:books_autocomplete"),
+            "user": AutocompleteSelect("library:users_autocomplete"),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["book"].queryset = Book.objects.active().available()
+        self.fields["user"].queryset = Person.objects.active()
+
+
+class BulkRentForm(Form):
+    CHECKOUT = "checkout"
+    RETURN = "return"
+
+    action = ChoiceField(choices=[(CHECKOUT, "Checkout"), (RETURN, "Return")])
+    user = ModelChoiceField(
+        queryset=Person.objects.active(),
+        required=False,
+        widget=AutocompleteSelect("library:users_autocomplete"),
+        help_text="Required for checkout, limits returns to this user.",
+    )
+    books = CharField(
+        widget=Textarea(attrs={"rows": 6}),
+        help_text="Book ids separated by spaces, commas or new lines.",
+    )
+
+    def clean_books(self):
+        tokens = [e for e in re.split(r"[\s,;]+", self.cleaned_data["books"]) if e]
+        if not all(e.isdigit() for e in tokens):
+            raise ValidationError("Book ids have to be numbers.")
+        limit = getattr(settings, "LIBRARY_BULK_RENT_LIMIT", 1000)
+        if len(tokens) > limit:
+            raise ValidationError(f"At most {limit} books can be processed at once.")
+        return [int(e) for e in tokens]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get("action") == self.CHECKOUT and not cleaned_data.get("user"):
+            self.add_error("user", "User is required for checkout.")
+        return cleaned_data
+
+
+class ReservationForm(Form):
+    user = ModelChoiceField(
+        queryset=Person.objects.active(),
+        widget=AutocompleteSelect("library:users_autocomplete"),
+    )
+
+
 class LoginForm(AuthenticationForm):
     username = CharField(
         label="",
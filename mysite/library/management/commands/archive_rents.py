@@ -0,0 +1,27 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves closed rents returned more than LIBRARY_ARCHIVE_AFTER_DAYS days "
+        "ago to the archive table, in chunks of --batch-size rents."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, help="Archive rents returned more days ago."
+        )
+        parser.add_argument("--batch-size", type=int, default=archive.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1 or (options["days"] or 0) < 0:
+            raise CommandError("--batch-size has to be positive, --days not negative.")
+        before = None
+        if options["days"] is not None:
+            before = datetime.date.today() - datetime.timedelta(options["days"])
+        number = archive.archive_rents(before, options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Archived {number} rents."))
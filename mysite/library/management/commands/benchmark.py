@@ -0,0 +1,112 @@
+import datetime
+import io
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from library import benchmarks
+from library.management.commands.generate_library import SCALES
+from library.models import Book, Person, Rent, Title
+
+
+class Command(BaseCommand):
+    help = (
+        "Times every custom queryset method and library view at given data "
+        "scales in a separate test database filled by generate_library, and "
+        "saves JSON results to diff between commits. SQLite test databases "
+        "live in memory unless DATABASES TEST NAME points to a file, which "
+        "the large scale needs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            action="append",
+            choices=SCALES,
+            help="Data scale, can be repeated. Default: tiny.",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("-o", "--output", help="JSON results file.")
+        parser.add_argument("--compare", help="JSON results file to compare with.")
+        parser.add_argument(
+            "--throughput",
+            action="store_true",
+            help="Also compare sync (WSGI) and async (ASGI) views under concurrent readers.",
+        )
+        parser.add_argument(
+            "--contention",
+            action="store_true",
+            help="Also measure concurrent checkouts and returns of the same books.",
+        )
+        parser.add_argument(
+            "--sessions",
+            action="store_true",
+            help="Also compare queries and writes of session engines and auth middlewares.",
+        )
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--requests", type=int, default=200)
+
+    def handle(self, *args, **options):
+        if min(options["repeat"], options["readers"], options["requests"]) < 1:
+            raise CommandError(
+                "--repeat, --readers and --requests have to be positive."
+            )
+        old = None
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                old = json.load(file)
+        report = {
+            "revision": benchmarks.git_revision(),
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "repeat": options["repeat"],
+            "scales": {},
+        }
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            for scale in options["scale"] or ["tiny"]:
+                call_command("flush", interactive=False, verbosity=0)
+                call_command(
+                    "generate_library",
+                    scale=scale,
+                    seed=options["seed"],
+                    stdout=io.StringIO(),
+                )
+                self.stderr.write(f"Benchmarking {scale} scale...")
+                report["scales"][scale] = {
+                    "data": {
+                        model.__name__: model.objects.count()
+                        for model in [Person, Title, Book, Rent]
+                    },
+                    "results": benchmarks.run(options["repeat"]),
+                }
+                if options["throughput"]:
+                    report["scales"][scale]["throughput"] = benchmarks.throughput(
+                        options["readers"], options["requests"]
+                    )
+                if options["contention"]:
+                    report["scales"][scale]["contention"] = benchmarks.contention(
+                        options["readers"], options["requests"]
+                    )
+                if options["sessions"]:
+                    report["scales"][scale]["sessions"] = benchmarks.sessions(
+                        options["requests"]
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        data = json.dumps(report, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(data + "\n")
+        else:
+            self.stdout.write(data)
+        if old is not None:
+            self.stderr.write("\n".join(benchmarks.compare(old, report)))
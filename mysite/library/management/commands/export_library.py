@@ -0,0 +1,54 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from library.exports import EXPORT_FIELDS, FORMATS, export_lines, export_queryset
+
+
+class Command(BaseCommand):
+    help = "Streams rents, books or persons to CSV or JSON lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", choices=list(EXPORT_FIELDS))
+        parser.add_argument("-o", "--output", help="File to write, stdout by default.")
+        parser.add_argument("--format", choices=list(FORMATS), default="csv")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument(
+            "--user", type=int, action="append", default=[], help="Rents of user id."
+        )
+        parser.add_argument(
+            "--book", type=int, action="append", default=[], help="Rents of book id."
+        )
+        parser.add_argument(
+            "--borrowed-after",
+            type=datetime.date.fromisoformat,
+            help="Rents borrowed after given date (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            "--borrowed-before",
+            type=datetime.date.fromisoformat,
+            help="Rents borrowed before given date (YYYY-MM-DD).",
+        )
+
+    def handle(self, *args, **options):
+        name = options["name"]
+        filters = {}
+        if name == "rents":
+            filters = {
+                "users": options["user"],
+                "books": options["book"],
+                "borrowed_after": options["borrowed_after"],
+                "borrowed_before": options["borrowed_before"],
+            }
+        lines = export_lines(
+            name,
+            export_queryset(name, **filters),
+            options["format"],
+            options["chunk_size"],
+        )
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as file:
+                file.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
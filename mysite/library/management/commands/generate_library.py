@@ -0,0 +1,207 @@
+import datetime
+import random
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from library import cache
+from library.models import Book, Person, Rent, Title, loan_period
+
+# persons, books, rents
+SCALES = {
+    "tiny": (1_000, 5_000, 20_000),
+    "small": (10_000, 100_000, 1_000_000),
+    "large": (100_000, 1_000_000, 10_000_000),
+}
+
+NAMES = [
+    "Adam", "Anna", "Barbara", "Cezary", "Dorota", "Ewa", "Filip", "Grzegorz",
+    "Hanna", "Irena", "Jan", "Julia", "Karol", "Łucja", "Marek", "Nina",
+    "Olga", "Piotr", "Róża", "Stefan", "Tomasz", "Urszula", "Wojciech", "Zofia",
+]  # fmt: skip
+SURNAMES = [
+    "Nowak", "Kowalski", "Wiśniewski", "Wójcik", "Kamiński", "Lewandowski",
+    "Zieliński", "Szymański", "Woźniak", "Dąbrowski", "Kozłowski", "Jankowski",
+    "Mazur", "Kwiatkowski", "Krawczyk", "Piotrowski", "Grabowski", "Nowicki",
+]  # fmt: skip
+WORDS = [
+    "dom", "noc", "las", "morze", "czas", "droga", "miasto", "ogród", "wiatr",
+    "zima", "lato", "kamień", "rzeka", "sen", "światło", "cień", "góra", "list",
+    "pan", "pani", "król", "wojna", "pokój", "niebo", "ziemia", "ogień", "woda",
+]  # fmt: skip
+
+AUTHORS_SHARE = 10
+MAX_COPIES = 3
+START = datetime.date(2015, 1, 1)
+
+
+@contextmanager
+def explicit_borrow_dates():
+    """
+    Lets generated rents keep their borrow_date instead of auto_now_add today.
+    """
+    field = Rent._meta.get_field("borrow_date")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates deterministic synthetic persons, books and rents for "
+        "benchmarks. The same seed and sizes always give the same data. "
+        "Every tenth person is an inactive author, the others are users. "
+        f"Books are copies of titles held in 1 to {MAX_COPIES} copies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=SCALES, default="tiny")
+        parser.add_argument("--persons", type=int, help="Overrides scale.")
+        parser.add_argument("--books", type=int, help="Overrides scale.")
+        parser.add_argument("--rents", type=int, help="Overrides scale.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        persons, books, rents = SCALES[options["scale"]]
+        persons = options["persons"] if options["persons"] is not None else persons
+        books = options["books"] if options["books"] is not None else books
+        rents = options["rents"] if options["rents"] is not None else rents
+        if persons < 2 or books < 1 or rents < 0 or options["batch_size"] < 1:
+            raise CommandError(
+                "At least 2 persons, 1 book and a positive batch needed."
+            )
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.today = datetime.date.today()
+        start = time.perf_counter()
+
+        user_ids, author_ids = self.generate_persons(persons)
+        book_ids = self.generate_books(books, author_ids)
+        self.generate_rents(rents, book_ids, user_ids)
+        with transaction.atomic():
+            Book.objects.availability_mismatched().sync_availability()
+            Person.objects.rents_numbers_mismatched().sync_rents_numbers()
+            Title.objects.sync_copies()
+            cache.bump(cache.BOOKS, cache.PERSONS, cache.RENTS)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {persons} persons, {books} books and {rents} rents "
+                f"in {time.perf_counter() - start:.1f} s."
+            )
+        )
+
+    def batches(self, objects):
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def random_date(self, start: datetime.date, end: datetime.date) -> datetime.date:
+        return start + datetime.timedelta(self.rng.randrange((end - start).days + 1))
+
+    def generate_persons(self, number: int):
+        taken = set(Person.objects.values_list("name", "surname", "birth_date"))
+
+        def persons():
+            for i in range(number):
+                is_author = i % AUTHORS_SHARE == 0
+                birth_date = self.random_date(
+                    datetime.date(1800 if is_author else 1940, 1, 1),
+                    datetime.date(1950 if is_author else 2010, 12, 31),
+                )
+                name = self.rng.choice(NAMES)
+                second_name = self.rng.choice(NAMES) if i % 3 == 0 else ""
+                surname = self.rng.choice(SURNAMES)
+                # names pool is small, next free day keeps unique_person
+                while (name, surname, birth_date) in taken:
+                    birth_date += datetime.timedelta(1)
+                taken.add((name, surname, birth_date))
+                yield Person(
+                    name=name,
+                    second_name=second_name,
+                    surname=surname,
+                    birth_date=birth_date,
+                    is_active=not is_author,
+                )
+
+        user_ids, author_ids = [], []
+        for batch in self.batches(persons()):
+            with transaction.atomic():
+                for person in Person.objects.bulk_create(batch):
+                    (user_ids if person.is_active else author_ids).append(person.id)
+        return user_ids, author_ids
+
+    def generate_books(self, number: int, author_ids: list):
+        def books():
+            copies = 0
+            for i in range(number):
+                if not copies:
+                    words = self.rng.sample(WORDS, self.rng.randint(1, 4))
+                    title = Title(name=f"{' '.join(words).capitalize()} {i}")
+                    authors = self.rng.sample(
+                        author_ids, min(len(author_ids), self.rng.randint(1, 2))
+                    )
+                    copies = self.rng.randint(1, MAX_COPIES)
+                copies -= 1
+                yield title, authors
+
+        Ownership = Book.authors.through
+        Authorship = Title.authors.through
+        book_ids = []
+        for batch in self.batches(books()):
+            with transaction.atomic():
+                # titles of the previous batch copies are saved already
+                titles = {id(t): (t, a) for t, a in batch if t.pk is None}
+                Title.objects.bulk_create(t for t, _ in titles.values())
+                Authorship.objects.bulk_create(
+                    Authorship(title_id=title.id, person_id=person_id)
+                    for title, authors in titles.values()
+                    for person_id in authors
+                )
+                created = Book.objects.bulk_create(
+                    Book(title=title.name, catalogue_title=title) for title, _ in batch
+                )
+                Ownership.objects.bulk_create(
+                    Ownership(book_id=book.id, person_id=person_id)
+                    for book, (_, authors) in zip(created, batch)
+                    for person_id in authors
+                )
+            book_ids.extend(book.id for book in created)
+        return book_ids
+
+    def generate_rents(self, number: int, book_ids: list, user_ids: list):
+        per_book, remainder = divmod(number, len(book_ids))
+
+        def rents():
+            for index, book_id in enumerate(book_ids):
+                count = per_book + (index < remainder)
+                day = self.random_date(START, START + datetime.timedelta(365))
+                for i in range(count):
+                    return_date = min(
+                        day + datetime.timedelta(self.rng.randint(1, 60)), self.today
+                    )
+                    if i == count - 1 and self.rng.random() < 0.3:
+                        return_date = None
+                    yield Rent(
+                        book_id=book_id,
+                        user_id=self.rng.choice(user_ids),
+                        borrow_date=min(day, self.today),
+                        return_date=return_date,
+                        due_date=min(day, self.today) + loan_period(),
+                    )
+                    if return_date is not None:
+                        day = return_date + datetime.timedelta(self.rng.randint(0, 30))
+
+        with explicit_borrow_dates():
+            for batch in self.batches(rents()):
+                with transaction.atomic():
+                    Rent.objects.bulk_create(batch)
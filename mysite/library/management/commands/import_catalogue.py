@@ -0,0 +1,200 @@
+import csv
+import datetime
+import itertools
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from library import cache
+from library.models import Book, Person, Title
+
+PERSON_FIELDS = ["name", "second_name", "surname", "birth_date", "death_date"]
+
+
+def csv_record(row: dict):
+    """
+    Returns (title, authors) record from CSV row with title and one author.
+    """
+    person = {key: row.get(key) or "" for key in PERSON_FIELDS}
+    if "is_active" in row:
+        person["is_active"] = row["is_active"]
+    authors = [person] if person["name"] or person["surname"] else []
+    return row.get("title") or None, authors
+
+
+def jsonl_record(line: str):
+    """
+    Returns (title, authors) record from JSON line with title and authors list.
+    """
+    record = json.loads(line)
+    return record.get("title") or None, record.get("authors") or []
+
+
+def parse_person(data: dict) -> dict:
+    """
+    Returns Person field values from raw record, raises ValueError on bad data.
+    """
+    if not data.get("name") or not data.get("surname"):
+        raise ValueError("author needs name and surname")
+    death_date = data.get("death_date")
+    # only explicit 0 or false deactivates, blank CSV cell or missing or null
+    # JSON value keeps the default
+    is_active = str(data.get("is_active")).strip().lower() not in ("0", "false")
+    return {
+        "name": data["name"],
+        "second_name": data.get("second_name") or "",
+        "surname": data["surname"],
+        "birth_date": datetime.date.fromisoformat(data["birth_date"]),
+        "death_date": datetime.date.fromisoformat(death_date) if death_date else None,
+        "is_active": is_active,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams persons, books and authorship from CSV or JSON lines file "
+        "and inserts them in batches. CSV columns: title, name, second_name, "
+        "surname, birth_date, death_date, is_active (one author per row). "
+        'JSON lines: {"title": ..., "authors": [{"name": ..., ...}]}. '
+        "Records without title import persons only. Persons are deduplicated "
+        "by (name, surname, birth_date), records of the same title and "
+        "authors become copies of one title."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, '-' reads stdin.")
+        parser.add_argument("--format", choices=["csv", "jsonl"])
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or ("csv" if path.endswith(".csv") else "jsonl")
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size has to be positive.")
+
+        self.persons_index = {
+            (name, surname, birth_date): id
+            for name, surname, birth_date, id in Person.objects.values_list(
+                "name", "surname", "birth_date", "id"
+            ).iterator(chunk_size=10000)
+        }
+        self.titles_index = {}
+        self.counts = dict.fromkeys(
+            ["rows", "skipped", "persons", "books", "titles", "authorships"], 0
+        )
+        start = time.monotonic()
+        stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        with stream:
+            if file_format == "csv":
+                self.parse_record = csv_record
+                rows = csv.DictReader(stream)
+            else:
+                self.parse_record = jsonl_record
+                rows = (line for line in stream if line.strip())
+            rows = enumerate(rows, start=1)
+            while chunk := list(itertools.islice(rows, batch_size)):
+                self.import_chunk(chunk)
+                if options["verbosity"] >= 2:
+                    self.stdout.write(self.progress(start))
+        self.stdout.write(self.style.SUCCESS(self.progress(start)))
+
+    def progress(self, start: float) -> str:
+        elapsed = time.monotonic() - start
+        counts = self.counts
+        return (
+            f"{counts['rows']} rows ({counts['skipped']} skipped): "
+            f"{counts['persons']} persons, {counts['books']} books "
+            f"of {counts['titles']} titles, "
+            f"{counts['authorships']} authorships in {elapsed:.1f}s, "
+            f"{counts['rows'] / max(elapsed, 1e-9):.0f} rows/s"
+        )
+
+    def import_chunk(self, chunk):
+        records = []
+        new_persons = {}
+        for line, row in chunk:
+            self.counts["rows"] += 1
+            try:
+                title, authors = self.parse_record(row)
+                keys = []
+                for data in authors:
+                    person = parse_person(data)
+                    key = (person["name"], person["surname"], person["birth_date"])
+                    if key not in self.persons_index and key not in new_persons:
+                        new_persons[key] = Person(**person)
+                    keys.append(key)
+            except (ValueError, KeyError, TypeError) as e:
+                self.counts["skipped"] += 1
+                self.stderr.write(f"Record {line} skipped: {e!r}")
+                continue
+            records.append((title, keys))
+
+        with transaction.atomic():
+            created = Person.objects.bulk_create(new_persons.values())
+            self.index_persons(created)
+            titled = [
+                (title, tuple(dict.fromkeys(self.persons_index[key] for key in keys)))
+                for title, keys in records
+                if title
+            ]
+            titles = self.create_titles(titled)
+            books = [
+                Book(title=title, catalogue_title_id=self.titles_index[title, authors])
+                for title, authors in titled
+            ]
+            Book.objects.bulk_create(books)
+            authorships = []
+            for book, (_, authors) in zip(books, titled):
+                for person_id in authors:
+                    authorships.append(
+                        Book.authors.through(book_id=book.id, person_id=person_id)
+                    )
+            Book.authors.through.objects.bulk_create(authorships)
+            Title.objects.filter(
+                pk__in={e.catalogue_title_id for e in books}
+            ).sync_copies()
+            cache.bump(cache.BOOKS, cache.PERSONS)
+        self.counts["persons"] += len(created)
+        self.counts["books"] += len(books)
+        self.counts["titles"] += len(titles)
+        self.counts["authorships"] += len(authorships)
+
+    def create_titles(self, titled) -> list:
+        """
+        Creates titles of (title, author ids) pairs not imported yet in this
+        run, together with their authors, returns created titles.
+        """
+        new_titles = {}
+        for key in titled:
+            if key not in self.titles_index and key not in new_titles:
+                new_titles[key] = Title(name=key[0])
+        titles = Title.objects.bulk_create(new_titles.values())
+        Title.authors.through.objects.bulk_create(
+            Title.authors.through(title_id=title.id, person_id=person_id)
+            for title, (_, authors) in zip(titles, new_titles)
+            for person_id in authors
+        )
+        for title, key in zip(titles, new_titles):
+            self.titles_index[key] = title.id
+        return titles
+
+    def index_persons(self, persons):
+        """
+        Adds created persons to key index, refetching ids if database did not return them.
+        """
+        missing = [e for e in persons if e.pk is None]
+        for person in persons:
+            if person.pk is not None:
+                self.persons_index[person.name, person.surname, person.birth_date] = (
+                    person.pk
+                )
+        if missing:
+            names = {e.name for e in missing}
+            for name, surname, birth_date, id in Person.objects.filter(
+                name__in=names
+            ).values_list("name", "surname", "birth_date", "id"):
+                self.persons_index.setdefault((name, surname, birth_date), id)
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from library import cache
+from library.models import Book, Person, Title
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds denormalized circulation state of books, titles and persons "
+        "from rents."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only compare stored state with rents, do not fix it.",
+        )
+
+    def handle(self, *args, **options):
+        stale_books = Book.objects.availability_mismatched().count()
+        stale_persons = Person.objects.rents_numbers_mismatched().count()
+        stale_titles = Title.objects.copies_mismatched().count()
+        if options["check"]:
+            if stale_books or stale_persons or stale_titles:
+                raise CommandError(
+                    f"{stale_books} books have stale availability, "
+                    f"{stale_persons} persons have stale rents counters, "
+                    f"{stale_titles} titles have stale copies counters."
+                )
+            self.stdout.write("Circulation state is consistent with rents.")
+            return
+        with transaction.atomic():
+            Book.objects.availability_mismatched().sync_availability()
+            Person.objects.rents_numbers_mismatched().sync_rents_numbers()
+            Title.objects.copies_mismatched().sync_copies()
+            cache.bump(cache.BOOKS, cache.RENTS)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt circulation state, {stale_books} books, "
+                f"{stale_titles} titles and {stale_persons} persons fixed."
+            )
+        )
@@ -0,0 +1,34 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Refreshes daily rents rollups from the latest rolled up day to today. "
+        "Use --since or --full after rents older than that were changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="First day to recompute, YYYY-MM-DD.")
+        parser.add_argument("--until", help="Last day to recompute, YYYY-MM-DD.")
+        parser.add_argument(
+            "--full", action="store_true", help="Recompute from the first rent."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since, until = [
+                datetime.date.fromisoformat(options[key]) if options[key] else None
+                for key in ("since", "until")
+            ]
+        except ValueError as e:
+            raise CommandError(e)
+        if options["full"]:
+            if since:
+                raise CommandError("--full and --since can not be used together.")
+            since = rollups.first_day()
+        days = rollups.refresh(since, until)
+        self.stdout.write(self.style.SUCCESS(f"Refreshed rollups of {days} days."))
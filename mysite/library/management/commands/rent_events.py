@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.forms.models import model_to_dict
+
+from library import events
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints rent events as JSON lines: events after --after id, or events "
+        "not handled yet by --consumer, whose offset is moved past them."
+    )
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument("--after", type=int, default=0, help="Event id.")
+        group.add_argument("--consumer", help="Consumer name.")
+        parser.add_argument("--batch-size", type=int, default=events.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size has to be positive.")
+        if options["consumer"]:
+            events.consume(options["consumer"], self.write, options["batch_size"])
+            return
+        offset = options["after"]
+        while batch := events.after(offset, options["batch_size"]):
+            self.write(batch)
+            offset = batch[-1].id
+
+    def write(self, batch):
+        for event in batch:
+            data = dict(model_to_dict(event), id=event.id, created=event.created)
+            self.stdout.write(json.dumps(data, cls=DjangoJSONEncoder))
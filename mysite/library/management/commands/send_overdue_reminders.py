@@ -0,0 +1,27 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library import reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends one reminder per rent overdue at given day through the outbox "
+        "configured in LIBRARY_OUTBOX, in batches. Already reminded rents are "
+        "skipped, so the command can run repeatedly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--as-of", help="Day to check due dates at, YYYY-MM-DD.")
+        parser.add_argument("--batch-size", type=int, default=reminders.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size has to be positive.")
+        try:
+            as_of = options["as_of"] and datetime.date.fromisoformat(options["as_of"])
+        except ValueError as e:
+            raise CommandError(e)
+        number = reminders.send_overdue_reminders(as_of, options["batch_size"])
+        self.stderr.write(self.style.SUCCESS(f"Sent {number} reminders."))
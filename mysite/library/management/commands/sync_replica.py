@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from library import routers
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the primary SQLite database to SQLite read replicas with the "
+        "online backup API. With --interval it repeats every given seconds, "
+        "which simulates replication lag of that length in local setups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "replica", nargs="*", help="Replica aliases. Default: all replicas."
+        )
+        parser.add_argument("--interval", type=float, help="Repeat every seconds.")
+
+    def handle(self, *args, **options):
+        aliases = options["replica"] or routers.replicas()
+        for alias in aliases:
+            if alias not in routers.replicas():
+                raise CommandError(f"{alias} is not in LIBRARY_REPLICAS.")
+            if connections[alias].vendor != "sqlite":
+                raise CommandError(f"{alias} is not a SQLite database.")
+        while True:
+            for alias in aliases:
+                routers.copy_sqlite(connections[routers.PRIMARY], connections[alias])
+                self.stdout.write(self.style.SUCCESS(f"Synced {alias}."))
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,193 @@
+"""
+In process request metrics exposed in Prometheus text format.
+
+MetricsMiddleware (see middleware.py) fills a RequestRecord for every
+request: number and time of SQL queries (counted by execute wrapper
+installed on every new connection), template render time and response
+size, and observes them in histograms labelled with the URL name. Histograms
+are cumulative, as Prometheus expects, rolling windows are computed by the
+server with rate(). Every worker process keeps its own histograms.
+"""
+
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from django.template.backends.django import DjangoTemplates
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+# slowest statements kept per request for slow request logs
+STATEMENTS_KEPT = 5
+
+
+@dataclass
+class RequestRecord:
+    """
+    Measurements of one request, collected while it is processed. Only
+    statements_kept slowest statements are kept, in a min-heap, so bulk
+    requests do not hold every SQL string.
+    """
+
+    queries: int = 0
+    sql_time: float = 0.0
+    template_time: float = 0.0
+    statements_kept: int = STATEMENTS_KEPT
+    statements: list = field(default_factory=list)
+
+    def add_statement(self, duration: float, sql: str):
+        """
+        Counts executed statement, keeps it if it is among the slowest ones.
+        """
+        self.queries += 1
+        self.sql_time += duration
+        if len(self.statements) < self.statements_kept:
+            heapq.heappush(self.statements, (duration, sql))
+        elif self.statements and duration > self.statements[0][0]:
+            heapq.heapreplace(self.statements, (duration, sql))
+
+    def slowest(self, number: int) -> list:
+        """
+        Returns given number of slowest kept (duration, sql) pairs.
+        """
+        return heapq.nlargest(number, self.statements, key=lambda e: e[0])
+
+
+current = ContextVar("library_request_record", default=None)
+
+
+def execute(execute, sql, params, many, context):
+    """
+    Database execute wrapper timing queries of the current request, if any.
+    """
+    record = current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.add_statement(time.perf_counter() - start, sql)
+
+
+class Histogram:
+    """
+    Thread safe histogram with one label, rendered in Prometheus text format.
+    """
+
+    def __init__(self, name: str, documentation: str, buckets: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, label: str, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(label, ([0] * (len(self.buckets) + 1), 0))
+            counts[index] += 1
+            self._values[label] = (counts, total + value)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def render(self) -> list:
+        with self._lock:
+            values = {label: (list(e[0]), e[1]) for label, e in self._values.items()}
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for label, (counts, total) in sorted(values.items()):
+            label = label.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{view="{label}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{{view="{label}"}} {total}')
+            lines.append(f'{self.name}_count{{view="{label}"}} {cumulative}')
+        return lines
+
+
+REQUEST_TIME = Histogram(
+    "library_request_duration_seconds", "Request processing time.", TIME_BUCKETS
+)
+QUERIES = Histogram("library_db_queries", "SQL queries per request.", QUERIES_BUCKETS)
+SQL_TIME = Histogram(
+    "library_db_duration_seconds", "SQL execution time per request.", TIME_BUCKETS
+)
+TEMPLATE_TIME = Histogram(
+    "library_template_render_seconds", "Template render time per request.", TIME_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    "library_response_size_bytes", "Response body size.", SIZE_BUCKETS
+)
+HISTOGRAMS = [REQUEST_TIME, QUERIES, SQL_TIME, TEMPLATE_TIME, RESPONSE_SIZE]
+
+
+def observe(view: str, duration: float, record: RequestRecord, size: int = None):
+    """
+    Adds measurements of one request to histograms, size is skipped for streamed responses.
+    """
+    REQUEST_TIME.observe(view, duration)
+    QUERIES.observe(view, record.queries)
+    SQL_TIME.observe(view, record.sql_time)
+    TEMPLATE_TIME.observe(view, record.template_time)
+    if size is not None:
+        RESPONSE_SIZE.observe(view, size)
+
+
+def render() -> str:
+    """
+    Returns all histograms in Prometheus text exposition format.
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+
+
+class TimedTemplate:
+    """
+    Template wrapper adding its render time to record of the current request.
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            record = current.get()
+            if record is not None:
+                record.template_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    Django templates backend measuring render time of top level templates.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,261 @@
+import logging
+import mimetypes
+import os
+import time
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import connections
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import parse_etags
+
+from . import auth, metrics, routers
+
+logger = logging.getLogger("library.slow_requests")
+
+SLOW_REQUEST_MS = 500
+SLOW_QUERIES_LOGGED = metrics.STATEMENTS_KEPT
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+STATIC_MAX_AGE = 365 * 24 * 3600
+STATIC_REVALIDATE_AGE = 60
+# precompressed copies written by library/storage.py, preferred first
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def accepted_encodings(header: str) -> dict:
+    """
+    Returns quality values of content codings listed in Accept-Encoding header.
+    """
+    accepted = {}
+    for item in header.split(","):
+        coding, *parameters = [e.strip() for e in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.lower()] = quality
+    return accepted
+
+
+class MetricsMiddleware:
+    """
+    Records query count, SQL time, template render time and response size
+    of every request under its URL name, logs requests slower than
+    LIBRARY_SLOW_REQUEST_MS milliseconds together with their slowest queries.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        record = metrics.RequestRecord()
+        token = metrics.current.set(record)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        self.observe(request, response, time.perf_counter() - start, record)
+        return response
+
+    async def __acall__(self, request):
+        record = metrics.RequestRecord()
+        token = metrics.current.set(record)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        self.observe(request, response, time.perf_counter() - start, record)
+        return response
+
+    def observe(self, request, response, duration, record):
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        size = None if response.streaming else len(response.content)
+        metrics.observe(view, duration, record, size)
+        threshold = getattr(settings, "LIBRARY_SLOW_REQUEST_MS", SLOW_REQUEST_MS)
+        if threshold is not None and duration * 1000 >= threshold:
+            self.log_slow_request(request, view, duration, record)
+
+    def log_slow_request(self, request, view, duration, record):
+        statements = "\n".join(
+            f"  {duration * 1000:.1f} ms: {sql}"
+            for duration, sql in record.slowest(SLOW_QUERIES_LOGGED)
+        )
+        logger.warning(
+            "Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms, "
+            "templates %.1f ms\n%s",
+            request.method,
+            request.get_full_path(),
+            view,
+            duration * 1000,
+            record.queries,
+            record.sql_time * 1000,
+            record.template_time * 1000,
+            statements,
+        )
+
+
+class ReplicaMiddleware:
+    """
+    Lets PrimaryReplicaRouter read from a replica during safe requests of
+    clients without the primary cookie, sets the cookie after requests which
+    wrote to the primary.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.routing_state(request)
+        token = routers.current.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.current.reset(token)
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        state = self.routing_state(request)
+        token = routers.current.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.current.reset(token)
+        return self.pin(response, state)
+
+    def routing_state(self, request):
+        replica = None
+        if request.method in SAFE_METHODS and routers.PIN_COOKIE not in request.COOKIES:
+            replica = routers.choose_replica()
+        return routers.RoutingState(
+            replica=replica,
+            atomic_depth=len(connections[routers.PRIMARY].atomic_blocks),
+        )
+
+    def pin(self, response, state):
+        if state.pinned and routers.replicas():
+            response.set_cookie(
+                routers.PIN_COOKIE,
+                "1",
+                max_age=getattr(
+                    settings, "LIBRARY_REPLICA_PIN_SECONDS", routers.PIN_SECONDS
+                ),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    AuthenticationMiddleware reading request.user through short-lived user
+    cache of auth.get_user() instead of auth_user table on every request.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: auth.get_user(request))
+        request.auser = partial(auth.aget_user, request)
+
+
+class StaticFilesMiddleware:
+    """
+    Serves collected files of STATIC_ROOT under STATIC_URL before other
+    middlewares: content hashed names with far-future cache headers, other
+    ones revalidated by ETag, precompressed copies to clients accepting them.
+    Disabled by LIBRARY_SERVE_STATIC false or STATIC_URL on another host.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.enabled = (
+            getattr(settings, "LIBRARY_SERVE_STATIC", True)
+            and settings.STATIC_ROOT
+            and settings.STATIC_URL.startswith("/")
+        )
+        self.immutable = set()
+        if self.enabled and hasattr(staticfiles_storage, "immutable_names"):
+            self.immutable = staticfiles_storage.immutable_names()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.serve(request) or await self.get_response(request)
+
+    def serve(self, request):
+        """
+        Returns response with static file of request path, None for other paths.
+        """
+        if not self.enabled or request.method not in ("GET", "HEAD"):
+            return None
+        if not request.path_info.startswith(settings.STATIC_URL):
+            return None
+        name = request.path_info.removeprefix(settings.STATIC_URL)
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not name or not os.path.isfile(path):
+            return None
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        quality = {e: accepted.get(e, accepted.get("*", 0)) for e, _ in ENCODINGS}
+        encoding = None
+        # highest quality first, ENCODINGS order among equal ones
+        for candidate, suffix in sorted(ENCODINGS, key=lambda e: -quality[e[0]]):
+            if quality[candidate] > 0 and os.path.isfile(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+        stat = os.stat(path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        if name in self.immutable:
+            cache_control = f"public, max-age={STATIC_MAX_AGE}, immutable"
+        else:
+            cache_control = f"public, max-age={STATIC_REVALIDATE_AGE}"
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+                del response.headers["Content-Disposition"]
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = cache_control
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
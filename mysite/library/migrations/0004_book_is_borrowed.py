@@ -0,0 +1,28 @@
+# Generated by Django 5.0.3 on 2026-10-18 19:47
+
+from django.db import migrations, models
+
+
+def fill_is_borrowed(apps, schema_editor):
+    Book = apps.get_model("library", "Book")
+    Rent = apps.get_model("library", "Rent")
+    open_rents = Rent.objects.filter(
+        book=models.OuterRef("pk"), return_date__isnull=True
+    )
+    Book.objects.update(is_borrowed=models.Exists(open_rents))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_delete_librarymanager'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='is_borrowed',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(fill_is_borrowed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.3 on 2026-10-18 19:47
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_rents(rents):
+    return Coalesce(
+        models.Subquery(
+            rents.filter(user=models.OuterRef("pk"))
+            .order_by()
+            .values("user")
+            .annotate(count=models.Count("id"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def fill_rents_numbers(apps, schema_editor):
+    Person = apps.get_model("library", "Person")
+    Rent = apps.get_model("library", "Rent")
+    Person.objects.update(
+        opened_rents_number=count_rents(Rent.objects.filter(return_date__isnull=True)),
+        rents_number=count_rents(Rent.objects.all()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_book_is_borrowed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='opened_rents_number',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='rents_number',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_rents_numbers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.0.3 on 2026-10-18 19:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_person_rents_numbers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='is_borrowed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='rent',
+            name='book',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='library.book'),
+        ),
+        migrations.AlterField(
+            model_name='rent',
+            name='user',
+            field=models.ForeignKey(db_index=False, limit_choices_to={'is_active': True}, on_delete=django.db.models.deletion.CASCADE, to='library.person'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['is_borrowed'], name='book_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_borrowed', True)), fields=['id'], name='book_borrowed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['opened_rents_number'], name='person_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['id'], name='person_inactive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rent',
+            index=models.Index(fields=['book', 'return_date'], name='rent_book_return_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rent',
+            index=models.Index(fields=['user', 'return_date'], name='rent_user_return_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rent',
+            index=models.Index(fields=['return_date'], name='rent_return_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rent',
+            index=models.Index(fields=['borrow_date'], name='rent_borrow_date_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.3 on 2026-10-18 20:05
+
+from django.db import migrations
+
+from library import search
+
+
+def install(apps, schema_editor):
+    search.install(schema_editor.connection, rebuild=True)
+
+
+def uninstall(apps, schema_editor):
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0006_hot_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.0.3 on 2026-10-18 20:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0007_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RentRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("borrowed", models.PositiveIntegerField(default=0)),
+                ("returned", models.PositiveIntegerField(default=0)),
+                ("loan_days", models.PositiveIntegerField(default=0)),
+                ("opened", models.PositiveIntegerField(blank=True, null=True)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        blank=True,
+                        db_index=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="library.book",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        db_index=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="library.person",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["day"], name="rollup_day_idx")],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="rentrollup",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("book__isnull", True), ("user__isnull", True)),
+                fields=("day",),
+                name="unique_rollup_day",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="rentrollup",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("book__isnull", False)),
+                fields=("book", "day"),
+                name="unique_rollup_book_day",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="rentrollup",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("user__isnull", False)),
+                fields=("user", "day"),
+                name="unique_rollup_user_day",
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.3 on 2026-10-18 20:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0008_rentrollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedRent",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("borrow_date", models.DateField()),
+                ("return_date", models.DateField()),
+                (
+                    "book",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="library.book",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="library.person",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["book", "borrow_date"], name="archive_book_idx"
+                    ),
+                    models.Index(
+                        fields=["user", "borrow_date"], name="archive_user_idx"
+                    ),
+                    models.Index(
+                        fields=["borrow_date"], name="archive_borrow_date_idx"
+                    ),
+                    models.Index(
+                        fields=["return_date"], name="archive_return_date_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.0.3 on 2026-10-18 20:35
+
+import datetime
+
+import library.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_due_dates(apps, schema_editor):
+    """
+    Sets due dates of existing rents to their borrow date plus loan period.
+    """
+    period = datetime.timedelta(
+        getattr(settings, "LIBRARY_LOAN_PERIOD_DAYS", library.models.LOAN_PERIOD_DAYS)
+    )
+    for model_name in ("Rent", "ArchivedRent"):
+        model = apps.get_model("library", model_name)
+        days = model.objects.values_list("borrow_date", flat=True).distinct()
+        for day in days:
+            model.objects.filter(borrow_date=day).update(due_date=day + period)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0009_archivedrent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedrent",
+            name="due_date",
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name="archivedrent",
+            name="reminder_date",
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name="rent",
+            name="due_date",
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name="rent",
+            name="reminder_date",
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(set_due_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="archivedrent",
+            name="due_date",
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name="rent",
+            name="due_date",
+            field=models.DateField(default=library.models.default_due_date),
+        ),
+        migrations.AddIndex(
+            model_name="rent",
+            index=models.Index(
+                condition=models.Q(("return_date__isnull", True)),
+                fields=["return_date", "due_date"],
+                name="rent_open_due_idx",
+            ),
+        ),
+    ]
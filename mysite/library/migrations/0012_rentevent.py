@@ -0,0 +1,60 @@
+# Generated by Django 5.0.3 on 2026-10-18 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0011_reservation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EventConsumer",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                ("offset", models.BigIntegerField(default=0)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="RentEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("borrowed", "Borrowed"),
+                            ("returned", "Returned"),
+                            ("deactivated", "Deactivated"),
+                        ],
+                        max_length=11,
+                    ),
+                ),
+                ("rent_id", models.BigIntegerField(null=True)),
+                ("book_id", models.BigIntegerField(null=True)),
+                ("user_id", models.BigIntegerField(null=True)),
+                ("day", models.DateField()),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,120 @@
+# Generated by Django 5.0.3 on 2026-10-18 20:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def create_titles(apps, schema_editor):
+    """
+    Groups existing books with the same title and authors into one title
+    holding them as copies, with counted copies.
+    """
+    Book = apps.get_model("library", "Book")
+    Title = apps.get_model("library", "Title")
+    authors = {}
+    for book_id, person_id in Book.authors.through.objects.values_list(
+        "book_id", "person_id"
+    ):
+        authors.setdefault(book_id, []).append(person_id)
+    groups = {}
+    for book_id, name, is_active, is_borrowed in Book.objects.order_by(
+        "id"
+    ).values_list("id", "title", "is_active", "is_borrowed"):
+        group = groups.setdefault(
+            (name, tuple(sorted(authors.get(book_id, [])))),
+            {"books": [], "total": 0, "available": 0},
+        )
+        group["books"].append(book_id)
+        group["total"] += is_active
+        group["available"] += is_active and not is_borrowed
+    titles = Title.objects.bulk_create(
+        [
+            Title(
+                name=name,
+                copies_total=group["total"],
+                copies_available=group["available"],
+            )
+            for (name, _), group in groups.items()
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    Title.authors.through.objects.bulk_create(
+        [
+            Title.authors.through(title_id=title.id, person_id=person_id)
+            for title, (_, person_ids) in zip(titles, groups)
+            for person_id in person_ids
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    Book.objects.bulk_update(
+        [
+            Book(id=book_id, catalogue_title_id=title.id)
+            for title, group in zip(titles, groups.values())
+            for book_id in group["books"]
+        ],
+        ["catalogue_title"],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0012_rentevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Title",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=512)),
+                (
+                    "copies_total",
+                    models.PositiveIntegerField(default=0, editable=False),
+                ),
+                (
+                    "copies_available",
+                    models.PositiveIntegerField(default=0, editable=False),
+                ),
+                (
+                    "authors",
+                    models.ManyToManyField(
+                        blank=True, related_name="titles", to="library.person"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="catalogue_title",
+            field=models.ForeignKey(
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="copies",
+                to="library.title",
+            ),
+        ),
+        migrations.RunPython(create_titles, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="book",
+            name="catalogue_title",
+            field=models.ForeignKey(
+                editable=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="copies",
+                to="library.title",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 21:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0013_title"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="book",
+            name="is_borrowed",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -1,8 +1,32 @@
 import datetime
+from collections import defaultdict
 
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, TruncMonth
 from django.forms import ModelForm
 
+from . import cache
+from . import search as full_text
+
+LOAN_PERIOD_DAYS = 30
+
+
+def loan_period() -> datetime.timedelta:
+    """
+    Returns time a book can be borrowed for, LIBRARY_LOAN_PERIOD_DAYS.
+    """
+    return datetime.timedelta(
+        getattr(settings, "LIBRARY_LOAN_PERIOD_DAYS", LOAN_PERIOD_DAYS)
+    )
+
+
+def default_due_date() -> datetime.date:
+    """
+    Returns due date of rent borrowed today.
+    """
+    return datetime.date.today() + loan_period()
+
 
 class IsActive(models.Model):
     """
@@ -30,6 +54,8 @@ class Person(IsActive):
     surname = models.CharField(max_length=15)
     birth_date = models.DateField()
     death_date = models.DateField(null=True, blank=True)
+    opened_rents_number = models.PositiveIntegerField(default=0, editable=False)
+    rents_number = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         constraints = [
@@ -38,6 +64,18 @@ class Person(IsActive):
                 name="unique_person",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["opened_rents_number"],
+                condition=models.Q(is_active=True),
+                name="person_active_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_active=False),
+                name="person_inactive_idx",
+            ),
+        ]
 
     class PersonQuerySet(models.QuerySet):
         """
@@ -51,12 +89,27 @@ class Person(IsActive):
             return self.filter(is_active=True)
             # tested
 
+        def deactivate(self):
+            """
+            Marks persons as inactive (former users) and logs it, returns number
+            of newly deactivated persons.
+            """
+            with transaction.atomic():
+                active = self.filter(is_active=True)
+                ids = list(active.values_list("id", flat=True))
+                RentEvent.objects.record_deactivated(users=ids)
+                return active.update(is_active=False)
+            # tested
+
         def authors(self):
             """
             Returns authors (persons with at least one written book).
             """
-            ids = self.filter(book__authors__isnull=False).distinct().values("id")
-            return self.filter(id__in=ids)
+            return self.filter(
+                models.Exists(
+                    Book.authors.through.objects.filter(person=models.OuterRef("pk"))
+                )
+            )
             # tested
 
         def annotate_rents_number(self, count_filter=None):
@@ -73,7 +126,7 @@ class Person(IsActive):
             Returns number of closed rents for user in rents_count field.
             """
             return self.annotate_rents_number(
-                count_filter=models.Q(rent__in=Rent.objects.closed())
+                count_filter=models.Q(rent__return_date__isnull=False)
             )
             # tested
 
@@ -82,7 +135,7 @@ class Person(IsActive):
             Returns number of ongoing rents for user in rents_count field.
             """
             return self.annotate_rents_number(
-                count_filter=models.Q(rent__in=Rent.objects.opened())
+                count_filter=models.Q(rent__return_date__isnull=True)
             )
             # tested
 
@@ -93,12 +146,177 @@ class Person(IsActive):
             return self.filter(is_active=False)
             # tested
 
+        def search(self, terms: str):
+            """
+            Returns persons with names matching all words of terms as prefixes, best first.
+            """
+            return full_text.search(self, terms)
+            # tested
+
+        def add_rents_numbers(self, opened: int = 0, total: int = 0):
+            """
+            Shifts stored rents counters by given values, returns number of updated persons.
+            """
+            return self.update(
+                opened_rents_number=models.F("opened_rents_number") + opened,
+                rents_number=models.F("rents_number") + total,
+            )
+
+        def _count_rents(self, rents):
+            """
+            Help function returning subquery counting given rents of the person.
+            """
+            return Coalesce(
+                models.Subquery(
+                    rents.filter(user=models.OuterRef("pk"))
+                    .order_by()
+                    .values("user")
+                    .annotate(count=models.Count("id"))
+                    .values("count")
+                ),
+                0,
+            )
+
+        def rents_numbers_mismatched(self):
+            """
+            Returns persons whose stored rents counters disagree with their rents.
+            """
+            return self.annotate(
+                counted_opened=self._count_rents(Rent.objects.opened()),
+                counted_total=self._count_rents(Rent.objects.all())
+                + self._count_rents(ArchivedRent.objects.all()),
+            ).exclude(
+                opened_rents_number=models.F("counted_opened"),
+                rents_number=models.F("counted_total"),
+            )
+            # tested
+
+        def sync_rents_numbers(self):
+            """
+            Recomputes stored rents counters from rents, returns number of updated persons.
+            """
+            return self.update(
+                opened_rents_number=self._count_rents(Rent.objects.opened()),
+                rents_number=self._count_rents(Rent.objects.all())
+                + self._count_rents(ArchivedRent.objects.all()),
+            )
+            # tested
+
     objects = PersonQuerySet().as_manager()
 
     def __str__(self) -> str:
         return f"{self.name} {self.surname}"
 
 
+class Title(models.Model):
+    """
+    Title class for catalogue entries held in one or more copies (Book rows),
+    with counters of its active and available copies.
+    """
+
+    name = models.CharField(max_length=512)
+    authors = models.ManyToManyField(Person, related_name="titles", blank=True)
+    # kept by Book.save() and BookQuerySet.set_borrowed() and deactivate()
+    copies_total = models.PositiveIntegerField(default=0, editable=False)
+    copies_available = models.PositiveIntegerField(default=0, editable=False)
+
+    class TitleQuerySet(models.QuerySet):
+        """
+        Class for Title class connected custom queryset methods.
+        """
+
+        def active(self):
+            """
+            Returns titles with at least one copy in library.
+            """
+            return self.filter(copies_total__gt=0)
+            # tested
+
+        def available(self):
+            """
+            Returns titles with at least one copy on shelf.
+            """
+            return self.filter(copies_available__gt=0)
+            # tested
+
+        def search(self, terms: str):
+            """
+            Returns titles with name matching all words of terms as prefixes, best first.
+            """
+            return full_text.search(self, terms)
+            # tested
+
+        def add_copies(self, total: int = 0, available: int = 0):
+            """
+            Shifts stored copies counters by given values, returns number of updated titles.
+            """
+            return self.update(
+                copies_total=models.F("copies_total") + total,
+                copies_available=models.F("copies_available") + available,
+            )
+
+        def _count_copies(self, books):
+            """
+            Help function returning subquery counting given books of the title.
+            """
+            return Coalesce(
+                models.Subquery(
+                    books.filter(catalogue_title=models.OuterRef("pk"))
+                    .order_by()
+                    .values("catalogue_title")
+                    .annotate(count=models.Count("id"))
+                    .values("count")
+                ),
+                0,
+            )
+
+        def copies_mismatched(self):
+            """
+            Returns titles whose stored copies counters disagree with their books.
+            """
+            return self.annotate(
+                counted_total=self._count_copies(Book.objects.active()),
+                counted_available=self._count_copies(Book.objects.active().available()),
+            ).exclude(
+                copies_total=models.F("counted_total"),
+                copies_available=models.F("counted_available"),
+            )
+            # tested
+
+        def sync_copies(self):
+            """
+            Recomputes stored copies counters from books, returns number of updated titles.
+            """
+            return self.update(
+                copies_total=self._count_copies(Book.objects.active()),
+                copies_available=self._count_copies(Book.objects.active().available()),
+            )
+            # tested
+
+        def sync_authors(self):
+            """
+            Recomputes authors of titles as authors of their copies.
+            """
+            Authorship = Title.authors.through
+            with transaction.atomic():
+                ids = list(self.values_list("id", flat=True))
+                Authorship.objects.filter(title__in=ids).delete()
+                Authorship.objects.bulk_create(
+                    Authorship(title_id=title_id, person_id=person_id)
+                    for title_id, person_id in Book.authors.through.objects.filter(
+                        book__catalogue_title__in=ids
+                    )
+                    .values_list("book__catalogue_title", "person")
+                    .distinct()
+                )
+            # tested
+
+    objects = TitleQuerySet().as_manager()
+
+    def __str__(self) -> str:
+        return self.name
+
+
 class Book(IsActive):
     """
     Book class for all books.
@@ -106,6 +324,31 @@ class Book(IsActive):
 
     authors = models.ManyToManyField(Person)
     title = models.CharField(max_length=512)
+    # books are copies of catalogue titles
+    catalogue_title = models.ForeignKey(
+        Title, on_delete=models.PROTECT, related_name="copies", editable=False
+    )
+    # kept by Rent.save() and circulation, not edited by hand
+    is_borrowed = models.BooleanField(default=False, editable=False)
+    # reservation tickets are numbered per book, all tickets up to served are
+    # fulfilled or skipped and the rest wait in queue
+    reservations_issued = models.PositiveIntegerField(default=0, editable=False)
+    reservations_served = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # boolean columns are indexed by partial indexes, plain ones are not used
+        indexes = [
+            models.Index(
+                fields=["is_borrowed"],
+                condition=models.Q(is_active=True),
+                name="book_active_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_borrowed=True),
+                name="book_borrowed_idx",
+            ),
+        ]
 
     class BookQuerySet(models.QuerySet):
         """
@@ -126,29 +369,182 @@ class Book(IsActive):
             return self.filter(is_active=False)
             # not  tested
 
+        def search(self, terms: str):
+            """
+            Returns books with title matching all words of terms as prefixes, best first.
+            """
+            return full_text.search(self, terms)
+            # tested
+
         def status(self):
             """
             Returns if book is_available to rent for every book.
             """
-            condition = models.Q(id__in=self.available())
-            return self.annotate(is_available=condition)
+            return self.annotate(is_available=models.Q(is_borrowed=False))
 
         def available(self):
             """
             Returns all books that are 'on shelf' and can be borrowed.
             """
-            return self.exclude(id__in=self.borrowed())
+            return self.filter(is_borrowed=False)
             # tested
 
         def borrowed(self):
             """
             Returns all books that are borrowed and hadn't been returned.
             """
-            return self.filter(rent__return_date__isnull=True, rent__book__isnull=False)
+            return self.filter(is_borrowed=True)
+            # tested
+
+        def deactivate(self):
+            """
+            Marks books as inactive (removed from library) and logs it, returns
+            number of newly deactivated books.
+            """
+            with transaction.atomic():
+                active = self.filter(is_active=True)
+                ids = list(active.values_list("id", flat=True))
+                RentEvent.objects.record_deactivated(books=ids)
+                # searched querysets join FTS table, which subqueries can not refer to
+                counts = (
+                    Book.objects.filter(pk__in=ids)
+                    .order_by()
+                    .values("catalogue_title")
+                    .annotate(
+                        total=models.Count("id"),
+                        available=models.Count(
+                            "id", filter=models.Q(is_borrowed=False)
+                        ),
+                    )
+                )
+                # titles have few copies, so there are few distinct shifts
+                shifts = defaultdict(list)
+                for e in counts:
+                    shifts[e["total"], e["available"]].append(e["catalogue_title"])
+                for (total, available), title_ids in shifts.items():
+                    Title.objects.filter(pk__in=title_ids).add_copies(
+                        total=-total, available=-available
+                    )
+                return active.update(is_active=False)
+            # tested
+
+        def set_borrowed(self, value: bool):
+            """
+            Marks books as borrowed or returned and shifts available copies
+            counters of their titles, returns number of changed books.
+            """
+            with transaction.atomic():
+                changed = self.exclude(is_borrowed=value)
+                # writing books first takes SQLite write lock, see
+                # circulation._checkout(), before titles count them
+                if not changed.update(is_borrowed=models.F("is_borrowed")):
+                    return 0
+                counted = changed.filter(is_active=True)
+                titles = Title.objects.filter(pk__in=counted.values("catalogue_title"))
+                titles.update(
+                    copies_available=models.F("copies_available")
+                    + (-1 if value else 1) * titles._count_copies(counted)
+                )
+                return changed.update(is_borrowed=value)
+
+        def _has_open_rent(self):
+            """
+            Help function returning EXISTS expression for ongoing rent of the book.
+            """
+            return models.Exists(
+                Rent.objects.opened().filter(book=models.OuterRef("pk"))
+            )
+
+        def availability_mismatched(self):
+            """
+            Returns books whose is_borrowed flag disagrees with their rents.
+            """
+            has_open_rent = self._has_open_rent()
+            return self.filter(
+                models.Q(has_open_rent, is_borrowed=False)
+                | models.Q(~has_open_rent, is_borrowed=True)
+            )
+            # tested
+
+        def sync_availability(self):
+            """
+            Recomputes is_borrowed flag from rents and copies counters of their
+            titles, returns number of updated books.
+            """
+            with transaction.atomic():
+                title_ids = list(self.values_list("catalogue_title", flat=True))
+                updated = self.update(is_borrowed=self._has_open_rent())
+                Title.objects.filter(pk__in=title_ids).sync_copies()
+                return updated
             # tested
 
     objects = BookQuerySet().as_manager()
 
+    @property
+    def queue_length(self) -> int:
+        """
+        Returns number of reservations waiting for the book.
+        """
+        return self.reservations_issued - self.reservations_served
+
+    # (is_active, is_borrowed, catalogue_title_id) as loaded from the database,
+    # None when unknown
+    _loaded = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {"is_active", "is_borrowed", "catalogue_title_id"} <= set(field_names):
+            instance._loaded = (
+                instance.is_active,
+                instance.is_borrowed,
+                instance.catalogue_title_id,
+            )
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Saves book, a new book without title becomes the first copy of a new
+        title of the same name and is counted by its title. Titles of a book
+        deactivated, returned to the library or moved to another title are
+        recounted, moved book changes authors of both titles.
+        """
+        adding = self._state.adding
+        with transaction.atomic():
+            if adding and self.catalogue_title_id is None:
+                self.catalogue_title = Title.objects.create(name=self.title)
+            loaded = self._loaded
+            if not adding and loaded is None:
+                loaded = (
+                    Book.objects.filter(pk=self.pk)
+                    .values_list("is_active", "is_borrowed", "catalogue_title")
+                    .first()
+                )
+            super().save(*args, **kwargs)
+            if adding and self.is_active:
+                Title.objects.filter(pk=self.catalogue_title_id).add_copies(
+                    total=1, available=int(not self.is_borrowed)
+                )
+            state = (self.is_active, self.is_borrowed, self.catalogue_title_id)
+            if not adding and loaded != state:
+                titles = Title.objects.filter(
+                    pk__in={self.catalogue_title_id, loaded and loaded[2]} - {None}
+                )
+                titles.sync_copies()
+                if not loaded or loaded[2] != self.catalogue_title_id:
+                    titles.sync_authors()
+        self._loaded = state
+
+    def delete(self, *args, **kwargs):
+        """
+        Deletes book and recounts copies counters of its title, flags of the
+        instance may be older than the row.
+        """
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Title.objects.filter(pk=self.catalogue_title_id).sync_copies()
+        return result
+
     def __str__(self) -> str:
         return f"[id:{self.id}] {self.title} "
 
@@ -158,14 +554,19 @@ class Rent(models.Model):
     Rent class for borrowed books and things connected.
     """
 
-    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    # FK indexes are replaced by composite (book|user, return_date) indexes
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False)
     user = models.ForeignKey(
         Person,
         on_delete=models.CASCADE,
         limit_choices_to={"is_active": True},
+        db_index=False,
     )
     borrow_date = models.DateField(auto_now_add=True)
     return_date = models.DateField(blank=True, null=True)
+    due_date = models.DateField(default=default_due_date)
+    # day the overdue reminder was sent, one reminder is sent per rent
+    reminder_date = models.DateField(blank=True, null=True, editable=False)
 
     class Meta:
         constraints = [
@@ -175,6 +576,18 @@ class Rent(models.Model):
                 name="unique_book_rent",
             )
         ]
+        indexes = [
+            models.Index(fields=["book", "return_date"], name="rent_book_return_idx"),
+            models.Index(fields=["user", "return_date"], name="rent_user_return_idx"),
+            models.Index(fields=["return_date"], name="rent_return_date_idx"),
+            models.Index(fields=["borrow_date"], name="rent_borrow_date_idx"),
+            # return_date leads, so planner prefers it to rent_return_date_idx
+            models.Index(
+                fields=["return_date", "due_date"],
+                condition=models.Q(return_date__isnull=True),
+                name="rent_open_due_idx",
+            ),
+        ]
 
     class RentQuerySet(models.QuerySet):
         """
@@ -194,18 +607,32 @@ class Rent(models.Model):
             return self._by_return_date(False)
             # tested
 
-        def for_books(self, *book_ids: int):
+        def _with_archive(self, include_archive: bool, **lookup):
             """
-            Returns rent history of book with given id.
+            Help function filtering rents by lookup, optionally in union with
+            archived rents matching the same lookup.
             """
-            return self.filter(book__in=book_ids)
+            queryset = self.filter(**lookup)
+            if not include_archive:
+                return queryset
+            return queryset.union(ArchivedRent.objects.filter(**lookup), all=True)
+
+        def for_books(self, *book_ids: int, include_archive: bool = False):
+            """
+            Returns rent history of book with given id, with archived rents when
+            include_archive is true (as Rent objects of union queryset, which can
+            only be ordered and sliced).
+            """
+            return self._with_archive(include_archive, book__in=book_ids)
             # tested
 
-        def for_users(self, *user_ids: int):
+        def for_users(self, *user_ids: int, include_archive: bool = False):
             """
-            Returns rent history of user with given id.
+            Returns rent history of user with given id, with archived rents when
+            include_archive is true (as Rent objects of union queryset, which can
+            only be ordered and sliced).
             """
-            return self.filter(user__in=user_ids)
+            return self._with_archive(include_archive, user__in=user_ids)
             # tested
 
         def opened(self):
@@ -226,7 +653,509 @@ class Rent(models.Model):
             """
             return self.filter(borrow_date__lt=date)
 
+        def overdue(self, as_of: datetime.date = None):
+            """
+            Returns open rents due before given date (default today).
+            """
+            return self.opened().filter(due_date__lt=as_of or datetime.date.today())
+            # tested
+
+        def summary(
+            self,
+            as_of: datetime.date = None,
+            include_archive: bool = False,
+            **lookup,
+        ) -> dict:
+            """
+            Returns numbers of rents matching lookup, ongoing, overdue and
+            returned ones and average loan days of returned ones, in one
+            aggregate query (one more for archived rents when include_archive
+            is true, SQLite can't subtract dates of union subquery columns).
+            """
+            opened = models.Q(return_date__isnull=True)
+            overdue = opened & models.Q(due_date__lt=as_of or datetime.date.today())
+            querysets = [self.filter(**lookup)]
+            if include_archive:
+                querysets.append(ArchivedRent.objects.filter(**lookup))
+            summary = dict.fromkeys(["rents", "opened", "overdue", "returned"], 0)
+            loan = datetime.timedelta()
+            for queryset in querysets:
+                totals = queryset.aggregate(
+                    rents=models.Count("id"),
+                    opened=models.Count("id", filter=opened),
+                    overdue=models.Count("id", filter=overdue),
+                    returned=models.Count("return_date"),
+                    loan=models.Sum(models.F("return_date") - models.F("borrow_date")),
+                )
+                loan += totals.pop("loan") or datetime.timedelta()
+                for name, value in totals.items():
+                    summary[name] += value
+            summary["average_loan_days"] = (
+                loan.days / summary["returned"] if summary["returned"] else None
+            )
+            return summary
+            # tested
+
     objects = RentQuerySet().as_manager()
 
+    # (return_date is None, book_id, user_id) as loaded from the database,
+    # None when unknown
+    _loaded = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {"return_date", "book_id", "user_id"} <= set(field_names):
+            instance._loaded = (
+                instance.return_date is None,
+                instance.book_id,
+                instance.user_id,
+            )
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Saves rent and keeps is_borrowed flags of its book, rents counters of
+        its user and rent events log in the same transaction, also when an
+        ongoing rent is moved to another book or user, and invalidates
+        dashboards of its users. Book freed by the rent is handed off to its
+        reservation queue.
+        """
+        is_open = self.return_date is None
+        adding = self._state.adding
+        with transaction.atomic():
+            if adding:
+                loaded = (False, self.book_id, self.user_id)
+            elif self._loaded is None:
+                row = (
+                    Rent.objects.filter(pk=self.pk)
+                    .values_list("return_date", "book_id", "user_id")
+                    .first()
+                )
+                loaded = (
+                    (row[0] is None, *row[1:])
+                    if row
+                    else (False, self.book_id, self.user_id)
+                )
+            else:
+                loaded = self._loaded
+            was_open, book_id, user_id = loaded
+            super().save(*args, **kwargs)
+            if adding or (is_open and not was_open):
+                RentEvent.objects.record(
+                    RentEvent.Kind.BORROWED, [self], self.borrow_date
+                )
+            if (adding or was_open) and not is_open:
+                RentEvent.objects.record(
+                    RentEvent.Kind.RETURNED, [self], self.return_date
+                )
+            moved_book = book_id != self.book_id
+            if was_open and (not is_open or moved_book):
+                # circulation imports models
+                from .circulation import _hand_off
+
+                Book.objects.filter(pk=book_id).set_borrowed(False)
+                _hand_off([book_id])
+            if is_open and (not was_open or moved_book):
+                Book.objects.filter(pk=self.book_id).set_borrowed(True)
+            moved_user = user_id != self.user_id
+            if moved_user:
+                Person.objects.filter(pk=user_id).add_rents_numbers(
+                    opened=-int(was_open), total=-1
+                )
+            if adding or moved_user or is_open != was_open:
+                Person.objects.filter(pk=self.user_id).add_rents_numbers(
+                    opened=int(is_open) - int(was_open and not moved_user),
+                    total=int(adding or moved_user),
+                )
+            # dates of the rent are shown on dashboards of its users
+            cache.bump(*{cache.user_rents(user_id), cache.user_rents(self.user_id)})
+        self._loaded = (is_open, self.book_id, self.user_id)
+
+    def forget(self):
+        """
+        Recounts is_borrowed flag of the book and rents counters of the user of
+        deleted rent. Called by post_delete signal, as rents deleted by
+        querysets and by cascades of deleted books and persons skip delete().
+        """
+        Book.objects.filter(pk=self.book_id).sync_availability()
+        Person.objects.filter(pk=self.user_id).sync_rents_numbers()
+
     def __str__(self) -> str:
         return f"Book:{self.book_id} borrowed by user:{self.user_id}"
+
+
+class ArchivedRent(models.Model):
+    """
+    Closed rent moved out of Rent table by archive.archive_rents(). Columns
+    follow Rent ones, so both tables can be read with one union query.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    # FK indexes are replaced by composite (book|user, borrow_date) indexes
+    book = models.ForeignKey(
+        Book, on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+    user = models.ForeignKey(
+        Person, on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+    borrow_date = models.DateField()
+    return_date = models.DateField()
+    due_date = models.DateField()
+    reminder_date = models.DateField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["book", "borrow_date"], name="archive_book_idx"),
+            models.Index(fields=["user", "borrow_date"], name="archive_user_idx"),
+            models.Index(fields=["borrow_date"], name="archive_borrow_date_idx"),
+            models.Index(fields=["return_date"], name="archive_return_date_idx"),
+        ]
+
+    def forget(self):
+        """
+        Recounts rents counters of the user of deleted archived rent, called
+        by post_delete signal as Rent.forget().
+        """
+        Person.objects.filter(pk=self.user_id).sync_rents_numbers()
+
+    def __str__(self) -> str:
+        return f"Archived book:{self.book_id} borrowed by user:{self.user_id}"
+
+
+class Reservation(models.Model):
+    """
+    Reservation class for users waiting for a borrowed book, in FIFO queue
+    per book ordered by ticket number.
+    """
+
+    class Status(models.TextChoices):
+        WAITING = "waiting"
+        FULFILLED = "fulfilled"
+        SKIPPED = "skipped"
+
+    # FK indexes are replaced by queue and unique indexes
+    book = models.ForeignKey(
+        Book, on_delete=models.CASCADE, related_name="reservations", db_index=False
+    )
+    user = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        related_name="reservations",
+        limit_choices_to={"is_active": True},
+        db_index=False,
+    )
+    ticket = models.PositiveIntegerField(editable=False)
+    status = models.CharField(
+        max_length=9, choices=Status, default=Status.WAITING, editable=False
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    served_date = models.DateField(blank=True, null=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["book", "ticket"], name="unique_reservation_ticket"
+            ),
+            models.UniqueConstraint(
+                fields=["user", "book"],
+                condition=models.Q(status="waiting"),
+                name="unique_waiting_reservation",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["book", "ticket"],
+                condition=models.Q(status="waiting"),
+                name="reservation_queue_idx",
+            ),
+        ]
+
+    class ReservationQuerySet(models.QuerySet):
+        """
+        Class for Reservation class connected custom queryset methods.
+        """
+
+        def waiting(self):
+            """
+            Returns reservations waiting in queue.
+            """
+            return self.filter(status=Reservation.Status.WAITING)
+            # tested
+
+        def heads(self, *book_ids: int):
+            """
+            Returns first waiting reservation of every given book.
+            """
+            return self.waiting().filter(
+                book__in=book_ids,
+                ticket=models.Subquery(
+                    Reservation.objects.waiting()
+                    .filter(book=models.OuterRef("book"))
+                    .order_by("ticket")
+                    .values("ticket")[:1]
+                ),
+            )
+            # tested
+
+    objects = ReservationQuerySet().as_manager()
+
+    @property
+    def position(self):
+        """
+        Returns place in queue of waiting reservation (1 for its head), None
+        for served ones.
+        """
+        if self.status != Reservation.Status.WAITING:
+            return None
+        return self.ticket - self.book.reservations_served
+
+    def estimated_date(self):
+        """
+        Returns day the book is expected for waiting reservation: due date of
+        its ongoing rent plus loan period per reservation ahead, None for
+        served reservations or books on shelf.
+        """
+        position = self.position
+        due_date = (
+            Rent.objects.opened()
+            .filter(book=self.book_id)
+            .values_list("due_date", flat=True)
+            .first()
+        )
+        if position is None or due_date is None:
+            return None
+        due_date = max(due_date, datetime.date.today())
+        return due_date + loan_period() * (position - 1)
+
+    def __str__(self) -> str:
+        return f"Book:{self.book_id} reserved by user:{self.user_id} #{self.ticket}"
+
+
+class RentEvent(models.Model):
+    """
+    Append-only log of circulation changes for incremental consumers (see
+    events.py), written in transactions of the changes. Ids are sequence
+    numbers, increasing in commit order as SQLite commits one writer at a
+    time. Rent, book and user ids are plain numbers, so events outlive
+    archived rents.
+    """
+
+    class Kind(models.TextChoices):
+        BORROWED = "borrowed"
+        RETURNED = "returned"
+        DEACTIVATED = "deactivated"
+
+    kind = models.CharField(max_length=11, choices=Kind)
+    rent_id = models.BigIntegerField(null=True)
+    book_id = models.BigIntegerField(null=True)
+    user_id = models.BigIntegerField(null=True)
+    day = models.DateField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class RentEventQuerySet(models.QuerySet):
+        """
+        Class for RentEvent class connected custom queryset methods.
+        """
+
+        def after(self, offset: int):
+            """
+            Returns events following the one with given id, in order.
+            """
+            return self.filter(id__gt=offset).order_by("id")
+            # tested
+
+        def record(self, kind: str, rents, day: datetime.date) -> list:
+            """
+            Logs event of given kind and day for every given rent and invalidates
+            cached rents of their users.
+            """
+            events = self.bulk_create(
+                RentEvent(
+                    kind=kind,
+                    rent_id=rent.pk,
+                    book_id=rent.book_id,
+                    user_id=rent.user_id,
+                    day=day,
+                )
+                for rent in rents
+            )
+            cache.bump(*{cache.user_rents(e.user_id) for e in events})
+            return events
+
+        def record_deactivated(self, books=(), users=()) -> list:
+            """
+            Logs deactivation of books and users with given ids today.
+            """
+            today = datetime.date.today()
+            return self.bulk_create(
+                [
+                    RentEvent(kind=RentEvent.Kind.DEACTIVATED, book_id=id, day=today)
+                    for id in books
+                ]
+                + [
+                    RentEvent(kind=RentEvent.Kind.DEACTIVATED, user_id=id, day=today)
+                    for id in users
+                ]
+            )
+
+    objects = RentEventQuerySet().as_manager()
+
+    def __str__(self) -> str:
+        return f"#{self.id} {self.kind} rent:{self.rent_id}"
+
+
+class EventConsumer(models.Model):
+    """
+    Offset of the last rent event handled by a named consumer.
+    """
+
+    name = models.CharField(max_length=100, unique=True)
+    offset = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.name} at #{self.offset}"
+
+
+class RentRollup(models.Model):
+    """
+    Daily rents statistics materialized from Rent by rollups.refresh(): for the
+    whole library (book and user empty), for one book or for one user.
+    """
+
+    day = models.DateField()
+    # FK indexes are replaced by (book|user, day) unique constraints
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        db_index=False,
+    )
+    user = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        db_index=False,
+    )
+    borrowed = models.PositiveIntegerField(default=0)
+    returned = models.PositiveIntegerField(default=0)
+    # summed length of loans returned that day
+    loan_days = models.PositiveIntegerField(default=0)
+    # ongoing rents at the end of the day, kept for library totals only
+    opened = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day"],
+                condition=models.Q(book__isnull=True, user__isnull=True),
+                name="unique_rollup_day",
+            ),
+            models.UniqueConstraint(
+                fields=["book", "day"],
+                condition=models.Q(book__isnull=False),
+                name="unique_rollup_book_day",
+            ),
+            models.UniqueConstraint(
+                fields=["user", "day"],
+                condition=models.Q(user__isnull=False),
+                name="unique_rollup_user_day",
+            ),
+        ]
+        # refresh replaces all rollups of a days range
+        indexes = [models.Index(fields=["day"], name="rollup_day_idx")]
+
+    class RentRollupQuerySet(models.QuerySet):
+        """
+        Class for RentRollup class connected custom queryset methods.
+        """
+
+        def totals(self):
+            """
+            Returns rollups of the whole library.
+            """
+            return self.filter(book__isnull=True, user__isnull=True)
+            # tested
+
+        def for_book(self, book_id: int):
+            """
+            Returns rollups of book with given id.
+            """
+            return self.filter(book=book_id)
+            # tested
+
+        def for_user(self, user_id: int):
+            """
+            Returns rollups of user with given id.
+            """
+            return self.filter(user=user_id)
+            # tested
+
+        def between(self, start: datetime.date = None, end: datetime.date = None):
+            """
+            Returns rollups of days from start to end, both included when given.
+            """
+            queryset = self
+            if start is not None:
+                queryset = queryset.filter(day__gte=start)
+            if end is not None:
+                queryset = queryset.filter(day__lte=end)
+            return queryset
+            # tested
+
+        def by_month(self):
+            """
+            Returns borrowed, returned and loan_days sums per month.
+            """
+            return (
+                self.order_by()
+                .values(month=TruncMonth("day"))
+                .annotate(
+                    borrowed=models.Sum("borrowed"),
+                    returned=models.Sum("returned"),
+                    loan_days=models.Sum("loan_days"),
+                )
+                .order_by("month")
+            )
+            # tested
+
+        def opened_at_month_end(self) -> dict:
+            """
+            Returns ongoing rents at the last rolled up day of each month of library totals.
+            """
+            totals = self.totals()
+            last_days = (
+                totals.order_by()
+                .values(month=TruncMonth("day"))
+                .annotate(last_day=models.Max("day"))
+                .values("last_day")
+            )
+            return {
+                day.replace(day=1): opened
+                for day, opened in totals.filter(day__in=last_days).values_list(
+                    "day", "opened"
+                )
+            }
+            # tested
+
+        def average_loan_days(self):
+            """
+            Returns average length in days of loans returned in rollups, None without returns.
+            """
+            result = self.aggregate(
+                loan_days=models.Sum("loan_days"), returned=models.Sum("returned")
+            )
+            if not result["returned"]:
+                return None
+            return result["loan_days"] / result["returned"]
+            # tested
+
+    objects = RentRollupQuerySet().as_manager()
+
+    def __str__(self) -> str:
+        return f"Rollup of {self.day} book:{self.book_id} user:{self.user_id}"
@@ -0,0 +1,95 @@
+"""
+Pluggable outbox for notifications to library users.
+
+Notifications are sent in batches through the backend configured in
+LIBRARY_OUTBOX, a dict with BACKEND import path and OPTIONS passed to its
+constructor, like Django email backends. Local backends write JSON lines to
+the console or a file, the memory one keeps notifications in outbox for tests.
+"""
+
+import json
+import sys
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+DEFAULT_OUTBOX = {"BACKEND": "library.outbox.ConsoleBackend"}
+
+# notifications sent through MemoryBackend
+outbox = []
+
+
+@dataclass
+class Notification:
+    """
+    Message to a library user.
+    """
+
+    kind: str
+    recipient_id: int
+    subject: str
+    body: str
+    data: dict = field(default_factory=dict)
+
+
+class BaseBackend:
+    def __init__(self, **options):
+        self.options = options
+
+    def send(self, notifications: list):
+        """
+        Sends all given notifications, raises an exception if any failed.
+        """
+        raise NotImplementedError
+
+
+class ConsoleBackend(BaseBackend):
+    """
+    Writes notifications as JSON lines to stdout or given stream.
+    """
+
+    def __init__(self, stream=None, **options):
+        super().__init__(**options)
+        self.stream = stream
+
+    def send(self, notifications: list):
+        stream = self.stream or sys.stdout
+        # vars() instead of deep copying asdict(), notifications hold plain data
+        stream.writelines(
+            json.dumps(vars(notification), cls=DjangoJSONEncoder) + "\n"
+            for notification in notifications
+        )
+        stream.flush()
+
+
+class FileBackend(ConsoleBackend):
+    """
+    Appends notifications as JSON lines to file at given path.
+    """
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+
+    def send(self, notifications: list):
+        with open(self.path, "a", encoding="utf-8") as self.stream:
+            super().send(notifications)
+
+
+class MemoryBackend(BaseBackend):
+    """
+    Keeps notifications in module outbox list.
+    """
+
+    def send(self, notifications: list):
+        outbox.extend(notifications)
+
+
+def get_backend() -> BaseBackend:
+    """
+    Returns backend configured in LIBRARY_OUTBOX.
+    """
+    config = getattr(settings, "LIBRARY_OUTBOX", DEFAULT_OUTBOX)
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
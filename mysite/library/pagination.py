@@ -0,0 +1,272 @@
+"""
+Keyset (cursor) pagination for list views.
+
+Pages are fetched with a WHERE condition built from the last row of the
+previous page instead of OFFSET, so every page costs the same index range
+scan regardless of its depth. NULL values are treated as the smallest ones.
+"""
+
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.http import Http404
+from django.utils.functional import cached_property
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+COUNT_LIMIT = 10000
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class KeysetPage:
+    """
+    One page of objects with cursors pointing to the neighbouring pages.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.next_url = None
+        self.previous_url = None
+        self.first_url = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Paginates queryset, also union one, over given ordering of fields or
+    annotations (e.g. search_rank), the last ordering field has to be unique.
+    """
+
+    def __init__(self, queryset, ordering, per_page: int = PAGE_SIZE):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.keys = []
+        for name in ordering:
+            descending = name.startswith("-")
+            name = name.lstrip("-")
+            if name in queryset.query.annotations:
+                field = queryset.query.annotations[name].output_field
+            else:
+                field = queryset.model._meta.get_field(name)
+                name = field.attname
+            self.keys.append((name, field, descending))
+
+    def _order_by(self, reverse=False):
+        """
+        Help function returning ordering expressions, NULLs always go as smallest values.
+        """
+        expressions = []
+        for name, field, descending in self.keys:
+            expression = models.F(name)
+            if descending != reverse:
+                expression = expression.desc(nulls_last=True if field.null else None)
+            else:
+                expression = expression.asc(nulls_first=True if field.null else None)
+            expressions.append(expression)
+        return expressions
+
+    def _after(self, values, reverse=False):
+        """
+        Help function returning condition for rows placed after given key values.
+        """
+        condition = models.Q(pk__in=[])
+        equal = models.Q()
+        for (name, field, descending), value in zip(self.keys, values):
+            if descending == reverse:
+                if value is None:
+                    after = models.Q(**{f"{name}__isnull": False})
+                else:
+                    after = models.Q(**{f"{name}__gt": value})
+            elif value is None:
+                after = models.Q(pk__in=[])
+            else:
+                after = models.Q(**{f"{name}__lt": value})
+                if field.null:
+                    after |= models.Q(**{f"{name}__isnull": True})
+            condition |= equal & after
+            if value is None:
+                equal &= models.Q(**{f"{name}__isnull": True})
+            else:
+                equal &= models.Q(**{name: value})
+        name, field, descending = self.keys[0]
+        # redundant bound on the leading key lets the database seek the index
+        if values[0] is not None and not (field.null and descending != reverse):
+            lookup = "gte" if descending == reverse else "lte"
+            condition &= models.Q(**{f"{name}__{lookup}": values[0]})
+        return condition
+
+    def encode_cursor(self, obj) -> str:
+        values = [getattr(obj, name) for name, _, _ in self.keys]
+        data = json.dumps(values, cls=DjangoJSONEncoder, separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor: str) -> list:
+        try:
+            data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            values = json.loads(data)
+            if not isinstance(values, list) or len(values) != len(self.keys):
+                raise ValueError
+            return [
+                None if value is None else field.to_python(value)
+                for (_, field, _), value in zip(self.keys, values)
+            ]
+        except (ValueError, TypeError, binascii.Error, ValidationError):
+            raise InvalidCursor("Invalid cursor.")
+
+    def _filter(self, queryset, condition):
+        """
+        Help function filtering queryset by condition, union queryset (e.g.
+        rents with archived ones) can't be filtered, so every queryset of the
+        union is.
+        """
+        if not queryset.query.combinator:
+            return queryset.filter(condition)
+        queryset = queryset.all()
+        queries = []
+        for query in queryset.query.combined_queries:
+            query = query.chain()
+            query.add_q(condition)
+            queries.append(query)
+        queryset.query.combined_queries = tuple(queries)
+        return queryset
+
+    def _page_queryset(self, after, before):
+        reverse = before is not None
+        queryset = self.queryset.order_by(*self._order_by(reverse))
+        cursor = before if reverse else after
+        if cursor is not None:
+            queryset = self._filter(
+                queryset, self._after(self.decode_cursor(cursor), reverse)
+            )
+        return queryset[: self.per_page + 1], cursor, reverse
+
+    def page(self, after=None, before=None) -> KeysetPage:
+        """
+        Returns page following cursor given in after, or preceding the one in before.
+        """
+        queryset, cursor, reverse = self._page_queryset(after, before)
+        return self._build_page(list(queryset), cursor, reverse)
+
+    async def apage(self, after=None, before=None) -> KeysetPage:
+        """
+        Async version of page().
+        """
+        queryset, cursor, reverse = self._page_queryset(after, before)
+        return self._build_page([obj async for obj in queryset], cursor, reverse)
+
+    def _build_page(self, object_list, cursor, reverse) -> KeysetPage:
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[: self.per_page]
+        if reverse:
+            object_list.reverse()
+        page = KeysetPage(object_list)
+        has_next = cursor is not None if reverse else has_more
+        has_previous = has_more if reverse else cursor is not None
+        if object_list and has_next:
+            page.next_cursor = self.encode_cursor(object_list[-1])
+        if object_list and has_previous:
+            page.previous_cursor = self.encode_cursor(object_list[0])
+        return page
+
+
+def get_per_page(request) -> int:
+    """
+    Returns page size requested in GET parameters, clamped to allowed limits.
+    """
+    default = getattr(settings, "LIBRARY_PAGE_SIZE", PAGE_SIZE)
+    try:
+        per_page = int(request.GET.get("per_page", default))
+    except ValueError:
+        per_page = default
+    max_page_size = getattr(settings, "LIBRARY_MAX_PAGE_SIZE", MAX_PAGE_SIZE)
+    return min(max(per_page, 1), max_page_size)
+
+
+def paginate(request, queryset, ordering) -> KeysetPage:
+    """
+    Returns page of queryset selected by after/before GET parameters, with urls for templates.
+    """
+    paginator = KeysetPaginator(queryset, ordering, get_per_page(request))
+    try:
+        page = paginator.page(
+            after=request.GET.get("after"), before=request.GET.get("before")
+        )
+    except InvalidCursor:
+        raise Http404("Invalid page cursor.")
+    return _add_urls(request, page)
+
+
+async def apaginate(request, queryset, ordering) -> KeysetPage:
+    """
+    Async version of paginate().
+    """
+    paginator = KeysetPaginator(queryset, ordering, get_per_page(request))
+    try:
+        page = await paginator.apage(
+            after=request.GET.get("after"), before=request.GET.get("before")
+        )
+    except InvalidCursor:
+        raise Http404("Invalid page cursor.")
+    return _add_urls(request, page)
+
+
+def _add_urls(request, page) -> KeysetPage:
+    query = request.GET.copy()
+    query.pop("after", None)
+    query.pop("before", None)
+    page.first_url = f"{request.path}?{query.urlencode()}"
+    if page.has_next():
+        query["after"] = page.next_cursor
+        page.next_url = f"{request.path}?{query.urlencode()}"
+        query.pop("after")
+    if page.has_previous():
+        query["before"] = page.previous_cursor
+        page.previous_url = f"{request.path}?{query.urlencode()}"
+    return page
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Offset paginator for admin changelists that never counts more than
+    LIBRARY_ADMIN_COUNT_LIMIT rows. Larger unfiltered tables are estimated
+    by their highest primary key, larger filtered results are capped.
+    """
+
+    @cached_property
+    def count(self) -> int:
+        limit = getattr(settings, "LIBRARY_ADMIN_COUNT_LIMIT", COUNT_LIMIT)
+        queryset = self.object_list
+        count = queryset.order_by()[: limit + 1].count()
+        if count <= limit:
+            return count
+        if not queryset.query.where:
+            estimate = queryset.model._default_manager.aggregate(
+                estimate=models.Max("pk")
+            )["estimate"]
+            return max(estimate or 0, limit)
+        return limit
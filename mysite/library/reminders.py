@@ -0,0 +1,81 @@
+"""
+Overdue rents reminders.
+
+send_overdue_reminders() walks open rents due before given day through
+rent_open_due_idx in (due_date, id) order, in chunks. Each chunk is marked
+with reminder_date and sent to the outbox in one transaction, so a failed
+send leaves the chunk for the next run and rents already reminded are never
+sent again. A crash between sending and commit can repeat one chunk.
+"""
+
+import datetime
+
+from django.db import models, transaction
+
+from . import outbox
+from .models import Rent
+
+BATCH_SIZE = 1000
+FIELDS = [
+    "id",
+    "due_date",
+    "user_id",
+    "user__name",
+    "user__surname",
+    "book_id",
+    "book__title",
+]
+
+
+def reminder(rent: dict, as_of: datetime.date) -> outbox.Notification:
+    """
+    Returns reminder notification of rent given as dict of FIELDS.
+    """
+    days = (as_of - rent["due_date"]).days
+    return outbox.Notification(
+        kind="overdue",
+        recipient_id=rent["user_id"],
+        subject=f"Overdue book: {rent['book__title']}",
+        body=(
+            f"Dear {rent['user__name']} {rent['user__surname']}, please return "
+            f"{rent['book__title']}, it was due on {rent['due_date']} "
+            f"({days} days ago)."
+        ),
+        data={
+            "rent_id": rent["id"],
+            "book_id": rent["book_id"],
+            "due_date": rent["due_date"],
+        },
+    )
+
+
+def send_overdue_reminders(
+    as_of: datetime.date = None, batch_size: int = BATCH_SIZE, backend=None
+) -> int:
+    """
+    Sends reminders of rents overdue at given day (default today) which were
+    not reminded yet, returns number of sent reminders.
+    """
+    as_of = as_of or datetime.date.today()
+    backend = backend or outbox.get_backend()
+    rents = Rent.objects.overdue(as_of).filter(reminder_date__isnull=True)
+    sent = 0
+    last = None
+    while True:
+        chunk = rents
+        if last is not None:
+            # due_date__gte bounds the index range, OR alone would scan it all
+            chunk = rents.filter(
+                models.Q(due_date__gt=last["due_date"]) | models.Q(id__gt=last["id"]),
+                due_date__gte=last["due_date"],
+            )
+        with transaction.atomic():
+            batch = list(chunk.order_by("due_date", "id").values(*FIELDS)[:batch_size])
+            if not batch:
+                return sent
+            Rent.objects.filter(id__in=[rent["id"] for rent in batch]).update(
+                reminder_date=as_of
+            )
+            backend.send([reminder(rent, as_of) for rent in batch])
+        sent += len(batch)
+        last = batch[-1]
@@ -0,0 +1,126 @@
+"""
+Incremental refresh of RentRollup daily statistics from rents.
+
+Rollups of a day change only when rents are borrowed or returned that day,
+so refresh() recomputes days from the high-water mark (the latest rolled up
+day, which could be rolled up before it ended) to today, reading rents of
+those days only through borrow_date and return_date indexes. Rents changed
+before the mark (backdated or deleted) need refresh with explicit since day.
+Archived rents are counted too, so archiving does not change rollups.
+"""
+
+import datetime
+from itertools import product
+
+from django.conf import settings
+from django.db import models, transaction
+
+from .models import ArchivedRent, Rent, RentRollup
+
+DIMENSIONS = ("book", "user")
+RENT_MODELS = (Rent, ArchivedRent)
+WINDOW_DAYS = 31
+
+
+def high_water_mark():
+    """
+    Returns the latest rolled up day, None before the first refresh.
+    """
+    return RentRollup.objects.totals().aggregate(day=models.Max("day"))["day"]
+
+
+def first_day():
+    """
+    Returns the first borrow day, None without rents.
+    """
+    days = [
+        model.objects.aggregate(day=models.Min("borrow_date"))["day"]
+        for model in RENT_MODELS
+    ]
+    return min((e for e in days if e is not None), default=None)
+
+
+def opened_at_end(day: datetime.date) -> int:
+    """
+    Returns number of rents ongoing at the end of given day.
+    """
+    return sum(
+        model.objects.filter(borrow_date__lte=day).count()
+        - model.objects.filter(return_date__lte=day).count()
+        for model in RENT_MODELS
+    )
+
+
+def refresh(since=None, until=None, dimensions=None) -> int:
+    """
+    Recomputes rollups of days from since (default high-water mark or the first
+    rent day) to until (default today) in monthly transactions, returns number of days.
+    """
+    until = until or datetime.date.today()
+    if since is None:
+        since = high_water_mark() or first_day()
+    if since is None or since > until:
+        return 0
+    if dimensions is None:
+        dimensions = getattr(settings, "LIBRARY_ROLLUP_DIMENSIONS", DIMENSIONS)
+    previous = since - datetime.timedelta(1)
+    opened = (
+        RentRollup.objects.totals()
+        .filter(day=previous)
+        .values_list("opened", flat=True)
+        .first()
+    )
+    if opened is None:
+        opened = opened_at_end(previous)
+    day = since
+    while day <= until:
+        end = min(day + datetime.timedelta(WINDOW_DAYS - 1), until)
+        with transaction.atomic():
+            opened = _refresh_window(day, end, opened, dimensions)
+        day = end + datetime.timedelta(1)
+    return (until - since).days + 1
+
+
+def _refresh_window(start, end, opened: int, dimensions) -> int:
+    """
+    Help function replacing rollups of days from start to end, returns rents
+    ongoing at the end of the window.
+    """
+    rows = {}
+
+    def row(day, book=None, user=None):
+        key = (day, book, user)
+        if key not in rows:
+            rows[key] = RentRollup(day=day, book_id=book, user_id=user)
+        return rows[key]
+
+    days = [start + datetime.timedelta(i) for i in range((end - start).days + 1)]
+    for day in days:
+        row(day)
+    for model, group in product(RENT_MODELS, [(), *((e,) for e in dimensions)]):
+        borrowed = model.objects.filter(borrow_date__range=(start, end))
+        returned = model.objects.filter(return_date__range=(start, end))
+        for *key, number in (
+            borrowed.values("borrow_date", *group)
+            .annotate(number=models.Count("id"))
+            .values_list("borrow_date", *group, "number")
+        ):
+            row(key[0], **dict(zip(group, key[1:]))).borrowed += number
+        for *key, number, loan in (
+            returned.values("return_date", *group)
+            .annotate(
+                number=models.Count("id"),
+                loan=models.Sum(models.F("return_date") - models.F("borrow_date")),
+            )
+            .values_list("return_date", *group, "number", "loan")
+        ):
+            rollup = row(key[0], **dict(zip(group, key[1:])))
+            rollup.returned += number
+            rollup.loan_days += loan.days
+    for day in days:
+        rollup = rows[day, None, None]
+        opened += rollup.borrowed - rollup.returned
+        rollup.opened = opened
+    RentRollup.objects.between(start, end).delete()
+    RentRollup.objects.bulk_create(rows.values(), batch_size=1000)
+    return opened
@@ -0,0 +1,123 @@
+"""
+Routing of library reads to read replicas.
+
+ReplicaMiddleware (see middleware.py) picks a replica for every safe request
+(GET, HEAD, OPTIONS) of a client without the primary cookie and stores it in
+RoutingState of the request. PrimaryReplicaRouter sends reads of library
+models to that replica until the first write of the request, which pins the
+rest of the request to the primary, and the middleware then sets the cookie
+pinning the client's following requests to the primary for
+LIBRARY_REPLICA_PIN_SECONDS, longer than the expected replication lag, so
+clients see their own writes. Other apps (auth, sessions, admin log) always
+use the primary, as do management commands and code run outside requests.
+Reads inside transactions opened during the request go to the primary too,
+as they usually decide the writes that follow (e.g. ids of deactivated
+rows), and views with side effects served on GET are marked with
+@primary, which pins their requests before the first read.
+
+Pages cached while a replica lags behind a write can be stale until the next
+write of their scope or LIBRARY_CACHE_TIMEOUT.
+"""
+
+import random
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.db.transaction import TransactionManagementError
+
+PRIMARY = "default"
+PIN_COOKIE = "library_primary"
+PIN_SECONDS = 5
+
+
+@dataclass
+class RoutingState:
+    """
+    Database routing of one request: its replica and whether it wrote already.
+    """
+
+    replica: str = None
+    pinned: bool = False
+    # depth of primary transactions when the request started
+    atomic_depth: int = 0
+
+
+current = ContextVar("library_routing_state", default=None)
+
+
+def replicas() -> list:
+    """
+    Returns aliases of configured read replicas.
+    """
+    return getattr(settings, "LIBRARY_REPLICAS", [])
+
+
+def choose_replica():
+    """
+    Returns random replica alias, None without replicas.
+    """
+    aliases = replicas()
+    return random.choice(aliases) if aliases else None
+
+
+def primary(view):
+    """
+    Decorator pinning requests of view with side effects to the primary.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = current.get()
+        if state is not None:
+            state.pinned = True
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads of library models to the replica of the current request and
+    all writes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = current.get()
+        if (
+            state is None
+            or state.replica is None
+            or state.pinned
+            or model._meta.app_label != "library"
+            or len(connections[PRIMARY].atomic_blocks) > state.atomic_depth
+        ):
+            return PRIMARY
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = current.get()
+        if state is not None:
+            state.pinned = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold copies of the primary data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get schema from the primary with its data
+        return False if db in replicas() else None
+
+
+def copy_sqlite(source, target):
+    """
+    Copies SQLite database of source connection over database of target one.
+    Source can not be in a transaction, the backup would wait for its end.
+    """
+    if source.in_atomic_block:
+        raise TransactionManagementError("Can not copy database in transaction.")
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection)
@@ -0,0 +1,125 @@
+"""
+Full-text search over book titles and person names.
+
+On SQLite the search is backed by FTS5 external content tables mirroring
+library_book, library_title and library_person, kept in sync by triggers. Other
+databases fall back to icontains filters.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# keyset pagination ordering of searched querysets, best match first
+RANKED = ["search_rank", "id"]
+
+INDEXES = {
+    "library_book": ["title"],
+    "library_title": ["name"],
+    "library_person": ["name", "second_name", "surname"],
+}
+
+
+def fts_table(table: str) -> str:
+    return f"{table}_fts"
+
+
+def install(schema_connection=connection, rebuild=False):
+    """
+    Creates missing FTS5 tables and triggers, table remakes in migrations drop triggers.
+    """
+    if schema_connection.vendor != "sqlite":
+        return
+    existing = schema_connection.introspection.table_names()
+    with schema_connection.cursor() as cursor:
+        for table, columns in INDEXES.items():
+            # tables created by later migrations are indexed after them
+            if table not in existing:
+                continue
+            fts = fts_table(table)
+            names = ", ".join(columns)
+            new = ", ".join(f"new.{e}" for e in columns)
+            old = ", ".join(f"old.{e}" for e in columns)
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master "
+                "WHERE type = 'trigger' AND name LIKE %s",
+                [f"{fts}_%"],
+            )
+            missing = cursor.fetchone()[0] < 3
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, "
+                f"content='{table}', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} "
+                f"BEGIN INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} "
+                f"BEGIN INSERT INTO {fts}({fts}, rowid, {names}) "
+                f"VALUES ('delete', old.id, {old}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_update "
+                f"AFTER UPDATE OF {names} ON {table} "
+                f"BEGIN INSERT INTO {fts}({fts}, rowid, {names}) "
+                f"VALUES ('delete', old.id, {old}); "
+                f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END"
+            )
+            if missing or rebuild:
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def uninstall(schema_connection=connection):
+    if schema_connection.vendor != "sqlite":
+        return
+    with schema_connection.cursor() as cursor:
+        for table in INDEXES:
+            fts = fts_table(table)
+            for trigger in ("insert", "delete", "update"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {fts}_{trigger}")
+            cursor.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+def match_expression(terms: str) -> str:
+    """
+    Returns FTS5 query matching all words of terms as prefixes.
+    """
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", terms))
+
+
+def search(queryset, terms: str):
+    """
+    Returns queryset rows matching terms, annotated with search_rank (lower is
+    better, the same for all rows without FTS5) and ordered by it.
+    """
+    words = re.findall(r"\w+", terms)
+    if not words:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    if connection.vendor != "sqlite":
+        condition = Q()
+        for word in words:
+            condition &= Q.create(
+                [(f"{e}__icontains", word) for e in INDEXES[table]],
+                connector=Q.OR,
+            )
+        return queryset.filter(condition).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+    fts = fts_table(table)
+    # joining the FTS table evaluates MATCH once, a correlated subquery
+    # would evaluate it again for every matching row; rank is an annotation,
+    # so keyset pagination can filter on it
+    return (
+        queryset.extra(
+            tables=[fts],
+            where=[f"{fts}.rowid = {table}.id", f"{fts} MATCH %s"],
+            params=[match_expression(terms)],
+        )
+        .annotate(search_rank=RawSQL(f"{fts}.rank", [], output_field=FloatField()))
+        .order_by("search_rank")
+    )
@@ -0,0 +1,75 @@
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import auth, cache, metrics
+from .models import ArchivedRent, Book, Person, Rent, Title
+
+
+@receiver([post_save, post_delete], sender=Book)
+def book_changed(sender, **kwargs):
+    cache.bump(cache.BOOKS)
+
+
+@receiver([post_save, post_delete], sender=Title)
+def title_changed(sender, **kwargs):
+    cache.bump(cache.BOOKS)
+
+
+@receiver([post_save, post_delete], sender=Person)
+def person_changed(sender, **kwargs):
+    cache.bump(cache.PERSONS)
+
+
+@receiver([post_save, post_delete], sender=Rent)
+def rent_changed(sender, instance, **kwargs):
+    # pages showing availability and rent counters depend on rents scope
+    cache.bump(cache.RENTS, cache.user_rents(instance.user_id))
+
+
+@receiver(post_delete, sender=Rent)
+@receiver(post_delete, sender=ArchivedRent)
+def rent_deleted(sender, instance, **kwargs):
+    instance.forget()
+    cache.bump(cache.user_rents(instance.user_id))
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def authors_changed(sender, action, **kwargs):
+    if action.startswith("post_"):
+        cache.bump(cache.BOOKS, cache.PERSONS)
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def copy_authors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # authors of a title are authors of its copies
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        titles = Title.objects.filter(
+            Q(authors=instance) | Q(copies__in=pk_set or [])
+        ).distinct()
+    else:
+        titles = Title.objects.filter(pk=instance.catalogue_title_id)
+    titles.sync_authors()
+
+
+@receiver(m2m_changed, sender=Title.authors.through)
+def title_authors_changed(sender, action, **kwargs):
+    if action.startswith("post_"):
+        cache.bump(cache.BOOKS, cache.PERSONS)
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def user_changed(sender, instance, **kwargs):
+    auth.forget_user(instance.pk)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # installed once per connection, so queries run in sync_to_async threads
+    # of async views are recorded too
+    if metrics.execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.execute)
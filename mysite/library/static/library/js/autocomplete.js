@@ -0,0 +1,92 @@
+// Loads choices of select[data-autocomplete-url] on demand from JSON endpoints
+// returning {"results": [{"id": ..., "text": ...}], "next": cursor}.
+(function () {
+  "use strict";
+
+  var PAGE_SIZE = 20;
+  var DELAY = 250;
+
+  function setup(select) {
+    if (select.dataset.autocompleteReady) {
+      return;
+    }
+    select.dataset.autocompleteReady = "1";
+    var url = select.dataset.autocompleteUrl;
+    var input = document.createElement("input");
+    input.type = "search";
+    input.className = "form-control";
+    input.placeholder = "Search...";
+    input.autocomplete = "off";
+    select.parentNode.insertBefore(input, select);
+    var more = document.createElement("button");
+    more.type = "button";
+    more.className = "btn btn-link btn-xs";
+    more.textContent = "More results";
+    more.style.display = "none";
+    select.parentNode.insertBefore(more, select.nextSibling);
+    if (select.multiple) {
+      select.size = Math.max(select.size, 8);
+    }
+    var next = null;
+    var timer = null;
+    var request = 0;
+
+    function clear() {
+      Array.prototype.slice.call(select.options).forEach(function (option) {
+        if (!option.selected && option.value !== "") {
+          select.removeChild(option);
+        }
+      });
+    }
+
+    function load(cursor) {
+      var current = ++request;
+      var query = "?per_page=" + PAGE_SIZE + "&q=" + encodeURIComponent(input.value);
+      if (cursor) {
+        query += "&after=" + encodeURIComponent(cursor);
+      }
+      fetch(url + query, {credentials: "same-origin"})
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          if (current !== request) {
+            return;
+          }
+          if (!cursor) {
+            clear();
+          }
+          data.results.forEach(function (result) {
+            var value = String(result.id);
+            var exists = Array.prototype.some.call(select.options, function (option) {
+              return option.value === value;
+            });
+            if (!exists) {
+              select.appendChild(new Option(result.text, value));
+            }
+          });
+          next = data.next;
+          more.style.display = next ? "" : "none";
+        });
+    }
+
+    input.addEventListener("input", function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () { load(null); }, DELAY);
+    });
+    input.addEventListener("focus", function () { load(null); }, {once: true});
+    more.addEventListener("click", function () {
+      if (next) {
+        load(next);
+      }
+    });
+  }
+
+  function init() {
+    document.querySelectorAll("select[data-autocomplete-url]").forEach(setup);
+  }
+
+  if (document.readyState === "loading") {
+    document.addEventListener("DOMContentLoaded", init);
+  } else {
+    init();
+  }
+})();
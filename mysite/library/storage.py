@@ -0,0 +1,170 @@
+"""
+Static files storage writing precompressed and resized copies of collected files.
+
+collectstatic with PrecompressedManifestStaticFilesStorage stores files
+under content hashed names (as ManifestStaticFilesStorage does), so they
+can be cached by clients forever, and then writes next to every hashed
+text file its gzip (.gz) and brotli (.br) copy, kept only when smaller.
+JPEG and PNG images get copies resized with Pillow to IMAGE_WIDTHS in
+their own format and WebP, named after the hashed image and listed in
+VARIANTS_NAME manifest for the responsive_image template tag.
+StaticFilesMiddleware (see middleware.py) serves these files.
+"""
+
+import gzip
+import io
+import json
+import mimetypes
+import os
+
+import brotli
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from PIL import Image
+
+COMPRESSED_EXTENSIONS = (
+    ".css", ".js", ".json", ".map", ".svg", ".txt", ".html", ".xml", ".ico",
+    ".eot", ".ttf", ".otf",
+)  # fmt: skip
+MIN_COMPRESSED_SIZE = 256
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+IMAGE_WIDTHS = (320, 640, 1280)
+IMAGE_QUALITY = 80
+VARIANTS_NAME = "staticfiles-variants.json"
+
+
+def compressed(data: bytes) -> dict:
+    """
+    Returns gzip and brotli copies of data smaller than data, keyed with their
+    file suffixes.
+    """
+    copies = {
+        ".gz": gzip.compress(data, compresslevel=9, mtime=0),
+        ".br": brotli.compress(data),
+    }
+    return {suffix: e for suffix, e in copies.items() if len(e) < len(data)}
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage adding precompressed copies of text files and resized
+    WebP copies of images after collectstatic post processing.
+    """
+
+    # pages render before the first collectstatic too, e.g. in tests
+    manifest_strict = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._variants = None
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # not collected yet, served under plain name and revalidated
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        variants = {}
+        for name in sorted(paths):
+            hashed_name = self.hashed_files.get(self.hash_key(self.clean_name(name)))
+            if hashed_name is None:
+                continue
+            extension = os.path.splitext(name)[1].lower()
+            if extension in COMPRESSED_EXTENSIONS:
+                for suffix in self.compress(hashed_name):
+                    yield name, hashed_name + suffix, True
+            elif extension in IMAGE_EXTENSIONS:
+                variants[name] = self.resize(hashed_name)
+                for variant in variants[name]:
+                    yield name, variant["name"], True
+        self.save_variants(variants)
+
+    def _replace(self, name: str, data: bytes):
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(data))
+
+    def compress(self, name: str) -> list:
+        """
+        Writes compressed copies of stored file, returns their suffixes.
+        """
+        with self.open(name) as file:
+            data = file.read()
+        if len(data) < MIN_COMPRESSED_SIZE:
+            return []
+        copies = compressed(data)
+        for suffix, content in copies.items():
+            self._replace(name + suffix, content)
+        return list(copies)
+
+    def resize(self, name: str) -> list:
+        """
+        Writes resized and WebP copies of stored image, returns name, width and
+        content type of the copies and the image itself, narrowest first.
+        """
+        with self.open(name) as file:
+            image = Image.open(file)
+            image.load()
+        root, extension = os.path.splitext(name)
+        widths = [e for e in IMAGE_WIDTHS if e < image.width] + [image.width]
+        variants = []
+        for width in widths:
+            resized = image
+            if width != image.width:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+            for image_format, suffix in [("WEBP", ".webp"), (image.format, extension)]:
+                if suffix == extension and width == image.width:
+                    # the original itself
+                    variant = name
+                else:
+                    buffer = io.BytesIO()
+                    resized.save(buffer, image_format, quality=IMAGE_QUALITY)
+                    variant = f"{root}.{width}w{suffix}"
+                    self._replace(variant, buffer.getvalue())
+                variants.append(
+                    {
+                        "name": variant,
+                        "width": width,
+                        "type": mimetypes.guess_type(variant)[0],
+                    }
+                )
+        return variants
+
+    def save_variants(self, variants: dict):
+        contents = json.dumps({"variants": variants}).encode()
+        if self.manifest_storage.exists(VARIANTS_NAME):
+            self.manifest_storage.delete(VARIANTS_NAME)
+        self.manifest_storage._save(VARIANTS_NAME, ContentFile(contents))
+        self._set_variants(variants)
+
+    def _set_variants(self, variants: dict):
+        self._variants = variants
+        # variants are named after hashed images already, url() keeps them
+        for image_variants in variants.values():
+            for variant in image_variants:
+                self.hashed_files[self.hash_key(variant["name"])] = variant["name"]
+
+    def variants(self, name: str) -> list:
+        """
+        Returns stored variants of collected image, empty list if there are none.
+        """
+        if self._variants is None:
+            variants = {}
+            if self.manifest_storage.exists(VARIANTS_NAME):
+                with self.manifest_storage.open(VARIANTS_NAME) as file:
+                    variants = json.loads(file.read())["variants"]
+            self._set_variants(variants)
+        return self._variants.get(self.clean_name(name), [])
+
+    def immutable_names(self) -> set:
+        """
+        Returns names of collected files named after their content.
+        """
+        self.variants("")
+        return set(self.hashed_files.values())
@@ -0,0 +1,46 @@
+from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(path: str, alt: str = "", sizes: str = None):
+    """
+    Returns picture element offering WebP and resized variants of static image
+    written by collectstatic (see library/storage.py), plain img without them.
+    Images keep their own width unless sizes are given.
+    """
+    variants = []
+    if hasattr(staticfiles_storage, "variants"):
+        variants = staticfiles_storage.variants(path)
+    img = format_html('<img src="{}" alt="{}">', static(path), alt)
+    if not variants:
+        return img
+    sizes = sizes or f"{max(e['width'] for e in variants)}px"
+    sources = {}
+    for variant in variants:
+        sources.setdefault(variant["type"], []).append(
+            (staticfiles_storage.url(variant["name"]), variant["width"])
+        )
+    # the browser takes the first source of type it supports
+    return format_html(
+        "<picture>{}{}</picture>",
+        format_html_join(
+            "",
+            '<source type="{}" srcset="{}" sizes="{}">',
+            (
+                (
+                    content_type,
+                    ", ".join(f"{url} {width}w" for url, width in urls),
+                    sizes,
+                )
+                for content_type, urls in sorted(
+                    sources.items(), key=lambda e: e[0] != "image/webp"
+                )
+            ),
+        ),
+        img,
+    )
@@ -1,9 +1,70 @@
+import csv
 import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+import unittest.mock
+from concurrent.futures import ThreadPoolExecutor
 
-from django.db import models
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.db import connection, connections, models, transaction
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-from .models import Book, IsActive, Person, Rent
+from . import (
+    archive,
+    auth,
+    benchmarks,
+    events,
+    metrics,
+    outbox,
+    reminders,
+    rollups,
+    routers,
+    storage,
+    views,
+)
+from .cache import get_cache, stats
+from .circulation import (
+    bulk_checkout,
+    bulk_return,
+    checkout,
+    reserve,
+    return_rent,
+)
+from .exports import EXPORT_FIELDS
+from .management.commands import generate_library
+from .middleware import ReplicaMiddleware
+from .models import (
+    ArchivedRent,
+    Book,
+    IsActive,
+    Person,
+    Rent,
+    RentEvent,
+    RentRollup,
+    Reservation,
+    Title,
+    loan_period,
+)
+from .pagination import EstimatedCountPaginator, KeysetPaginator
 
 # Create your tests here.
 
@@ -155,6 +216,7 @@ class SetUpTestData(TestCase):
             e.save()
             e = Rent.objects.get(id=licznik)
             e.borrow_date = borrow_dates[licznik - 1]
+            e.due_date = e.borrow_date + datetime.timedelta(30)
             if licznik <= len(return_dates):
                 e.return_date = return_dates[licznik - 1]
             e.save()
@@ -170,6 +232,10 @@ class SetUpTestData(TestCase):
             i for i in range(1, 9) if i not in cls.users_with_any_rents
         ]
 
+    def setUp(self):
+        # cached pages of other test classes may share generations with this one
+        get_cache().clear()
+
     class Meta:
         abstract = True
 
@@ -320,6 +386,95 @@ class PersonClassTests(SetUpTestData):
             ordered=False,
         )
 
+    def test_qs_annotate_opened_rents_number_yield_appropriate_values(self):
+        """
+        .annotate_opened_rents_number() should count only ongoing rents
+        given data: all persons
+        """
+        for e in Person.objects.annotate_opened_rents_number():
+            with self.subTest():
+                self.assertEqual(
+                    e.rents_count,
+                    int(e.id in self.db_ids["users_with_open_rents"]),
+                )
+
+    def test_qs_annotate_closed_rents_number_yield_appropriate_values(self):
+        """
+        .annotate_closed_rents_number() should count only finished rents
+        given data: all persons
+        """
+        for e in Person.objects.annotate_closed_rents_number():
+            with self.subTest():
+                self.assertEqual(
+                    e.rents_count,
+                    self.db_ids["rents_number"][e.id - 1]
+                    - int(e.id in self.db_ids["users_with_open_rents"]),
+                )
+
+    def test_stored_rents_numbers_yield_appropriate_values(self):
+        """
+        opened_rents_number and rents_number should be kept by rent saves
+        given data: all persons
+        """
+        for e in Person.objects.all():
+            with self.subTest():
+                self.assertEqual(e.rents_number, self.db_ids["rents_number"][e.id - 1])
+                self.assertEqual(
+                    e.opened_rents_number,
+                    int(e.id in self.db_ids["users_with_open_rents"]),
+                )
+
+    def test_stored_rents_numbers_after_rent_delete(self):
+        """
+        Rent.delete() should decrease stored rents counters
+        given data: ongoing rent of user with db_id = 3
+        """
+        Rent.objects.get(id=4).delete()
+        person = Person.objects.get(id=3)
+        self.assertEqual((person.opened_rents_number, person.rents_number), (0, 1))
+
+    def test_stored_rents_numbers_after_book_delete(self):
+        """
+        deleting a book should recount stored rents counters of its borrowers,
+        also for rents deleted by cascade and archived ones
+        given data: book with db_id = 1, rent 1 archived, rent 4 ongoing
+        """
+        archive.archive_rents(datetime.date(2023, 12, 1))
+        Book.objects.get(id=1).delete()
+        with self.subTest():
+            self.assertEqual(
+                Person.objects.values_list("opened_rents_number", "rents_number").get(
+                    id=3
+                ),
+                (0, 1),
+            )
+        self.assertFalse(Person.objects.rents_numbers_mismatched().exists())
+
+    def test_qs_rents_numbers_mismatched_and_sync_rents_numbers(self):
+        """
+        .rents_numbers_mismatched() should find stale persons, .sync_rents_numbers() should fix them
+        given data: all persons with counters broken by plain update
+        """
+        Person.objects.update(opened_rents_number=0, rents_number=0)
+        with self.subTest():
+            self.assertQuerySetEqual(
+                Person.objects.rents_numbers_mismatched(),
+                Person.objects.filter(id__in=self.users_with_any_rents),
+                ordered=False,
+            )
+        Person.objects.rents_numbers_mismatched().sync_rents_numbers()
+        self.assertEqual(Person.objects.rents_numbers_mismatched().count(), 0)
+
+    def test_qs_deactivate(self):
+        """
+        .deactivate() should mark persons as inactive and log it in one
+        savepoint (ids, events and update queries)
+        given data: active users with db_id = 1, 2
+        """
+        with self.assertNumQueries(5):
+            self.assertEqual(Person.objects.filter(id__in=[1, 2]).deactivate(), 2)
+        self.assertEqual(Person.objects.active().count(), 4)
+
 
 class BookClassTests(SetUpTestData):
 
@@ -408,6 +563,88 @@ class BookClassTests(SetUpTestData):
             with self.subTest():
                 self.assertEqual(e.is_available, condition)
 
+    def test_rent_save_marks_book_borrowed_and_returned(self):
+        """
+        Rent.save() should flip is_borrowed of its book on rent start and return
+        given data: available book
+        """
+        book = Book.objects.get(id=3)
+        rent = Rent(book=book, user=Person.objects.get(id=1))
+        rent.save()
+        with self.subTest():
+            self.assertTrue(Book.objects.get(id=3).is_borrowed)
+        rent = Rent.objects.get(id=rent.id)
+        rent.return_date = datetime.date.today()
+        rent.save()
+        self.assertFalse(Book.objects.get(id=3).is_borrowed)
+
+    def test_rent_save_of_closed_rent_keeps_book_borrowed(self):
+        """
+        Rent.save() of closed rent should not touch is_borrowed of its book
+        given data: closed rent of actively borrowed book
+        """
+        Rent.objects.get(id=1).save()
+        self.assertTrue(Book.objects.get(id=1).is_borrowed)
+
+    def test_rent_save_moves_ongoing_rent(self):
+        """
+        Rent.save() of ongoing rent moved to another book and user should move
+        is_borrowed flag and rents counters with it
+        given data: ongoing rent of book with db_id = 1 by user with db_id = 3
+        """
+        rent = Rent.objects.get(id=4)
+        rent.book_id, rent.user_id = 3, 1
+        rent.save()
+        with self.subTest():
+            self.assertEqual(
+                list(
+                    Book.objects.borrowed().order_by("id").values_list("id", flat=True)
+                ),
+                [2, 3],
+            )
+        with self.subTest():
+            self.assertFalse(Book.objects.availability_mismatched().exists())
+        self.assertFalse(Person.objects.rents_numbers_mismatched().exists())
+
+    def test_rent_delete_marks_book_available(self):
+        """
+        Rent.delete() of ongoing rent should put the book back on shelf
+        given data: ongoing rent
+        """
+        Rent.objects.get(id=4).delete()
+        self.assertFalse(Book.objects.get(id=1).is_borrowed)
+
+    def test_qs_availability_mismatched_and_sync_availability(self):
+        """
+        .availability_mismatched() should find stale books, .sync_availability() should fix them
+        given data: all books with flags broken by plain update
+        """
+        Book.objects.update(is_borrowed=False)
+        with self.subTest():
+            self.assertQuerySetEqual(
+                Book.objects.availability_mismatched(),
+                Book.objects.filter(id__in=self.db_ids["borrowed_books"]),
+                ordered=False,
+            )
+        Book.objects.sync_availability()
+        self.assertEqual(Book.objects.availability_mismatched().count(), 0)
+
+    def test_rebuild_circulation_command(self):
+        """
+        rebuild_circulation should fail in --check mode and fix stale flags otherwise
+        given data: all books with flags broken by plain update
+        """
+        Book.objects.update(is_borrowed=True)
+        with self.subTest():
+            with self.assertRaises(CommandError):
+                call_command("rebuild_circulation", check=True, stdout=io.StringIO())
+        call_command("rebuild_circulation", stdout=io.StringIO())
+        self.assertQuerySetEqual(
+            Book.objects.borrowed(),
+            Book.objects.filter(id__in=self.db_ids["borrowed_books"]),
+            ordered=False,
+        )
+
 
 class RentClassTests(SetUpTestData):
     """
@@ -594,3 +831,2307 @@ class RentClassTests(SetUpTestData):
         for e in Rent.objects.borrows_less_than(datetime.date(2024, 1, 18)):
             with self.subTest():
                 self.assertFalse(e.borrow_date >= datetime.date(2024, 1, 18))
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "EXPLAIN output is SQLite specific")
+class IndexUsageTests(SetUpTestData):
+    """
+    Class checking with EXPLAIN that custom query set methods use indexes.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        with self.subTest(index=index_name):
+            self.assertIn(f"USING INDEX {index_name}", plan)
+        self.assertNotRegex(plan, rf"(?m)SCAN {queryset.model._meta.db_table}$")
+
+    def test_rent_book_return_idx(self):
+        """
+        .for_books() should search by (book, return_date) index
+        given data: ongoing and all rents of one book
+        """
+        self.assertUsesIndex(Rent.objects.for_books(1), "rent_book_return_idx")
+        self.assertUsesIndex(Rent.objects.for_books(1).opened(), "rent_book_return_idx")
+
+    def test_rent_user_return_idx(self):
+        """
+        .for_users() should search by (user, return_date) index
+        given data: ongoing and all rents of one user
+        """
+        self.assertUsesIndex(Rent.objects.for_users(3), "rent_user_return_idx")
+        self.assertUsesIndex(Rent.objects.for_users(3).opened(), "rent_user_return_idx")
+
+    def test_rent_return_date_idx(self):
+        """
+        .opened() should search by return_date index
+        given data: all rents
+        """
+        self.assertUsesIndex(Rent.objects.opened(), "rent_return_date_idx")
+
+    def test_rent_borrow_date_idx(self):
+        """
+        .borrows_greater_than() and .borrows_less_than() should search by borrow_date index
+        given data: all rents
+        """
+        date = datetime.date(2024, 1, 17)
+        self.assertUsesIndex(
+            Rent.objects.borrows_greater_than(date), "rent_borrow_date_idx"
+        )
+        self.assertUsesIndex(
+            Rent.objects.borrows_less_than(date), "rent_borrow_date_idx"
+        )
+
+    def test_rent_admin_ordering_uses_borrow_date_idx(self):
+        """
+        admin ordering of rents should read borrow_date index without sorting
+        given data: all rents
+        """
+        queryset = Rent.objects.order_by("-borrow_date", "-id")
+        self.assertUsesIndex(queryset, "rent_borrow_date_idx")
+        self.assertNotIn("TEMP B-TREE", queryset.explain())
+
+    def test_book_active_idx(self):
+        """
+        .active() should use partial index of active books
+        given data: all books
+        """
+        self.assertUsesIndex(Book.objects.active(), "book_active_idx")
+        self.assertUsesIndex(Book.objects.active().available(), "book_active_idx")
+        self.assertUsesIndex(Book.objects.active().status(), "book_active_idx")
+
+    def test_book_borrowed_idx(self):
+        """
+        .borrowed() should use partial index of borrowed books
+        given data: all books
+        """
+        self.assertUsesIndex(Book.objects.borrowed(), "book_borrowed_idx")
+
+    def test_person_active_idx(self):
+        """
+        .active() should use partial index of active persons
+        given data: all persons
+        """
+        self.assertUsesIndex(Person.objects.active(), "person_active_idx")
+        self.assertUsesIndex(
+            Person.objects.active().order_by("-opened_rents_number"),
+            "person_active_idx",
+        )
+
+    def test_person_inactive_idx(self):
+        """
+        .inactive() should use partial index of inactive persons
+        given data: all persons
+        """
+        self.assertUsesIndex(Person.objects.inactive(), "person_inactive_idx")
+
+
+class KeysetPaginationTests(SetUpTestData):
+    """
+    Class for keyset pagination of list views testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+        cls.staff = User.objects.create_user("librarian", password="secret")
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.staff)
+
+    def walk(self, paginator, direction="after"):
+        page = paginator.page()
+        pages = [list(page)]
+        if direction == "before":
+            while page.has_next():
+                page = paginator.page(after=page.next_cursor)
+            pages = [list(page)]
+            while page.has_previous():
+                page = paginator.page(before=page.previous_cursor)
+                pages.insert(0, list(page))
+        while direction == "after" and page.has_next():
+            page = paginator.page(after=page.next_cursor)
+            pages.append(list(page))
+        return pages
+
+    def test_pages_follow_ordering_with_nulls(self):
+        """
+        KeysetPaginator should walk all rows forwards and backwards in queryset order
+        given data: all rents ordered by nullable return_date
+        """
+        for ordering in (["return_date", "id"], ["-return_date", "-id"]):
+            paginator = KeysetPaginator(Rent.objects.all(), ordering, per_page=2)
+            expected = list(Rent.objects.order_by(*paginator._order_by()))
+            for direction in ("after", "before"):
+                with self.subTest(ordering=ordering, direction=direction):
+                    pages = self.walk(paginator, direction)
+                    self.assertEqual(sum(pages, []), expected)
+                    self.assertEqual([len(e) for e in pages], [2, 2, 1])
+
+    def test_invalid_cursor_yields_404(self):
+        """
+        list view should answer 404 for malformed cursor
+        given data: garbage and wrong length cursors
+        """
+        for cursor in ("garbage", "WzEsMl0"):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse("library:books"), {"after": cursor})
+                self.assertEqual(response.status_code, 404)
+
+    def test_list_views_are_paginated(self):
+        """
+        list views should render at most per_page rows with link to next page
+        given data: all books, users, authors and rents
+        """
+        for name in ("books", "users", "authors", "rents"):
+            with self.subTest(view=name):
+                response = self.client.get(reverse(f"library:{name}"), {"per_page": 1})
+                self.assertEqual(len(response.context["page"]), 1)
+                self.assertIsNotNone(response.context["page"].next_url)
+                response = self.client.get(response.context["page"].next_url)
+                self.assertEqual(response.status_code, 200)
+
+
+class BulkCirculationTests(SetUpTestData):
+    """
+    Class for batch checkout and return testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def assertCirculationConsistent(self):
+        self.assertEqual(Book.objects.availability_mismatched().count(), 0)
+        self.assertEqual(Person.objects.rents_numbers_mismatched().count(), 0)
+
+    def test_bulk_checkout_reports_conflicts(self):
+        """
+        bulk_checkout() should rent available books and report the rest
+        given data: available, borrowed, removed and not existing books
+        """
+        Book.objects.filter(id=4).update(is_active=False)
+        result = bulk_checkout(Person.objects.get(id=2), [3, 1, 4, 99, 3])
+        with self.subTest():
+            self.assertEqual([e.book_id for e in result.rents], [3])
+        with self.subTest():
+            self.assertEqual(
+                result.conflicts,
+                {
+                    1: "is already borrowed",
+                    4: "is not in library",
+                    99: "does not exist",
+                },
+            )
+        self.assertCirculationConsistent()
+
+    def test_bulk_checkout_for_inactive_user(self):
+        """
+        bulk_checkout() should reject all books for inactive user
+        given data: available book and author only person
+        """
+        result = bulk_checkout(Person.objects.get(id=7), [3])
+        self.assertEqual((result.rents, list(result.conflicts)), ([], [3]))
+
+    def test_bulk_return_closes_rents(self):
+        """
+        bulk_return() should close ongoing rents and report not borrowed books
+        given data: borrowed and available books
+        """
+        result = bulk_return([1, 2, 3])
+        with self.subTest():
+            self.assertEqual(sorted(e.id for e in result.rents), [4, 5])
+        with self.subTest():
+            self.assertEqual(result.conflicts, {3: "is not borrowed"})
+        self.assertEqual(Rent.objects.opened().count(), 0)
+        self.assertCirculationConsistent()
+
+    def test_bulk_return_for_user(self):
+        """
+        bulk_return() should close only rents of given user
+        given data: books borrowed by different users
+        """
+        result = bulk_return([1, 2], Person.objects.get(id=5))
+        self.assertEqual([e.book_id for e in result.rents], [2])
+        self.assertCirculationConsistent()
+
+    def test_rent_bulk_view(self):
+        """
+        rent_bulk view should run batch checkout and render skipped books
+        given data: available and borrowed books
+        """
+        self.client.force_login(User.objects.create_user("librarian"))
+        response = self.client.post(
+            reverse("library:rent_bulk"),
+            {"action": "checkout", "user": 2, "books": "3,\n1"},
+        )
+        with self.subTest():
+            self.assertEqual(
+                response.context["result"].conflicts, {1: "is already borrowed"}
+            )
+        self.assertTrue(Book.objects.get(id=3).is_borrowed)
+
+
+class CatalogueImportTests(SetUpTestData):
+    """
+    Class for import_catalogue management command testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def import_file(self, suffix, content):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        call_command(
+            "import_catalogue",
+            file.name,
+            batch_size=2,
+            stdout=io.StringIO(),
+            stderr=io.StringIO(),
+        )
+
+    def test_import_csv_deduplicates_persons(self):
+        """
+        import_catalogue should reuse existing and repeated persons
+        given data: CSV with existing author, new author repeated and person only row
+        """
+        self.import_file(
+            ".csv",
+            "title,name,second_name,surname,birth_date,death_date,is_active\n"
+            "Dom dzienny dom nocny,Olga,,Tokarczuk,1962-01-29,,\n"
+            "Ferdydurke,Witold,,Gombrowicz,1904-08-04,1969-07-24,false\n"
+            "Trans-Atlantyk,Witold,,Gombrowicz,1904-08-04,1969-07-24,false\n"
+            ",Jan,,Kowalski,1990-01-01,,\n",
+        )
+        with self.subTest():
+            self.assertEqual(Person.objects.count(), len(self.list_persons) + 2)
+        with self.subTest():
+            self.assertEqual(
+                Person.objects.get(surname="Gombrowicz").book_set.count(), 2
+            )
+        self.assertEqual(Person.objects.get(id=5).book_set.count(), 2)
+
+    def test_import_is_active_defaults_to_active(self):
+        """
+        import_catalogue should deactivate persons only with explicit 0 or
+        false, in CSV and JSON lines alike
+        given data: CSV with blank and 0 is_active, JSON lines with null and false
+        """
+        self.import_file(
+            ".csv",
+            "title,name,second_name,surname,birth_date,death_date,is_active\n"
+            ",Jan,,Kowalski,1990-01-01,,\n"
+            ",Anna,,Nowak,1990-01-01,,0\n",
+        )
+        self.import_file(
+            ".jsonl",
+            '{"authors": [{"name": "Ewa", "surname": "Lis", '
+            '"birth_date": "1990-01-01", "is_active": null}]}\n'
+            '{"authors": [{"name": "Piotr", "surname": "Wilk", '
+            '"birth_date": "1990-01-01", "is_active": false}]}\n',
+        )
+        self.assertEqual(
+            dict(
+                Person.objects.filter(
+                    surname__in=["Kowalski", "Nowak", "Lis", "Wilk"]
+                ).values_list("surname", "is_active")
+            ),
+            {"Kowalski": True, "Nowak": False, "Lis": True, "Wilk": False},
+        )
+
+    def test_import_jsonl_skips_bad_records(self):
+        """
+        import_catalogue should import books with many authors and skip broken records
+        given data: JSON lines with two authors book, broken line and author without birth date
+        """
+        self.import_file(
+            ".jsonl",
+            '{"title": "Wspólna", "authors": ['
+            '{"name": "Adam", "surname": "Mickiewicz", "birth_date": "1798-12-13"},'
+            '{"name": "Zofia", "surname": "Nałkowska", "birth_date": "1884-11-10"}]}\n'
+            "{broken\n"
+            '{"title": "Bez daty", "authors": [{"name": "A", "surname": "B"}]}\n',
+        )
+        book = Book.objects.get(title="Wspólna")
+        with self.subTest():
+            self.assertQuerySetEqual(
+                book.authors.all(), Person.objects.filter(id__in=[7, 8]), ordered=False
+            )
+        self.assertFalse(Book.objects.filter(title="Bez daty").exists())
+
+
+class ExportTests(SetUpTestData):
+    """
+    Class for streaming exports testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def test_export_view_streams_filtered_rents(self):
+        """
+        export view should stream CSV of rents filtered by user and borrow date
+        given data: rents of user with db_id = 3 borrowed after 2024-01-17
+        """
+        self.client.force_login(User.objects.create_user("librarian"))
+        response = self.client.get(
+            reverse("library:export", args=["rents"]),
+            {"user": 3, "borrowed_after": "2024-01-17"},
+        )
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(io.StringIO(b"".join(response).decode())))
+        with self.subTest():
+            self.assertEqual(rows[0], EXPORT_FIELDS["rents"])
+        self.assertEqual([e[0] for e in rows[1:]], ["3", "4"])
+
+    def test_export_view_rejects_bad_filters(self):
+        """
+        export view should answer 400 for bad filter and 404 for unknown export
+        given data: not numeric user and unknown export name
+        """
+        self.client.force_login(User.objects.create_user("librarian"))
+        url = reverse("library:export", args=["rents"])
+        with self.subTest():
+            self.assertEqual(self.client.get(url, {"user": "x"}).status_code, 400)
+        url = reverse("library:export", args=["secrets"])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_export_library_command_jsonl(self):
+        """
+        export_library should write one JSON object per book
+        given data: all books
+        """
+        out = io.StringIO()
+        call_command("export_library", "books", format="jsonl", stdout=out)
+        rows = [json.loads(e) for e in out.getvalue().splitlines()]
+        self.assertEqual([e["title"] for e in rows], [e.title for e in self.list_books])
+
+
+class ViewCacheTests(SetUpTestData):
+    """
+    Class for versioned cache of list and status pages testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user("librarian"))
+
+    def test_second_request_is_served_from_cache(self):
+        """
+        second request of the same page should not query library tables
+        given data: books page
+        """
+        self.client.get(reverse("library:books"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("library:books"))
+        with self.subTest():
+            self.assertFalse([e for e in queries if "library_" in e["sql"]])
+        self.assertEqual(len(response.context["books"]), len(self.list_books))
+        self.assertGreaterEqual(stats()["books"]["hits"], 1)
+
+    def test_rent_write_invalidates_book_status(self):
+        """
+        rent return should invalidate cached availability of the book
+        given data: borrowed book with db_id = 1
+        """
+        url = reverse("library:book_status", args=[1])
+        self.assertFalse(self.client.get(url).context["book"].is_available)
+        self.client.get(reverse("library:rent_return", args=[4]))
+        self.assertTrue(self.client.get(url).context["book"].is_available)
+
+    def test_authors_change_invalidates_authors(self):
+        """
+        adding book author should invalidate cached authors page
+        given data: user without books
+        """
+        url = reverse("library:authors")
+        self.assertEqual(len(self.client.get(url).context["authors_list"]), 4)
+        Book.objects.get(id=1).authors.add(1)
+        self.assertEqual(len(self.client.get(url).context["authors_list"]), 5)
+
+
+class SearchTests(SetUpTestData):
+    """
+    Class for full-text search of books and persons testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def test_qs_search_books_by_prefix(self):
+        """
+        .search() should find books by word prefixes in any order and case
+        given data: all books
+        """
+        self.assertQuerySetEqual(
+            Book.objects.search("tad PAN"), Book.objects.filter(id=3)
+        )
+
+    def test_qs_search_composes_with_available(self):
+        """
+        .search() should compose with .available() in both orders
+        given data: borrowed book with db_id = 1 and available ones
+        """
+        Book.objects.create(title="Bieguni wydanie drugie")
+        with self.subTest():
+            self.assertEqual(
+                [e.title for e in Book.objects.available().search("bieguni")],
+                ["Bieguni wydanie drugie"],
+            )
+        self.assertEqual(Book.objects.search("bieguni").available().count(), 1)
+
+    def test_qs_search_ranks_better_matches_first(self):
+        """
+        .search() should order books by relevance
+        given data: books with the word once and many times
+        """
+        Book.objects.create(title="Lalka")
+        Book.objects.create(title="Lalka lalka lalka")
+        self.assertEqual(
+            [e.title for e in Book.objects.search("lalka")],
+            ["Lalka lalka lalka", "Lalka"],
+        )
+
+    def test_qs_search_persons_and_authors(self):
+        """
+        .search() should match any name part ignoring diacritics and compose with .authors()
+        given data: all persons
+        """
+        with self.subTest():
+            self.assertQuerySetEqual(
+                Person.objects.search("adam"),
+                Person.objects.filter(id__in=[1, 2, 7]),
+                ordered=False,
+            )
+        with self.subTest():
+            self.assertQuerySetEqual(
+                Person.objects.search("łecka"), Person.objects.filter(id=4)
+            )
+        self.assertQuerySetEqual(
+            Person.objects.authors().search("adam b"), Person.objects.filter(id=7)
+        )
+
+    def test_qs_search_follows_updates_and_deletes(self):
+        """
+        .search() should see renamed books and forget deleted ones
+        given data: renamed and deleted books
+        """
+        Book.objects.filter(id=4).update(title="Przedwiośnie")
+        Book.objects.filter(id=2).delete()
+        with self.subTest():
+            self.assertEqual(Book.objects.search("niemnem").count(), 0)
+        with self.subTest():
+            self.assertEqual(Book.objects.search("uprowadzenie").count(), 0)
+        self.assertQuerySetEqual(
+            Book.objects.search("przedwio"), Book.objects.filter(id=4)
+        )
+
+    def test_qs_search_without_words_is_plain(self):
+        """
+        .search() should result in plain qs for query without words
+        given data: punctuation only
+        """
+        self.assertEqual(Book.objects.search('"*').count(), 0)
+
+    def test_books_view_filters_by_query(self):
+        """
+        books view should list only books matching q parameter
+        given data: all books
+        """
+        self.client.force_login(User.objects.create_user("librarian"))
+        response = self.client.get(reverse("library:books"), {"q": "pan"})
+        self.assertEqual([e.id for e in response.context["books"]], [3])
+
+    def test_books_view_pages_search_by_rank(self):
+        """
+        books view should page search results in relevance order
+        given data: titles with the word once, twice and three times
+        """
+        for title in ["Lalka", "Lalka lalka lalka", "Lalka lalka"]:
+            Book.objects.create(title=title)
+        self.client.force_login(User.objects.create_user("librarian"))
+        names, query = [], {"q": "lalka", "per_page": 1}
+        while query:
+            response = self.client.get(reverse("library:books"), query)
+            names.extend(e.name for e in response.context["books"])
+            page = response.context["page"]
+            query = page.has_next() and {**query, "after": page.next_cursor}
+        self.assertEqual(names, ["Lalka lalka lalka", "Lalka lalka", "Lalka"])
+
+
+class AutocompleteTests(SetUpTestData):
+    """
+    Class for autocomplete endpoints and lazy choice widgets testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user("librarian"))
+
+    def test_books_autocomplete_returns_available_books(self):
+        """
+        books endpoint should return only books that can be rented
+        given data: borrowed books with db_id = 1, 2
+        """
+        response = self.client.get(reverse("library:books_autocomplete"))
+        self.assertEqual([e["id"] for e in response.json()["results"]], [3, 4])
+
+    def test_autocomplete_search_and_pages(self):
+        """
+        endpoint should filter by prefix and return cursor of next page
+        given data: all persons
+        """
+        url = reverse("library:authors_autocomplete")
+        data = self.client.get(url, {"q": "ada", "per_page": 2}).json()
+        with self.subTest():
+            self.assertEqual([e["id"] for e in data["results"]], [1, 2])
+        data = self.client.get(
+            url, {"q": "ada", "per_page": 2, "after": data["next"]}
+        ).json()
+        self.assertEqual(
+            data, {"results": [{"id": 7, "text": "Adam Mickiewicz"}], "next": None}
+        )
+
+    def test_rent_add_renders_only_selected_choices(self):
+        """
+        rent form should not query or render every book and person
+        given data: all books and persons
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("library:rent_add"))
+        with self.subTest():
+            self.assertFalse([e for e in queries if "library_" in e["sql"]])
+        with self.subTest():
+            self.assertNotContains(response, "Bieguni")
+        self.assertContains(response, "library/js/autocomplete.js")
+
+    def test_rent_add_rejects_borrowed_book(self):
+        """
+        rent form should offer only available books and active persons
+        given data: borrowed book with db_id = 1, inactive person with db_id = 7
+        """
+        url = reverse("library:rent_add")
+        response = self.client.post(url, {"book": 1, "user": 1})
+        with self.subTest():
+            self.assertTrue(response.context["form"].has_error("book"))
+        response = self.client.post(url, {"book": 3, "user": 7})
+        with self.subTest():
+            self.assertTrue(response.context["form"].has_error("user"))
+        self.client.post(url, {"book": 3, "user": 1})
+        self.assertTrue(Book.objects.get(id=3).is_borrowed)
+
+
+class AdminTests(SetUpTestData):
+    """
+    Class for admin changelists, filters and bulk actions testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser("admin"))
+
+    def test_rent_changelist_queries_do_not_depend_on_rows(self):
+        """
+        rent changelist should load books and users with rows and skip full count
+        given data: all rents and ten more
+        """
+        url = reverse("admin:library_rent_changelist")
+        # first request caches session and user
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        for _ in range(10):
+            rent = Rent.objects.create(book_id=3, user_id=1)
+            rent.return_date = datetime.date.today()
+            rent.save()
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(url)
+        with self.subTest():
+            self.assertEqual(len(after), len(before))
+        with self.subTest():
+            self.assertNotContains(response, "Bieguni</option>")
+        self.assertFalse([e for e in after if "SELECT COUNT(*) AS" in e["sql"]])
+
+    def test_rent_changelist_filters(self):
+        """
+        rent changelist should filter by picked user and status
+        given data: rents of user with db_id = 3
+        """
+        url = reverse("admin:library_rent_changelist")
+        response = self.client.get(url, {"user": 3, "status": "opened"})
+        self.assertEqual([e.id for e in response.context["cl"].result_list], [4])
+
+    def test_mark_returned_action(self):
+        """
+        mark returned action should close ongoing rents and update books and counters
+        given data: all rents
+        """
+        self.client.post(
+            reverse("admin:library_rent_changelist"),
+            {"action": "mark_returned", "_selected_action": [1, 4, 5]},
+        )
+        with self.subTest():
+            self.assertFalse(Rent.objects.opened().exists())
+        with self.subTest():
+            self.assertFalse(Book.objects.borrowed().exists())
+        self.assertFalse(Person.objects.rents_numbers_mismatched().exists())
+
+    def test_delete_action_frees_books(self):
+        """
+        delete action on ongoing rents should put their books back on shelf
+        and keep counters
+        given data: ongoing rents 4 and 5
+        """
+        self.client.post(
+            reverse("admin:library_rent_changelist"),
+            {"action": "delete_selected", "_selected_action": [4, 5], "post": "yes"},
+        )
+        with self.subTest():
+            self.assertFalse(Book.objects.borrowed().exists())
+        with self.subTest():
+            self.assertFalse(Person.objects.rents_numbers_mismatched().exists())
+        self.assertTrue(checkout(Person.objects.get(id=1), 1).rents)
+
+    def test_book_changes_keep_title_counters(self):
+        """
+        deactivating book in change form and deleting books with delete action
+        should keep copies counters of their titles
+        given data: books with db_id = 3, 4 on shelf
+        """
+        url = reverse("admin:library_book_change", args=[3])
+        prefix = self.client.get(url).context["inline_admin_formsets"][0].formset.prefix
+        self.client.post(
+            url,
+            {
+                "title": "Pan Tadeusz",
+                f"{prefix}-TOTAL_FORMS": 0,
+                f"{prefix}-INITIAL_FORMS": 0,
+            },
+        )
+        with self.subTest():
+            self.assertFalse(Book.objects.get(id=3).is_active)
+        self.client.post(
+            reverse("admin:library_book_changelist"),
+            {"action": "delete_selected", "_selected_action": [4], "post": "yes"},
+        )
+        with self.subTest():
+            self.assertFalse(Book.objects.filter(id=4).exists())
+        with self.subTest():
+            self.assertFalse(Title.objects.available().filter(id__in=[3, 4]).exists())
+        self.assertFalse(Title.objects.copies_mismatched().exists())
+
+    def test_authors_inline_keeps_title_authors(self):
+        """
+        authors added in books and persons change forms should become authors
+        of titles of the books
+        given data: book with db_id = 3 by author with db_id = 7
+        """
+        for url, person_id in [
+            (reverse("admin:library_book_change", args=[3]), 6),
+            (reverse("admin:library_person_change", args=[5]), 5),
+        ]:
+            response = self.client.get(url)
+            prefix = response.context["inline_admin_formsets"][0].formset.prefix
+            initial = response.context["adminform"].form.initial
+            data = dict(
+                {name: value for name, value in initial.items() if value is not None},
+                **{
+                    f"{prefix}-TOTAL_FORMS": 1,
+                    f"{prefix}-INITIAL_FORMS": 0,
+                    f"{prefix}-0-person": person_id,
+                    f"{prefix}-0-book": 3,
+                },
+            )
+            self.client.post(url, data)
+        self.assertEqual(
+            sorted(Title.objects.get(id=3).authors.values_list("id", flat=True)),
+            [5, 6, 7],
+        )
+
+    def test_deactivate_action_with_search(self):
+        """
+        deactivate action should deactivate selected books found by search
+        given data: all books
+        """
+        self.client.post(
+            reverse("admin:library_book_changelist") + "?q=pan",
+            {"action": "deactivate", "select_across": 1, "_selected_action": [3]},
+        )
+        self.assertEqual(
+            list(Book.objects.inactive().values_list("id", flat=True)), [3]
+        )
+
+    def test_estimated_count_paginator(self):
+        """
+        paginator should count rows only up to limit and estimate the rest
+        given data: all persons
+        """
+        with self.settings(LIBRARY_ADMIN_COUNT_LIMIT=3):
+            with self.subTest():
+                self.assertEqual(
+                    EstimatedCountPaginator(Person.objects.order_by("id"), 2).count, 8
+                )
+            with self.subTest():
+                self.assertEqual(
+                    EstimatedCountPaginator(
+                        Person.objects.active().order_by("id"), 2
+                    ).count,
+                    3,
+                )
+            self.assertEqual(
+                EstimatedCountPaginator(
+                    Person.objects.inactive().order_by("id"), 2
+                ).count,
+                2,
+            )
+
+
+class MetricsTests(SetUpTestData):
+    """
+    Class for request metrics middleware and Prometheus endpoint testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.client.force_login(User.objects.create_user("librarian"))
+
+    def test_request_is_recorded_under_url_name(self):
+        """
+        middleware should observe queries, template time and size per url name
+        given data: books page
+        """
+        response = self.client.get(reverse("library:books"))
+        text = self.client.get(reverse("metrics")).content.decode()
+        for name in [
+            "library_request_duration_seconds",
+            "library_db_queries",
+            "library_db_duration_seconds",
+            "library_template_render_seconds",
+        ]:
+            with self.subTest(name=name):
+                self.assertIn(f'{name}_count{{view="library:books"}} 1', text)
+        self.assertIn(
+            f'library_response_size_bytes_sum{{view="library:books"}} '
+            f"{len(response.content)}",
+            text,
+        )
+
+    def test_metrics_endpoint_is_restricted(self):
+        """
+        metrics endpoint should be readable only from allowed addresses
+        given data: request from other address
+        """
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 403)
+
+    def test_slow_request_log_contains_sql(self):
+        """
+        middleware should log slow requests with their slowest queries
+        given data: threshold of 0 ms
+        """
+        with self.settings(LIBRARY_SLOW_REQUEST_MS=0):
+            with self.assertLogs("library.slow_requests", "WARNING") as logs:
+                self.client.get(reverse("library:rents"))
+        with self.subTest():
+            self.assertIn("(library:rents)", logs.output[0])
+        self.assertIn('FROM "library_rent"', logs.output[0])
+
+    def test_record_keeps_only_slowest_statements(self):
+        """
+        request record should count every statement and keep only the slowest
+        given data: 100 statements of growing duration, then a fast one
+        """
+        record = metrics.RequestRecord(statements_kept=3)
+        for i in range(100):
+            record.add_statement(i / 1000, f"SELECT {i}")
+        record.add_statement(0, "SELECT fast")
+        with self.subTest():
+            self.assertEqual((record.queries, len(record.statements)), (101, 3))
+        self.assertEqual(
+            [sql for _, sql in record.slowest(2)], ["SELECT 99", "SELECT 98"]
+        )
+
+
+class BenchmarkTests(SetUpTestData):
+    """
+    Class for synthetic data generator and benchmark harness testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def generate(self, seed):
+        call_command(
+            "generate_library",
+            persons=20,
+            books=30,
+            rents=100,
+            seed=seed,
+            stdout=io.StringIO(),
+        )
+        return list(
+            Rent.objects.filter(id__gt=5)
+            .order_by("id")
+            .values_list("book__title", "user__surname", "borrow_date", "return_date")
+        )
+
+    def test_generate_library_is_deterministic_and_consistent(self):
+        """
+        generate_library should give the same data for the same seed and keep counters
+        given data: generated twice with seed 1
+        """
+        first = self.generate(1)
+        Rent.objects.filter(id__gt=5).delete()
+        Book.objects.filter(id__gt=4).delete()
+        Person.objects.filter(id__gt=8).delete()
+        with self.subTest():
+            self.assertEqual(len(first), 100)
+        with self.subTest():
+            self.assertEqual(self.generate(1), first)
+        call_command("rebuild_circulation", check=True, stdout=io.StringIO())
+
+    def test_generate_library_keeps_persons_unique(self):
+        """
+        generate_library should not repeat name, surname and birth date of persons
+        given data: 400 persons generated from one name and one surname
+        """
+        with unittest.mock.patch.multiple(
+            generate_library, NAMES=["Anna"], SURNAMES=["Nowak"]
+        ):
+            call_command(
+                "generate_library",
+                persons=400,
+                books=1,
+                rents=0,
+                stdout=io.StringIO(),
+            )
+        self.assertEqual(Person.objects.filter(surname="Nowak").count(), 400)
+
+    def test_run_covers_queryset_methods_and_views(self):
+        """
+        run() should measure every queryset method and view and leave data unchanged
+        given data: all tables
+        """
+        results = benchmarks.run(repeat=1)
+        with self.subTest():
+            self.assertIn("Person.annotate_opened_rents_number", results)
+        with self.subTest():
+            self.assertIn("library:rents", results)
+        with self.subTest():
+            self.assertGreater(results["library:books"]["queries"], 0)
+        with self.subTest():
+            self.assertEqual(Book.objects.borrowed().count(), 2)
+        self.assertEqual(Person.objects.active().count(), 6)
+
+    def test_run_keeps_configured_cache(self):
+        """
+        run() should clear only its own cache, not the configured one
+        given data: value in the configured cache
+        """
+        get_cache().set("library:kept", 1)
+        benchmarks.run(repeat=1)
+        self.assertEqual(get_cache().get("library:kept"), 1)
+
+    def test_sessions_compares_engines(self):
+        """
+        sessions() should show cached session and user saving queries per request
+        given data: benchmark user reading index page
+        """
+        results = benchmarks.sessions(requests=2)
+        with self.subTest():
+            self.assertEqual(len(results), 6)
+        with self.subTest():
+            self.assertEqual(results["cached_db/cached_auth"]["queries_per_request"], 0)
+        self.assertEqual(results["db/auth"]["queries_per_request"], 2)
+
+
+@override_settings(ROOT_URLCONF="library.benchmarks")
+class AsyncViewsTests(SetUpTestData):
+    """
+    Class for async read views, async login_required and async pagination testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(User.objects.create_user("librarian"))
+
+    async def test_async_views_render_pages(self):
+        """
+        async views should render the same data as sync views
+        given data: all books, persons and rents
+        """
+        for name, kwargs in [
+            ("books", {}),
+            ("authors", {}),
+            ("users", {}),
+            ("rents", {}),
+            ("book_status", {"book_id": 1}),
+            ("author_status", {"person_id": 5}),
+            ("user_status", {"person_id": 3}),
+            ("rent_status", {"rent_id": 4}),
+        ]:
+            response = await self.async_client.get(
+                reverse(f"async:{name}", kwargs=kwargs)
+            )
+            with self.subTest(name=name):
+                self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse("async:books"))
+        self.assertEqual(len(response.context["books"]), len(self.list_books))
+
+    async def test_async_status_view_not_found(self):
+        """
+        async status view should return 404 for missing object
+        given data: not existing book
+        """
+        response = await self.async_client.get(reverse("async:book_status", args=[100]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_async_login_required(self):
+        """
+        async login_required should redirect anonymous users to login page
+        given data: logged out client
+        """
+        await self.async_client.alogout()
+        response = await self.async_client.get(reverse("async:rents"))
+        with self.subTest():
+            self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(settings.LOGIN_URL))
+
+    async def test_apage_equals_page(self):
+        """
+        .apage() should return the same objects and cursors as .page()
+        given data: all rents
+        """
+        paginator = KeysetPaginator(Rent.objects.all(), ["return_date", "id"], 2)
+        page = await paginator.apage()
+        expected = await sync_to_async(paginator.page)()
+        with self.subTest():
+            self.assertEqual(list(page), list(expected))
+        self.assertEqual(page.next_cursor, expected.next_cursor)
+
+
+class RollupTests(SetUpTestData):
+    """
+    Class for daily rents rollups, their refresh and stats page testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def test_qs_by_month_and_opened_at_month_end(self):
+        """
+        .by_month() and .opened_at_month_end() should sum daily rollups per month
+        given data: all rents rolled up till 2024-03-31
+        """
+        rollups.refresh(until=datetime.date(2024, 3, 31))
+        months = list(RentRollup.objects.totals().by_month())
+        with self.subTest():
+            self.assertEqual(
+                [(e["borrowed"], e["returned"], e["loan_days"]) for e in months],
+                [(1, 0, 0), (0, 1, 33), (0, 0, 0), (2, 0, 0), (0, 2, 35), (2, 0, 0)],
+            )
+        with self.subTest():
+            self.assertEqual(
+                list(RentRollup.objects.opened_at_month_end().values()),
+                [1, 0, 0, 2, 0, 2],
+            )
+        self.assertAlmostEqual(RentRollup.objects.totals().average_loan_days(), 68 / 3)
+
+    def test_qs_for_book_and_for_user(self):
+        """
+        .for_book() and .for_user() should return rollups of one book or user
+        given data: rents of book with db_id = 1 and user with db_id = 5
+        """
+        rollups.refresh(until=datetime.date(2024, 3, 31))
+        with self.subTest():
+            self.assertEqual(
+                list(
+                    RentRollup.objects.for_book(1)
+                    .filter(borrowed__gt=0)
+                    .values_list("day", "borrowed")
+                ),
+                [
+                    (datetime.date(2023, 10, 4), 1),
+                    (datetime.date(2024, 1, 17), 1),
+                    (datetime.date(2024, 3, 12), 1),
+                ],
+            )
+        self.assertEqual(
+            RentRollup.objects.for_user(5)
+            .between(end=datetime.date(2024, 2, 29))
+            .average_loan_days(),
+            16,
+        )
+
+    def test_refresh_continues_from_high_water_mark(self):
+        """
+        refresh() should recompute only days from the latest rolled up one
+        given data: rollups refreshed in two steps and at once
+        """
+        rollups.refresh(until=datetime.date(2024, 1, 17))
+        with self.subTest():
+            self.assertEqual(rollups.high_water_mark(), datetime.date(2024, 1, 17))
+        days = rollups.refresh(until=datetime.date(2024, 3, 31))
+        with self.subTest():
+            self.assertEqual(days, 75)
+        fields = ["day", "book", "user", "borrowed", "returned", "loan_days", "opened"]
+        stepwise = list(RentRollup.objects.order_by("id").values_list(*fields))
+        call_command(
+            "refresh_rollups", full=True, until="2024-03-31", stdout=io.StringIO()
+        )
+        self.assertEqual(
+            sorted(RentRollup.objects.values_list(*fields), key=str),
+            sorted(stepwise, key=str),
+        )
+
+    def test_stats_page_reads_rollups_only(self):
+        """
+        stats page should show monthly rollups without reading rents
+        given data: all rents rolled up till 2024-03-31
+        """
+        rollups.refresh(until=datetime.date(2024, 3, 31))
+        self.client.force_login(User.objects.create_user("librarian"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("library:stats"))
+        with self.subTest():
+            self.assertFalse([e for e in queries if 'library_rent"' in e["sql"]])
+        self.assertEqual(len(response.context["months"]), 6)
+
+    def test_stats_page_of_book_omits_library_ongoing_rents(self):
+        """
+        stats page of one book should not show ongoing rents of the library
+        given data: all rents rolled up till 2024-03-31, book with db_id = 3
+        """
+        rollups.refresh(until=datetime.date(2024, 3, 31))
+        self.client.force_login(User.objects.create_user("librarian"))
+        response = self.client.get(reverse("library:stats"), {"book": 3})
+        with self.subTest():
+            self.assertNotContains(response, "Ongoing at month end")
+        self.assertFalse([e for e in response.context["months"] if "opened" in e])
+
+
+class ArchiveTests(SetUpTestData):
+    """
+    Class for archiving closed rents testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def test_archive_rents_moves_old_closed_rents(self):
+        """
+        archive_rents() should move only closed rents returned before given day
+        given data: rents returned 2023-11-06, 2024-02-02 and 2024-02-06, two open
+        """
+        number = archive.archive_rents(datetime.date(2024, 2, 3), batch_size=1)
+        with self.subTest():
+            self.assertEqual(number, 2)
+        with self.subTest():
+            self.assertEqual(
+                list(ArchivedRent.objects.order_by("id").values_list("id", flat=True)),
+                [1, 2],
+            )
+        with self.subTest():
+            self.assertEqual(
+                list(Rent.objects.order_by("id").values_list("id", flat=True)),
+                [3, 4, 5],
+            )
+        self.assertEqual(archive.archive_rents(datetime.date(2024, 2, 3)), 0)
+
+    def test_archived_rents_keep_counters_and_history(self):
+        """
+        archived rents should still count in rents counters and be returned
+        with include_archive
+        given data: rents with db_id = 1, 2 and 3 archived
+        """
+        call_command("archive_rents", days=0, stdout=io.StringIO())
+        with self.subTest():
+            self.assertFalse(Person.objects.rents_numbers_mismatched().exists())
+        with self.subTest():
+            self.assertEqual(Person.objects.sync_rents_numbers(), 8)
+        with self.subTest():
+            self.assertEqual(Person.objects.get(id=5).rents_number, 2)
+        with self.subTest():
+            self.assertEqual([e.id for e in Rent.objects.for_books(1)], [4])
+        with self.subTest():
+            self.assertEqual(
+                [
+                    e.id
+                    for e in Rent.objects.for_books(1, include_archive=True).order_by(
+                        "id"
+                    )
+                ],
+                [1, 2, 4],
+            )
+        rents = Rent.objects.for_users(5, include_archive=True).order_by("-id")
+        self.assertEqual(
+            [(type(e), e.id, e.return_date) for e in rents],
+            [
+                (Rent, 5, None),
+                (Rent, 2, datetime.date(2024, 2, 2)),
+            ],
+        )
+
+    def test_rollups_include_archived_rents(self):
+        """
+        rollups refreshed after archiving should not change
+        given data: rollups refreshed till 2024-03-31 before and after archiving
+        """
+        fields = ["day", "book", "user", "borrowed", "returned", "loan_days", "opened"]
+        rollups.refresh(until=datetime.date(2024, 3, 31))
+        before = sorted(RentRollup.objects.values_list(*fields), key=str)
+        archive.archive_rents(datetime.date(2024, 3, 1))
+        rollups.refresh(rollups.first_day(), datetime.date(2024, 3, 31))
+        self.assertEqual(
+            sorted(RentRollup.objects.values_list(*fields), key=str), before
+        )
+
+
+class CheckoutTests(SetUpTestData):
+    """
+    Class for single checkout and return service testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def test_checkout_and_return_rent(self):
+        """
+        checkout() and return_rent() should rent and close rents, keeping
+        flags and counters, and report conflicts
+        given data: available book with db_id = 3, borrowed book with db_id = 1
+        """
+        user = Person.objects.get(id=1)
+        result = checkout(user, 3)
+        with self.subTest():
+            self.assertEqual(result.conflicts, {})
+        with self.subTest():
+            self.assertEqual(checkout(user, 1).conflicts, {1: "is already borrowed"})
+        with self.subTest():
+            self.assertEqual(
+                checkout(Person.objects.get(id=7), 3).conflicts,
+                {3: "user is not active"},
+            )
+        with self.subTest():
+            self.assertTrue(Book.objects.get(id=3).is_borrowed)
+        with self.subTest():
+            self.assertFalse(Person.objects.rents_numbers_mismatched().exists())
+        rent = result.rents[0]
+        with self.subTest():
+            self.assertEqual(return_rent(rent).rents, [rent])
+        with self.subTest():
+            self.assertEqual(return_rent(rent).conflicts, {3: "is not borrowed"})
+        with self.subTest():
+            self.assertFalse(Book.objects.get(id=3).is_borrowed)
+        self.assertFalse(Person.objects.rents_numbers_mismatched().exists())
+
+    def test_rent_add_reports_lost_race(self):
+        """
+        rent form should show conflict instead of error when book got rented
+        after validation
+        given data: book with db_id = 3 rented by checkout() during form_valid
+        """
+        self.client.force_login(User.objects.create_user("librarian"))
+        form_valid = views.RentAddView.form_valid
+
+        def rented_meanwhile(view, form):
+            checkout(Person.objects.get(id=2), 3)
+            return form_valid(view, form)
+
+        with unittest.mock.patch.object(
+            views.RentAddView, "form_valid", rented_meanwhile
+        ):
+            response = self.client.post(
+                reverse("library:rent_add"), {"book": 3, "user": 1}
+            )
+        with self.subTest():
+            self.assertEqual(response.status_code, 200)
+        with self.subTest():
+            self.assertTrue(response.context["form"].has_error("book"))
+        self.assertEqual(Rent.objects.opened().for_books(3).get().user_id, 2)
+
+
+class CheckoutContentionTests(TransactionTestCase):
+    """
+    Class for concurrent checkouts of the same books testing, writers use
+    their own connections so data has to be committed.
+    """
+
+    reset_sequences = True
+
+    def setUp(self):
+        super().setUp()
+        SetUpTestData.setup_database()
+        get_cache().clear()
+
+    def test_concurrent_checkouts_rent_book_once(self):
+        """
+        concurrent checkout() calls should rent the book exactly once
+        given data: 6 active persons checking out book with db_id = 3 at once
+        """
+        users = list(Person.objects.active())
+        barrier = threading.Barrier(len(users))
+
+        def rent(user):
+            try:
+                barrier.wait()
+                return checkout(user, 3)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(len(users)) as executor:
+            results = list(executor.map(rent, users))
+        with self.subTest():
+            self.assertEqual(sum(len(e.rents) for e in results), 1)
+        with self.subTest():
+            self.assertEqual(
+                [e.conflicts for e in results if e.conflicts],
+                [{3: "is already borrowed"}] * (len(users) - 1),
+            )
+        with self.subTest():
+            self.assertEqual(Rent.objects.opened().for_books(3).count(), 1)
+        self.assertFalse(Person.objects.rents_numbers_mismatched().exists())
+
+    def test_contention_keeps_data_consistent(self):
+        """
+        contention() should finish every attempt with checkout or conflict
+        and leave flags and counters consistent
+        given data: 4 writers checking out and returning 2 books 80 times
+        """
+        result = benchmarks.contention(writers=4, attempts=80)
+        with self.subTest():
+            self.assertEqual(result["checkouts"] + result.get("conflicts", 0), 80)
+        with self.subTest():
+            self.assertGreater(result["per_second"], 0)
+        with self.subTest():
+            self.assertFalse(Book.objects.availability_mismatched().exists())
+        self.assertFalse(Person.objects.rents_numbers_mismatched().exists())
+
+
+@override_settings(LIBRARY_REPLICAS=["replica"])
+class ReplicaRoutingTests(SetUpTestData):
+    """
+    Class for primary and replica database routing testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def routed_request(self, method, write=False, cookies=None):
+        """
+        Returns response and databases of library and auth reads of request
+        made through ReplicaMiddleware, reads are routed after write if given.
+        """
+        router = routers.PrimaryReplicaRouter()
+        routed = {}
+
+        def view(request):
+            if write:
+                router.db_for_write(Rent)
+            routed["library"] = router.db_for_read(Rent)
+            routed["auth"] = router.db_for_read(User)
+            return HttpResponse()
+
+        factory = RequestFactory()
+        factory.cookies.load(cookies or {})
+        response = ReplicaMiddleware(view)(getattr(factory, method)("/"))
+        return response, routed
+
+    def test_safe_requests_read_library_models_from_replica(self):
+        """
+        router should read library models from replica during safe requests only
+        given data: GET and POST requests without writes
+        """
+        response, routed = self.routed_request("get")
+        with self.subTest():
+            self.assertEqual(routed, {"library": "replica", "auth": "default"})
+        with self.subTest():
+            self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        with self.subTest():
+            self.assertEqual(self.routed_request("post")[1]["library"], "default")
+        self.assertEqual(routers.PrimaryReplicaRouter().db_for_read(Rent), "default")
+
+    def test_writes_pin_client_to_primary(self):
+        """
+        router should read from primary after write in the same request and
+        in requests with primary cookie
+        given data: GET request writing and GET request with cookie
+        """
+        response, routed = self.routed_request("get", write=True)
+        with self.subTest():
+            self.assertEqual(routed["library"], "default")
+        with self.subTest():
+            self.assertEqual(
+                response.cookies[routers.PIN_COOKIE]["max-age"],
+                settings.LIBRARY_REPLICA_PIN_SECONDS,
+            )
+        cookies = {routers.PIN_COOKIE: "1"}
+        self.assertEqual(
+            self.routed_request("get", cookies=cookies)[1]["library"], "default"
+        )
+
+    def test_transactions_and_side_effect_views_read_primary(self):
+        """
+        router should read from primary inside transactions opened during
+        safe request and in views marked with primary
+        given data: GET requests reading in transaction and in marked view
+        """
+        router = routers.PrimaryReplicaRouter()
+        routed = []
+
+        def view(request):
+            routed.append(router.db_for_read(Rent))
+            with transaction.atomic():
+                routed.append(router.db_for_read(Rent))
+            return HttpResponse()
+
+        ReplicaMiddleware(view)(RequestFactory().get("/"))
+        ReplicaMiddleware(routers.primary(view))(RequestFactory().get("/"))
+        self.assertEqual(routed, ["replica", "default", "default", "default"])
+
+
+class ReplicaSyncTests(TransactionTestCase):
+    """
+    Class for copying primary database to SQLite replicas testing, the
+    primary can not be in a transaction while copied.
+    """
+
+    reset_sequences = True
+
+    def setUp(self):
+        super().setUp()
+        SetUpTestData.setup_database()
+
+    def test_copy_sqlite_refreshes_lagging_replica(self):
+        """
+        copy_sqlite() should bring replica up to date with primary
+        given data: SQLite file replica copied before and after new rent
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            replica = connections["default"].__class__(
+                dict(connection.settings_dict, NAME=os.path.join(directory, "r.db")),
+                alias="replica",
+            )
+
+            def replica_rents():
+                with replica.cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM "library_rent"')
+                    return cursor.fetchall()[0][0]
+
+            try:
+                with self.subTest():
+                    with self.assertRaises(transaction.TransactionManagementError):
+                        with transaction.atomic():
+                            routers.copy_sqlite(connection, replica)
+                routers.copy_sqlite(connection, replica)
+                Rent.objects.create(book_id=3, user_id=1)
+                with self.subTest():
+                    self.assertEqual(replica_rents(), 5)
+                routers.copy_sqlite(connection, replica)
+                self.assertEqual(replica_rents(), 6)
+            finally:
+                replica.close()
+
+
+@override_settings(LIBRARY_OUTBOX={"BACKEND": "library.outbox.MemoryBackend"})
+class OverdueTests(SetUpTestData):
+    """
+    Class for due dates and overdue reminders testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def setUp(self):
+        super().setUp()
+        outbox.outbox.clear()
+
+    def test_new_rent_due_date(self):
+        """
+        new rent should be due after LIBRARY_LOAN_PERIOD_DAYS
+        given data: rent of book with db_id = 3 saved today
+        """
+        with self.settings(LIBRARY_LOAN_PERIOD_DAYS=14):
+            rent = Rent.objects.create(book_id=3, user_id=1)
+        self.assertEqual(rent.due_date, datetime.date.today() + datetime.timedelta(14))
+
+    def test_qs_overdue(self):
+        """
+        .overdue() should return open rents due before given day by rent_open_due_idx
+        given data: open rents due 2024-03-31 and 2024-04-11
+        """
+        with self.subTest():
+            self.assertQuerysetEqual(
+                Rent.objects.overdue(datetime.date(2024, 4, 1)), [5], lambda e: e.id
+            )
+        with self.subTest():
+            self.assertEqual(
+                Rent.objects.overdue(datetime.date(2024, 3, 31)).count(), 0
+            )
+        self.assertIn(
+            "USING INDEX rent_open_due_idx",
+            Rent.objects.overdue().order_by("due_date", "id").explain(),
+        )
+
+    def test_send_overdue_reminders_once(self):
+        """
+        send_overdue_reminders command should remind every overdue rent once
+        given data: open rents due 2024-03-31 and 2024-04-11, commands run twice
+        """
+        for _ in range(2):
+            call_command(
+                "send_overdue_reminders",
+                as_of="2024-05-01",
+                batch_size=1,
+                stderr=io.StringIO(),
+            )
+        with self.subTest():
+            self.assertEqual([e.data["rent_id"] for e in outbox.outbox], [5, 4])
+        with self.subTest():
+            self.assertEqual(outbox.outbox[0].recipient_id, 5)
+        with self.subTest():
+            self.assertEqual(
+                set(Rent.objects.values_list("reminder_date", flat=True)),
+                {None, datetime.date(2024, 5, 1)},
+            )
+        self.assertEqual(Rent.objects.filter(reminder_date__isnull=False).count(), 2)
+
+    def test_failed_send_is_retried(self):
+        """
+        send_overdue_reminders() should not mark rents of failed batch
+        given data: backend failing once
+        """
+
+        class FailingBackend(outbox.BaseBackend):
+            def send(self, notifications):
+                raise OSError("outbox unavailable")
+
+        with self.subTest():
+            with self.assertRaises(OSError):
+                reminders.send_overdue_reminders(
+                    datetime.date(2024, 5, 1), backend=FailingBackend()
+                )
+        with self.subTest():
+            self.assertFalse(Rent.objects.filter(reminder_date__isnull=False).exists())
+        self.assertEqual(reminders.send_overdue_reminders(datetime.date(2024, 5, 1)), 2)
+
+
+class ReservationTests(SetUpTestData):
+    """
+    Class for reservation queues and their hand-off on return testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def test_reserve_queue_positions(self):
+        """
+        reserve() should queue users of borrowed book in order and reject
+        available books, borrowers and repeated reservations
+        given data: book with db_id = 1 borrowed by user with db_id = 3
+        """
+        persons = {e.id: e for e in Person.objects.all()}
+        first = reserve(persons[1], 1).reservations[0]
+        second = reserve(persons[2], 1).reservations[0]
+        with self.subTest():
+            self.assertEqual(
+                [e.position for e in Reservation.objects.order_by("ticket")], [1, 2]
+            )
+        with self.subTest():
+            self.assertEqual((first.ticket, second.ticket), (1, 2))
+        with self.subTest():
+            self.assertEqual(
+                Reservation.objects.get(pk=second.pk).estimated_date(),
+                datetime.date.today() + loan_period(),
+            )
+        with self.subTest():
+            self.assertEqual(reserve(persons[1], 3).conflicts, {3: "is on shelf"})
+        with self.subTest():
+            self.assertEqual(
+                reserve(persons[3], 1).conflicts, {1: "is borrowed by the user"}
+            )
+        with self.subTest():
+            self.assertEqual(
+                reserve(persons[1], 1).conflicts, {1: "is already reserved by the user"}
+            )
+        self.assertEqual(Book.objects.get(id=1).queue_length, 2)
+
+    def test_qs_heads(self):
+        """
+        .heads() should return first waiting reservation per book by reservation_queue_idx
+        given data: two reservations of book with db_id = 1, one of db_id = 2
+        """
+        reserve(Person.objects.get(id=1), 1)
+        reserve(Person.objects.get(id=2), 1)
+        reserve(Person.objects.get(id=2), 2)
+        heads = Reservation.objects.heads(1, 2)
+        with self.subTest():
+            self.assertEqual(
+                sorted(heads.values_list("book", "user")), [(1, 1), (2, 2)]
+            )
+        self.assertIn("USING INDEX reservation_queue_idx", heads.explain())
+
+    def test_return_hands_book_off_to_queue_head(self):
+        """
+        returning rent should rent the book to the first active user in queue
+        in the same transaction
+        given data: book with db_id = 1 reserved by user 2, deactivated later, and user 1
+        """
+        reserve(Person.objects.get(id=2), 1)
+        reserve(Person.objects.get(id=1), 1)
+        Person.objects.filter(id=2).deactivate()
+        self.client.force_login(User.objects.create_user("librarian"))
+        self.client.get(reverse("library:rent_return", args=[4]))
+        with self.subTest():
+            self.assertEqual(Rent.objects.opened().for_books(1).get().user_id, 1)
+        with self.subTest():
+            self.assertEqual(
+                list(Reservation.objects.order_by("ticket").values_list("status")),
+                [("skipped",), ("fulfilled",)],
+            )
+        with self.subTest():
+            self.assertTrue(Book.objects.get(id=1).is_borrowed)
+        with self.subTest():
+            self.assertEqual(Book.objects.get(id=1).queue_length, 0)
+        self.assertFalse(Person.objects.rents_numbers_mismatched().exists())
+
+    def test_return_of_inactive_book_skips_queue(self):
+        """
+        returning rent of deactivated book should skip its queue instead of
+        renting it again
+        given data: book with db_id = 1 reserved by users 1 and 2, then deactivated
+        """
+        reserve(Person.objects.get(id=1), 1)
+        reserve(Person.objects.get(id=2), 1)
+        Book.objects.filter(id=1).deactivate()
+        result = return_rent(Rent.objects.get(id=4))
+        with self.subTest():
+            self.assertEqual(result.handed_off, [])
+        with self.subTest():
+            self.assertFalse(Book.objects.get(id=1).is_borrowed)
+        with self.subTest():
+            self.assertEqual(
+                list(Reservation.objects.values_list("status", flat=True)),
+                ["skipped", "skipped"],
+            )
+        self.assertEqual(Book.objects.get(id=1).queue_length, 0)
+
+    def test_closing_rent_by_save_hands_book_off(self):
+        """
+        closing rent by saving it should rent the book to the queue head
+        given data: book with db_id = 1 borrowed in rent 4, reserved by user 1
+        """
+        reserve(Person.objects.get(id=1), 1)
+        rent = Rent.objects.get(id=4)
+        rent.return_date = datetime.date.today()
+        rent.save()
+        with self.subTest():
+            self.assertEqual(Rent.objects.opened().for_books(1).get().user_id, 1)
+        with self.subTest():
+            self.assertEqual(Reservation.objects.get().status, "fulfilled")
+        with self.subTest():
+            self.assertTrue(Book.objects.get(id=1).is_borrowed)
+        self.assertFalse(Person.objects.rents_numbers_mismatched().exists())
+
+    def test_checkout_keeps_queue_of_book_on_shelf(self):
+        """
+        checkout() and bulk_checkout() should refuse book on shelf to users
+        behind the queue head and rent it to the head
+        given data: book with db_id = 1 reserved by inactive user 2 and by
+        user 1, then put on shelf by deleting its rent 4
+        """
+        persons = {e.id: e for e in Person.objects.all()}
+        reserve(persons[2], 1)
+        reserve(persons[1], 1)
+        Person.objects.filter(id=2).deactivate()
+        Rent.objects.filter(id=4).delete()
+        with self.subTest():
+            self.assertEqual(
+                checkout(persons[3], 1).conflicts, {1: "is reserved by other user"}
+            )
+        with self.subTest():
+            self.assertEqual(
+                bulk_checkout(persons[3], [1]).conflicts,
+                {1: "is reserved by other user"},
+            )
+        with self.subTest():
+            self.assertEqual(len(checkout(persons[1], 1).rents), 1)
+        with self.subTest():
+            self.assertEqual(
+                list(Reservation.objects.order_by("ticket").values_list("status")),
+                [("skipped",), ("fulfilled",)],
+            )
+        self.assertEqual(Book.objects.get(id=1).queue_length, 0)
+
+    def test_book_reserve_view(self):
+        """
+        book reserve page should show queue position of new reservation
+        given data: book with db_id = 2 borrowed by user with db_id = 5
+        """
+        self.client.force_login(User.objects.create_user("librarian"))
+        url = reverse("library:book_reserve", args=[2])
+        response = self.client.post(url, {"user": 1})
+        with self.subTest():
+            self.assertContains(response, "Reserved with place 1 in queue")
+        response = self.client.post(url, {"user": 5})
+        self.assertContains(response, "Book is borrowed by the user.")
+
+
+class RentEventTests(SetUpTestData):
+    """
+    Class for rent events log and its consumers testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+        cls.offset = RentEvent.objects.latest("id").id
+
+    def test_setup_events(self):
+        """
+        saving rents should log borrowed and returned events
+        given data: 5 rents saved, 3 of them closed
+        """
+        self.assertEqual(
+            list(RentEvent.objects.order_by("id").values_list("kind", "rent_id")),
+            [
+                ("borrowed", 1),
+                ("returned", 1),
+                ("borrowed", 2),
+                ("returned", 2),
+                ("borrowed", 3),
+                ("returned", 3),
+                ("borrowed", 4),
+                ("borrowed", 5),
+            ],
+        )
+
+    def test_circulation_changes_log_events(self):
+        """
+        checkouts, returns, hand-offs and deactivations should log events
+        given data: book with db_id = 1 reserved by user 1 and returned,
+        book with db_id = 3 rented and book with db_id = 4 deleted
+        """
+        today = datetime.date.today()
+        reserve(Person.objects.get(id=1), 1)
+        return_rent(Rent.objects.get(id=4))
+        checkout(Person.objects.get(id=2), 3)
+        self.client.force_login(User.objects.create_user("librarian"))
+        self.client.get(reverse("library:book_delete", args=[4]))
+        with self.subTest():
+            self.assertEqual(
+                list(
+                    RentEvent.objects.after(self.offset).values_list(
+                        "kind", "book_id", "user_id", "day"
+                    )
+                ),
+                [
+                    ("returned", 1, 3, today),
+                    ("borrowed", 1, 1, today),
+                    ("borrowed", 3, 2, today),
+                    ("deactivated", 4, None, today),
+                ],
+            )
+        with self.subTest():
+            self.assertEqual(Book.objects.filter(id=4).deactivate(), 0)
+        self.assertEqual(RentEvent.objects.after(self.offset).count(), 4)
+
+    def test_qs_after(self):
+        """
+        .after() should read events by primary key range
+        given data: events of setup rents
+        """
+        with self.subTest():
+            self.assertEqual(len(events.after(2, limit=3)), 3)
+        self.assertIn("USING INTEGER PRIMARY KEY", RentEvent.objects.after(2).explain())
+
+    def test_consume_handles_only_new_events(self):
+        """
+        consume() should pass every event once, keep offset after failed batch
+        and continue with new events only
+        given data: 8 setup events, consumed in batches of 3
+        """
+        handled = []
+        with self.subTest():
+            self.assertEqual(events.consume("stats", handled.append, batch_size=3), 8)
+        with self.subTest():
+            self.assertEqual([len(e) for e in handled], [3, 3, 2])
+        with self.subTest():
+            self.assertEqual(events.offset("stats"), self.offset)
+        checkout(Person.objects.get(id=2), 3)
+
+        def failing(batch):
+            raise ValueError("handler failed")
+
+        with self.subTest():
+            with self.assertRaises(ValueError):
+                events.consume("stats", failing)
+        with self.subTest():
+            self.assertEqual(events.offset("stats"), self.offset)
+        handled.clear()
+        with self.subTest():
+            self.assertEqual(events.consume("stats", handled.append), 1)
+        self.assertEqual(handled[0][0].rent_id, Rent.objects.latest("id").id)
+
+    def test_rent_events_command(self):
+        """
+        rent_events command should print events after id or of a consumer
+        given data: 8 setup events
+        """
+        out = io.StringIO()
+        call_command("rent_events", after=self.offset - 2, stdout=out)
+        with self.subTest():
+            self.assertEqual(
+                [json.loads(e)["rent_id"] for e in out.getvalue().splitlines()],
+                [4, 5],
+            )
+        out = io.StringIO()
+        call_command("rent_events", consumer="export", stdout=out)
+        with self.subTest():
+            self.assertEqual(len(out.getvalue().splitlines()), 8)
+        self.assertEqual(events.offset("export"), self.offset)
+
+
+class TitleTests(SetUpTestData):
+    """
+    Class for catalogue titles and their copies counters testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def add_copies(self, title_id: int, number: int) -> list:
+        title = Title.objects.get(id=title_id)
+        copies = []
+        for _ in range(number):
+            copies.append(Book(title=title.name, catalogue_title=title))
+            copies[-1].save()
+        return copies
+
+    def test_setup_titles(self):
+        """
+        every saved book should become the only copy of its own title
+        given data: books with db_id = 1, 2 borrowed, db_id = 3, 4 on shelf
+        """
+        with self.subTest():
+            self.assertEqual(
+                list(
+                    Title.objects.order_by("id").values_list(
+                        "id", "name", "copies_total", "copies_available"
+                    )
+                ),
+                [
+                    (1, "Bieguni", 1, 0),
+                    (2, "Uprowadzenie", 1, 0),
+                    (3, "Pan Tadeusz", 1, 1),
+                    (4, "Nad Niemnem", 1, 1),
+                ],
+            )
+        with self.subTest():
+            self.assertEqual(
+                list(Title.objects.get(id=3).authors.all()), [Person.objects.get(id=7)]
+            )
+        self.assertFalse(Title.objects.copies_mismatched().exists())
+
+    def test_counters_follow_circulation(self):
+        """
+        checkouts, returns and deactivations of copies should keep counters
+        of their title equal to counted copies
+        given data: title with db_id = 3 and two more copies of it
+        """
+        copies = self.add_copies(3, 2)
+        title = Title.objects.filter(id=3)
+        with self.subTest():
+            self.assertEqual(title.get().copies_available, 3)
+        rent = checkout(Person.objects.get(id=1), copies[0].id).rents[0]
+        bulk_checkout(Person.objects.get(id=2), [3, 4])
+        with self.subTest():
+            self.assertEqual(title.get().copies_available, 1)
+        return_rent(rent)
+        Book.objects.filter(id__in=[3, copies[1].id]).deactivate()
+        self.add_copies(3, 1)[0].delete()
+        with self.subTest():
+            self.assertEqual(
+                title.values_list("copies_total", "copies_available").get(), (1, 1)
+            )
+        with self.subTest():
+            self.assertEqual(Title.objects.available().filter(id=4).count(), 0)
+        self.assertFalse(Title.objects.copies_mismatched().exists())
+
+    def test_delete_of_stale_copy_keeps_counters(self):
+        """
+        deleting a copy loaded before its checkout should keep title counters
+        given data: new copy of title with db_id = 3 borrowed after loading
+        """
+        copy = self.add_copies(3, 1)[0]
+        checkout(Person.objects.get(id=1), copy.id)
+        copy.delete()
+        with self.subTest():
+            self.assertEqual(
+                Title.objects.values_list("copies_total", "copies_available").get(id=3),
+                (1, 1),
+            )
+        self.assertFalse(Title.objects.copies_mismatched().exists())
+
+    def test_saved_copy_keeps_counters(self):
+        """
+        saving a copy moved to another title or deactivated should recount
+        both titles and move its authors
+        given data: book with db_id = 3 on shelf by author with db_id = 7,
+        title with db_id = 1 with one borrowed copy by author with db_id = 5
+        """
+        book = Book.objects.get(id=3)
+        book.catalogue_title_id = 1
+        book.save()
+        counters = Title.objects.order_by("id").values_list(
+            "id", "copies_total", "copies_available"
+        )
+        with self.subTest():
+            self.assertEqual(
+                list(counters.filter(id__in=[1, 3])), [(1, 2, 1), (3, 0, 0)]
+            )
+        with self.subTest():
+            self.assertEqual(
+                sorted(Title.objects.get(id=1).authors.values_list("id", flat=True)),
+                [5, 7],
+            )
+        with self.subTest():
+            self.assertFalse(Title.objects.get(id=3).authors.exists())
+        book.is_active = False
+        book.save()
+        with self.subTest():
+            self.assertEqual(list(counters.filter(id=1)), [(1, 1, 0)])
+        self.assertFalse(Title.objects.copies_mismatched().exists())
+
+    def test_title_authors_follow_copies(self):
+        """
+        adding, removing and clearing authors of copies, also from the person
+        side, should keep authors of their titles
+        given data: book with db_id = 3 by author with db_id = 7
+        """
+        book = Book.objects.get(id=3)
+        title = Title.objects.get(id=3)
+        book.authors.add(6)
+        with self.subTest():
+            self.assertEqual(sorted(title.authors.values_list("id", flat=True)), [6, 7])
+        book.authors.remove(7)
+        with self.subTest():
+            self.assertEqual(list(title.authors.values_list("id", flat=True)), [6])
+        Person.objects.get(id=6).book_set.clear()
+        self.assertFalse(title.authors.exists())
+
+    def test_rebuild_circulation_fixes_counters(self):
+        """
+        rebuild_circulation command should find and recompute stale counters
+        given data: counters of title with db_id = 4 shifted by hand
+        """
+        Title.objects.filter(id=4).add_copies(total=2, available=-1)
+        with self.subTest():
+            with self.assertRaisesMessage(CommandError, "1 titles have stale"):
+                call_command("rebuild_circulation", check=True, stdout=io.StringIO())
+        call_command("rebuild_circulation", stdout=io.StringIO())
+        self.assertEqual(
+            Title.objects.values_list("copies_total", "copies_available").get(id=4),
+            (1, 1),
+        )
+
+    def test_books_view_lists_titles(self):
+        """
+        books view should show one row per title with its counters, in the
+        same number of queries whatever the number of copies
+        given data: 4 titles, then 5 more copies of title with db_id = 3
+        """
+        self.client.force_login(User.objects.create_user("librarian"))
+        get_cache().clear()
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(reverse("library:books"))
+        self.add_copies(3, 5)
+        get_cache().clear()
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(reverse("library:books"))
+        with self.subTest():
+            self.assertEqual(len(response.context["books"]), 4)
+        with self.subTest():
+            self.assertContains(response, "6 / 6")
+        with self.subTest():
+            self.assertEqual(len(after), len(before))
+        response = self.client.get(reverse("library:title_status", args=[3]))
+        self.assertEqual(len(response.context["copies"]), 6)
+
+    def test_book_add_creates_copies(self):
+        """
+        book_add view should create one title with given number of copies
+        given data: new title by author with db_id = 5 in 3 copies
+        """
+        self.client.force_login(User.objects.create_user("librarian"))
+        self.client.post(
+            reverse("library:book_add"),
+            {"title": "Lalka", "authors": [5], "copies": 3},
+        )
+        title = Title.objects.get(name="Lalka")
+        with self.subTest():
+            self.assertEqual((title.copies_total, title.copies_available), (3, 3))
+        with self.subTest():
+            self.assertEqual(list(title.authors.values_list("id", flat=True)), [5])
+        self.assertEqual(
+            Book.objects.filter(catalogue_title=title, authors=5).count(), 3
+        )
+
+    def test_book_add_rerenders_invalid_form(self):
+        """
+        book_add view should render the form again with its errors
+        given data: new title in 0 copies
+        """
+        self.client.force_login(User.objects.create_user("librarian"))
+        response = self.client.post(
+            reverse("library:book_add"),
+            {"title": "Lalka", "authors": [5], "copies": 0},
+        )
+        with self.subTest():
+            self.assertEqual(response.status_code, 200)
+        with self.subTest():
+            self.assertIn("copies", response.context["book_form"].errors)
+        self.assertFalse(Title.objects.filter(name="Lalka").exists())
+
+
+class CachedAuthenticationTests(SetUpTestData):
+    """
+    Class for cached sessions and authenticated users testing.
+    """
+
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+        self.user = User.objects.create_user("librarian", password="secret")
+        self.client.force_login(self.user)
+
+    def test_second_request_skips_session_and_user_tables(self):
+        """
+        second request of logged in user should read neither session nor user
+        given data: index page read twice
+        """
+        self.client.get(reverse("library:index"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("library:index"))
+        with self.subTest():
+            self.assertEqual(response.status_code, 200)
+        with self.subTest():
+            self.assertEqual(response.wsgi_request.user, self.user)
+        self.assertEqual(len(queries), 0)
+
+    def test_user_change_invalidates_cached_user(self):
+        """
+        changing password should log other sessions out despite cached user
+        given data: user cached by the first request
+        """
+        self.client.get(reverse("library:index"))
+        self.user.set_password("changed")
+        self.user.save()
+        response = self.client.get(reverse("library:index"))
+        with self.subTest():
+            self.assertRedirects(
+                response, f"{reverse('login')}?next={reverse('library:index')}"
+            )
+        self.assertIsNone(auth.get_users_cache().get(auth.user_key(self.user.pk)))
+
+    def test_password_hash_stays_out_of_shared_cache(self):
+        """
+        cached user should be kept in process-local users cache only
+        given data: user cached by the first request
+        """
+        self.client.get(reverse("library:index"))
+        with self.subTest():
+            self.assertEqual(
+                auth.get_users_cache().get(auth.user_key(self.user.pk)), self.user
+            )
+        # locmem cache keeps pickled values
+        self.assertFalse(
+            [e for e in get_cache()._cache.values() if self.user.password.encode() in e]
+        )
+
+
+class StaticFilesTests(SetUpTestData):
+    """
+    Class for collected static files, their serving and image variants testing.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(STATIC_ROOT=directory))
+        call_command("collectstatic", interactive=False, verbosity=0)
+        self.hashed = staticfiles_storage.stored_name("library/js/autocomplete.js")
+
+    def test_collectstatic_writes_hashed_compressed_files(self):
+        """
+        collectstatic should store hashed name and its smaller gzip and brotli copies
+        given data: library/js/autocomplete.js
+        """
+        with self.subTest():
+            self.assertRegex(self.hashed, r"^library/js/autocomplete\.\w{12}\.js$")
+        with staticfiles_storage.open(self.hashed) as file:
+            original = file.read()
+        with staticfiles_storage.open(self.hashed + ".gz") as file:
+            copy = file.read()
+        with self.subTest():
+            self.assertLess(len(copy), len(original))
+        with self.subTest():
+            self.assertEqual(gzip.decompress(copy), original)
+        with staticfiles_storage.open(self.hashed + ".br") as file:
+            self.assertEqual(storage.brotli.decompress(file.read()), original)
+
+    def test_serves_precompressed_file_with_cache_headers(self):
+        """
+        static files should be served compressed to clients accepting it,
+        cached forever under hashed names and revalidated under plain ones
+        given data: hashed and plain name of library/js/autocomplete.js
+        """
+        url = settings.STATIC_URL + self.hashed
+        response = self.client.get(url, headers={"accept-encoding": "gzip, br"})
+        with self.subTest():
+            self.assertEqual(response["Content-Encoding"], "br")
+        with self.subTest():
+            self.assertEqual(response["Content-Type"], "text/javascript")
+        with self.subTest():
+            self.assertIn("immutable", response["Cache-Control"])
+        with self.subTest():
+            self.assertEqual(
+                self.client.get(
+                    url,
+                    headers={
+                        "accept-encoding": "gzip, br",
+                        "if-none-match": response["ETag"],
+                    },
+                ).status_code,
+                304,
+            )
+        for accept_encoding, encoding in [
+            ("gzip", "gzip"),
+            ("br;q=0, gzip", "gzip"),
+            ("br;q=0.5, gzip;q=0.8", "gzip"),
+            ("*;q=0.1, br;q=0", "gzip"),
+            ("br;q=0, gzip;q=0", None),
+            ("identity", None),
+        ]:
+            response = self.client.get(
+                url, headers={"accept-encoding": accept_encoding}
+            )
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertEqual(response.get("Content-Encoding"), encoding)
+        response = self.client.get(settings.STATIC_URL + "library/js/autocomplete.js")
+        with self.subTest():
+            self.assertNotIn("Content-Encoding", response)
+        with self.subTest():
+            self.assertEqual(response["Cache-Control"], "public, max-age=60")
+        self.assertEqual(
+            self.client.get(settings.STATIC_URL + "../manage.py").status_code, 404
+        )
+
+    def test_responsive_image_offers_variants(self):
+        """
+        responsive_image tag should offer WebP variants first and fall back to img
+        given data: image with two stored variants and image without them
+        """
+        template = Template(
+            '{% load library_static %}{% responsive_image name alt="books" %}'
+        )
+        with unittest.mock.patch.object(
+            staticfiles_storage,
+            "variants",
+            lambda name: [
+                {"name": "a.320w.webp", "width": 320, "type": "image/webp"},
+                {"name": "a.320w.jpg", "width": 320, "type": "image/jpeg"},
+            ],
+        ):
+            html = template.render(Context({"name": "library/images/nerd_face.jpg"}))
+        with self.subTest():
+            self.assertRegex(
+                html,
+                r'^<picture><source type="image/webp" srcset="/static/a\.320w\.webp 320w" '
+                r'sizes="320px"><source type="image/jpeg"',
+            )
+        with unittest.mock.patch.object(
+            staticfiles_storage, "variants", lambda name: []
+        ):
+            html = template.render(Context({"name": "library/images/nerd_face.jpg"}))
+        self.assertRegex(
+            html, r'^<img src="/static/library/images/nerd_face\.\w{12}\.jpg"'
+        )
+
+    def test_collectstatic_writes_image_variants(self):
+        """
+        collectstatic should write resized WebP variants of images
+        given data: library/images/people_group.jpg
+        """
+        name = "library/images/people_group.jpg"
+        variants = staticfiles_storage.variants(name)
+        with self.subTest():
+            self.assertIn("image/webp", {e["type"] for e in variants})
+        with self.subTest():
+            self.assertIn(
+                staticfiles_storage.stored_name(name), {e["name"] for e in variants}
+            )
+        for variant in variants:
+            with self.subTest(variant=variant["name"]):
+                self.assertTrue(staticfiles_storage.exists(variant["name"]))
+            with self.subTest(variant=variant["name"]):
+                self.assertEqual(
+                    staticfiles_storage.stored_name(variant["name"]), variant["name"]
+                )
+
+
+class UserDashboardTests(SetUpTestData):
+    """
+    Class for user_status dashboard and rents summary testing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SetUpTestData.setup_database()
+
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+        self.client.force_login(User.objects.create_user("librarian"))
+
+    def test_summary_counts_rents_and_average_loan(self):
+        """
+        summary() should count rents of the user and average returned loans
+        given data: user with db_id = 3, rent 3 returned after 19 days, rent 4 due 2024-04-11
+        """
+        self.assertEqual(
+            Rent.objects.summary(datetime.date(2024, 5, 1), user=3),
+            {
+                "rents": 2,
+                "opened": 1,
+                "overdue": 1,
+                "returned": 1,
+                "average_loan_days": 19,
+            },
+        )
+
+    def test_summary_includes_archived_rents(self):
+        """
+        summary() with include_archive should also count archived rents
+        given data: rents 1 and 2 archived, returned after 33 and 16 days
+        """
+        archive.archive_rents(datetime.date(2024, 2, 3))
+        summary = Rent.objects.summary(include_archive=True)
+        with self.subTest():
+            self.assertEqual((summary["rents"], summary["returned"]), (5, 3))
+        self.assertAlmostEqual(summary["average_loan_days"], (33 + 16 + 19) / 3)
+
+    def test_user_status_shows_loans_and_history(self):
+        """
+        user_status should list open rents as loans and closed ones as history
+        given data: user with db_id = 3
+        """
+        response = self.client.get(reverse("library:user_status", args=[3]))
+        with self.subTest():
+            self.assertEqual([e.id for e in response.context["loans"]], [4])
+        with self.subTest():
+            self.assertEqual([e.id for e in response.context["history"]], [3])
+        self.assertEqual(response.context["summary"]["rents"], 2)
+
+    def test_user_status_history_includes_archived_rents(self):
+        """
+        user_status history should page archived rents with live ones, as
+        its summary counts them
+        given data: user with db_id = 5, rent 2 archived, rent 5 returned
+        """
+        archive.archive_rents(datetime.date(2024, 2, 3))
+        return_rent(Rent.objects.get(id=5))
+        url = reverse("library:user_status", args=[5])
+        response = self.client.get(url, {"per_page": 1})
+        history = [e.id for e in response.context["history"]]
+        response = self.client.get(
+            url, {"per_page": 1, "after": response.context["history"].next_cursor}
+        )
+        history += [e.id for e in response.context["history"]]
+        with self.subTest():
+            self.assertEqual(history, [5, 2])
+        with self.subTest():
+            self.assertEqual(response.context["summary"]["returned"], len(history))
+        self.assertContains(response, "Bieguni")
+
+    def test_user_status_is_cached_until_user_rent_event(self):
+        """
+        user_status should be cached until a rent event of the user
+        given data: user with db_id = 3, rent 5 of user 5, rent 4 of user 3
+        """
+        url = reverse("library:user_status", args=[3])
+        self.client.get(url)
+        return_rent(Rent.objects.get(id=5))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        with self.subTest():
+            self.assertFalse([e for e in queries if "library_" in e["sql"]])
+        return_rent(Rent.objects.get(id=4))
+        response = self.client.get(url)
+        with self.subTest():
+            self.assertEqual(response.context["loans"], [])
+        self.assertEqual(
+            [e.id for e in response.context["history"]],
+            [4, 3],
+        )
+
+    def test_user_status_is_refreshed_after_rent_delete_and_edit(self):
+        """
+        user_status should not be cached after a rent of the user is deleted
+        or its dates are edited
+        given data: user with db_id = 3, rent 4 open, rent 3 closed
+        """
+        url = reverse("library:user_status", args=[3])
+        self.client.get(url)
+        rent = Rent.objects.get(id=3)
+        rent.due_date = datetime.date(2024, 1, 1)
+        rent.save()
+        response = self.client.get(url)
+        with self.subTest():
+            self.assertEqual(
+                [e.due_date for e in response.context["history"]],
+                [datetime.date(2024, 1, 1)],
+            )
+        Rent.objects.filter(id=4).delete()
+        response = self.client.get(url)
+        with self.subTest():
+            self.assertEqual(response.context["loans"], [])
+        self.assertEqual(response.context["summary"]["opened"], 0)
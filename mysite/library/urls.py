@@ -10,6 +10,11 @@ urlpatterns = [
         login_required(views.authors),
         name="authors",
     ),
+    path(
+        "authors/autocomplete/",
+        login_required(views.authors_autocomplete),
+        name="authors_autocomplete",
+    ),
     path(
         "authors/add/",
         login_required(views.author_add),
@@ -21,6 +26,11 @@ urlpatterns = [
         name="author_status",
     ),
     path("users/", login_required(views.users), name="users"),
+    path(
+        "users/autocomplete/",
+        login_required(views.users_autocomplete),
+        name="users_autocomplete",
+    ),
     path(
         "users/add/",
         login_required(
@@ -39,16 +49,36 @@ urlpatterns = [
         name="user_delete",
     ),
     path("books/", login_required(views.books), name="books"),
+    path(
+        "books/autocomplete/",
+        login_required(views.books_autocomplete),
+        name="books_autocomplete",
+    ),
+    path(
+        "books/autocomplete/all/",
+        login_required(views.all_books_autocomplete),
+        name="all_books_autocomplete",
+    ),
     path(
         "books/add/",
         login_required(views.book_add),
         name="book_add",
     ),
+    path(
+        "books/titles/<int:title_id>/",
+        login_required(views.title_status),
+        name="title_status",
+    ),
     path(
         "books/<int:book_id>/",
         login_required(views.book_status),
         name="book_status",
     ),
+    path(
+        "books/<int:book_id>/reserve/",
+        login_required(views.book_reserve),
+        name="book_reserve",
+    ),
     path(
         "books/<int:book_id>/delete/",
         login_required(views.book_delete),
@@ -62,11 +92,27 @@ urlpatterns = [
         ),
         name="rent_add",
     ),
+    path(
+        "rents/bulk/",
+        login_required(views.rent_bulk),
+        name="rent_bulk",
+    ),
     path(
         "rents/<int:rent_id>/",
         login_required(views.rent_status),
         name="rent_status",
     ),
+    path("stats/", login_required(views.stats), name="stats"),
+    path(
+        "cache/stats/",
+        login_required(views.cache_stats),
+        name="cache_stats",
+    ),
+    path(
+        "exports/<str:name>/",
+        login_required(views.export),
+        name="export",
+    ),
     path(
         "rents/<int:rent_id>/return/",
         login_required(views.rent_return),
@@ -1,14 +1,37 @@
 import datetime
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.views import LoginView, LogoutView
-from django.http import HttpResponse
+from django.db.models import Max, prefetch_related_objects
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.views.generic.edit import CreateView
 
-from .forms import AuthorForm, BookForm, BookInAuthorForm, LoginForm
-from .models import Book, Person, Rent
+from . import cache, metrics, search
+from .cache import BOOKS, PERSONS, RENTS, cached
+from .circulation import bulk_checkout, bulk_return, checkout, reserve, return_rent
+from .exports import EXPORT_FIELDS, FORMATS, export_lines, export_queryset
+from .forms import (
+    AuthorForm,
+    BookForm,
+    BookInAuthorForm,
+    BulkRentForm,
+    LoginForm,
+    RentForm,
+    ReservationForm,
+)
+from .models import Book, Person, Rent, RentRollup, Title
+from .pagination import paginate
+from .routers import primary
 
 
 class UserAddView(CreateView):
@@ -20,8 +43,17 @@ class UserAddView(CreateView):
 class RentAddView(CreateView):
     template_name = "library/rent_add.html"
     model = Rent
+    form_class = RentForm
 
-    fields = ["book", "user"]
+    def form_valid(self, form):
+        book = form.cleaned_data["book"]
+        result = checkout(form.cleaned_data["user"], book.pk)
+        if result.conflicts:
+            # other desk rented the book after the form was validated
+            form.add_error("book", f"Book {result.conflicts[book.pk]}.")
+            return self.form_invalid(form)
+        self.object = result.rents[0]
+        return redirect(self.get_success_url())
 
 
 class LoginView(LoginView):
@@ -48,15 +80,28 @@ def people(request):
 
 
 def authors(request):
-    authors_list = Person.objects.authors()
-    context = {"authors_list": authors_list}
+    queryset = Person.objects.authors()
+    ordering = ["id"]
+    if request.GET.get("q"):
+        queryset = queryset.search(request.GET["q"])
+        ordering = search.RANKED
+    authors_list = cached(
+        "authors",
+        [PERSONS, BOOKS],
+        lambda: paginate(request, queryset, ordering),
+        request.GET.urlencode(),
+    )
+    context = {"authors_list": authors_list, "page": authors_list}
     return render(request, "library/authors.html", context)
 
 
 def author_status(request, person_id):
-    author = get_object_or_404(Person, pk=person_id)
-    books = Person.objects.get(id=person_id).book_set.values("title").distinct()
-    context = {"author": author, "books": books}
+    def build():
+        author = get_object_or_404(Person, pk=person_id)
+        books = list(author.book_set.values("title").distinct())
+        return {"author": author, "books": books}
+
+    context = cached("author_status", [PERSONS, BOOKS], build, person_id)
     return render(request, "library/author_status.html", context)
 
 
@@ -95,79 +140,292 @@ def book_add(request):
     if request.method == "POST":
         book_form = BookForm(request.POST)
         if book_form.is_valid():
-            book = Book(title=book_form.cleaned_data["title"])
-            book.save()
-            for author in book_form.cleaned_data["authors"]:
-                book.authors.add(author.id)
+            title = Title.objects.create(name=book_form.cleaned_data["title"])
+            title.authors.set(book_form.cleaned_data["authors"])
+            for _ in range(book_form.cleaned_data["copies"]):
+                book = Book(title=title.name, catalogue_title=title)
+                book.save()
+                book.authors.set(book_form.cleaned_data["authors"])
             return redirect(reverse("library:books"))
+        messages.error(request, "Wrong data, validation error, try again.")
     else:
         book_form = BookForm()
-        context = {"book_form": book_form}
-        return render(request, "library/book_add.html", context)
+    context = {"book_form": book_form}
+    return render(request, "library/book_add.html", context)
 
 
 def users(request):
-    users_list = Person.objects.active().annotate_opened_rents_number()
-    context = {"users_list": users_list}
+    queryset = Person.objects.active()
+    ordering = ["-opened_rents_number", "-id"]
+    if request.GET.get("q"):
+        queryset = queryset.search(request.GET["q"])
+        ordering = search.RANKED
+    users_list = cached(
+        "users",
+        [PERSONS, RENTS],
+        lambda: paginate(request, queryset, ordering),
+        request.GET.urlencode(),
+    )
+    context = {"users_list": users_list, "page": users_list}
     return render(request, "library/users.html", context)
 
 
 def user_status(request, person_id):
-    user = get_object_or_404(Person, pk=person_id)
-    context = {"user": user}
+    rents = Rent.objects.for_users(person_id).select_related("book")
+    # history lists archived rents too, as summary counts them
+    history_rents = Rent.objects.closed().for_users(person_id, include_archive=True)
+
+    def build():
+        user = get_object_or_404(Person, pk=person_id)
+        loans = list(rents.opened().order_by("due_date", "id"))
+        summary = Rent.objects.summary(include_archive=True, user=person_id)
+        return {"user": user, "loans": loans, "summary": summary}
+
+    def build_history():
+        page = paginate(request, history_rents, ["-return_date", "-id"])
+        # union queryset can't select related books
+        prefetch_related_objects(page.object_list, "book")
+        return page
+
+    # rents of the user change only with their rent events
+    scopes = [PERSONS, BOOKS, cache.user_rents(person_id)]
+    context = cached("user_status", scopes, build, person_id)
+    history = cached(
+        "user_history", scopes, build_history, person_id, request.GET.urlencode()
+    )
+    context = dict(context, history=history, page=history, today=datetime.date.today())
     return render(request, "library/user_status.html", context)
 
 
+@primary
 def user_delete(request, person_id):
     user = get_object_or_404(Person, pk=person_id)
-    user.is_active = False
-    user.save()
+    Person.objects.filter(pk=user.pk).deactivate()
+    cache.bump(PERSONS)
     return redirect(reverse("library:users"))
 
 
 def books(request):
-    books = Book.objects.all().active().prefetch_related("authors").status()
-    context = {"books": books}
+    queryset = Title.objects.active().prefetch_related("authors")
+    ordering = ["id"]
+    if request.GET.get("q"):
+        queryset = queryset.search(request.GET["q"])
+        ordering = search.RANKED
+    books = cached(
+        "books",
+        [BOOKS, PERSONS, RENTS],
+        lambda: paginate(request, queryset, ordering),
+        request.GET.urlencode(),
+    )
+    context = {"books": books, "page": books}
     return render(request, "library/books.html", context)
 
 
+def title_status(request, title_id):
+    title = cached(
+        "title_status",
+        [BOOKS, PERSONS, RENTS],
+        lambda: get_object_or_404(
+            Title.objects.prefetch_related("authors"), pk=title_id
+        ),
+        title_id,
+    )
+    copies = cached(
+        "title_copies",
+        [BOOKS, RENTS],
+        lambda: list(
+            Book.objects.active()
+            .filter(catalogue_title=title_id)
+            .status()
+            .order_by("id")
+        ),
+        title_id,
+    )
+    context = {"title": title, "copies": copies}
+    return render(request, "library/title_status.html", context)
+
+
 def book_status(request, book_id):
     queryset = Book.objects.filter(id=book_id).status().prefetch_related("authors")
-    book = get_object_or_404(queryset)
+    book = cached(
+        "book_status",
+        [BOOKS, PERSONS, RENTS],
+        lambda: get_object_or_404(queryset),
+        book_id,
+    )
     context = {"book": book}
     return render(request, "library/book_status.html", context)
 
 
+def book_reserve(request, book_id):
+    book = get_object_or_404(Book.objects.active(), pk=book_id)
+    reservation = None
+    if request.method == "POST":
+        form = ReservationForm(request.POST)
+        if form.is_valid():
+            result = reserve(form.cleaned_data["user"], book.pk)
+            if result.conflicts:
+                form.add_error(None, f"Book {result.conflicts[book.pk]}.")
+            else:
+                reservation = result.reservations[0]
+    else:
+        form = ReservationForm()
+    context = {"book": book, "form": form, "reservation": reservation}
+    return render(request, "library/book_reserve.html", context)
+
+
+@primary
 def book_delete(request, book_id):
     book = get_object_or_404(Book, pk=book_id)
-    book.is_active = False
-    book.save()
+    Book.objects.filter(pk=book.pk).deactivate()
+    cache.bump(BOOKS)
     return redirect(reverse("library:books"))
 
 
+def autocomplete(request, queryset):
+    """
+    Returns JSON page of objects matching prefix search in q GET parameter.
+    """
+    ordering = ["id"]
+    if request.GET.get("q"):
+        queryset = queryset.search(request.GET["q"])
+        ordering = search.RANKED
+    page = paginate(request, queryset, ordering)
+    results = [{"id": obj.pk, "text": str(obj)} for obj in page]
+    return JsonResponse({"results": results, "next": page.next_cursor})
+
+
+def books_autocomplete(request):
+    return autocomplete(request, Book.objects.active().available())
+
+
+def all_books_autocomplete(request):
+    return autocomplete(request, Book.objects.all())
+
+
+def users_autocomplete(request):
+    return autocomplete(request, Person.objects.active())
+
+
+def authors_autocomplete(request):
+    return autocomplete(request, Person.objects.all())
+
+
+def stats(request):
+    rollups = RentRollup.objects.totals()
+    # ongoing rents are rolled up for library totals only
+    opened = None
+    if request.GET.get("book", "").isdigit():
+        rollups = RentRollup.objects.for_book(request.GET["book"])
+    elif request.GET.get("user", "").isdigit():
+        rollups = RentRollup.objects.for_user(request.GET["user"])
+    else:
+        opened = RentRollup.objects.opened_at_month_end()
+    months = list(rollups.by_month())
+    for month in months:
+        month["average_loan_days"] = (
+            month["loan_days"] / month["returned"] if month["returned"] else None
+        )
+        if opened is not None:
+            month["opened"] = opened.get(month["month"])
+    context = {
+        "months": months,
+        "show_opened": opened is not None,
+        "average_loan_days": rollups.average_loan_days(),
+        "updated": RentRollup.objects.totals().aggregate(day=Max("day"))["day"],
+    }
+    return render(request, "library/stats.html", context)
+
+
+def cache_stats(request):
+    return JsonResponse(cache.stats())
+
+
+def metrics_export(request):
+    allowed = getattr(settings, "LIBRARY_METRICS_ALLOWED_IPS", settings.INTERNAL_IPS)
+    if request.META.get("REMOTE_ADDR") not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 def test(request):
     return HttpResponse("odpowiedz")
 
 
 def rents(request):
-    rents_list = (
-        Rent.objects.all().prefetch_related("book", "user").order_by("return_date")
+    rents_list = cached(
+        "rents",
+        [RENTS, BOOKS, PERSONS],
+        lambda: paginate(
+            request, Rent.objects.select_related("book", "user"), ["return_date", "id"]
+        ),
+        request.GET.urlencode(),
     )
-    context = {"rents_list": rents_list}
+    context = {"rents_list": rents_list, "page": rents_list}
     return render(request, "library/rents.html", context)
 
 
 def rent_status(request, rent_id):
-    queryset = Rent.objects.filter(id=rent_id).prefetch_related("book", "user")
-    rent = get_object_or_404(queryset)
+    queryset = Rent.objects.filter(id=rent_id).select_related("book", "user")
+    rent = cached(
+        "rent_status",
+        [RENTS, BOOKS, PERSONS],
+        lambda: get_object_or_404(queryset),
+        rent_id,
+    )
     context = {"rent": rent}
     return render(request, "library/rent_status.html", context)
 
 
+def export(request, name):
+    file_format = request.GET.get("format", "csv")
+    if name not in EXPORT_FIELDS or file_format not in FORMATS:
+        raise Http404("Unknown export.")
+    filters = {}
+    if name == "rents":
+        try:
+            filters = {
+                "users": [int(e) for e in request.GET.getlist("user")],
+                "books": [int(e) for e in request.GET.getlist("book")],
+                "borrowed_after": request.GET.get("borrowed_after"),
+                "borrowed_before": request.GET.get("borrowed_before"),
+            }
+            for key in ("borrowed_after", "borrowed_before"):
+                if filters[key]:
+                    filters[key] = datetime.date.fromisoformat(filters[key])
+        except ValueError:
+            return HttpResponseBadRequest("Wrong export filter value.")
+    response = StreamingHttpResponse(
+        export_lines(name, export_queryset(name, **filters), file_format),
+        content_type=FORMATS[file_format],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{name}.{file_format}"'
+    return response
+
+
+def rent_bulk(request):
+    result = None
+    if request.method == "POST":
+        form = BulkRentForm(request.POST)
+        if form.is_valid():
+            user = form.cleaned_data["user"]
+            books = form.cleaned_data["books"]
+            if form.cleaned_data["action"] == BulkRentForm.CHECKOUT:
+                result = bulk_checkout(user, books)
+            else:
+                result = bulk_return(books, user)
+    else:
+        form = BulkRentForm()
+    context = {"form": form, "result": result}
+    return render(request, "library/rent_bulk.html", context)
+
+
+@primary
 def rent_return(request, rent_id):
-    rent = get_object_or_404(Rent, pk=rent_id)
-    rent.return_date = datetime.date.today()
-    rent.save()
+    rent = get_object_or_404(Rent.objects.only("book", "user"), pk=rent_id)
+    return_rent(rent)
     return redirect(reverse("library:rents"))
 
 
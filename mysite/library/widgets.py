@@ -0,0 +1,47 @@
+from django.forms import Media, Select, SelectMultiple
+from django.urls import reverse
+
+
+class AutocompleteMixin:
+    """
+    Renders only selected options, the rest is fetched on demand from url view.
+    """
+
+    def __init__(self, url, attrs=None):
+        super().__init__(attrs)
+        self.url = url
+
+    @property
+    def media(self):
+        return Media(js=["library/js/autocomplete.js"])
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs["data-autocomplete-url"] = reverse(self.url)
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        """
+        Returns option groups of selected objects only, fetched with one query.
+        """
+        groups = []
+        if not self.is_required and not self.allow_multiple_selected:
+            groups.append((None, [self.create_option(name, "", "", False, 0)], 0))
+        selected = [e for e in value if e and str(e).isdigit()]
+        if not selected:
+            return groups
+        field = self.choices.field
+        for index, obj in enumerate(self.choices.queryset.filter(pk__in=selected), 1):
+            option = self.create_option(
+                name, obj.pk, field.label_from_instance(obj), True, index
+            )
+            groups.append((None, [option], index))
+        return groups
+
+
+class AutocompleteSelect(AutocompleteMixin, Select):
+    pass
+
+
+class AutocompleteSelectMultiple(AutocompleteMixin, SelectMultiple):
+    pass
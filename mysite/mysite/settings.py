@@ -49,11 +49,14 @@ if DEBUG:
     ]
 
 MIDDLEWARE = [
+    "library.middleware.StaticFilesMiddleware",
+    "library.middleware.MetricsMiddleware",
+    "library.middleware.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "library.middleware.CachedAuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -66,7 +69,7 @@ ROOT_URLCONF = "mysite.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "library.metrics.InstrumentedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -92,9 +95,62 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # seconds a writer waits for the lock before "database is locked"
+        "OPTIONS": {"timeout": int(os.environ.get("LIBRARY_SQLITE_TIMEOUT", 20))},
     }
 }
 
+# Read replicas of library models, see library/routers.py. SQLite replicas are
+# copies refreshed by sync_replica command, listed in LIBRARY_SQLITE_REPLICAS
+# separated with commas; other ones (e.g. PostgreSQL standby) are added to
+# DATABASES and LIBRARY_REPLICAS directly
+LIBRARY_REPLICAS = []
+for name in filter(None, os.environ.get("LIBRARY_SQLITE_REPLICAS", "").split(",")):
+    LIBRARY_REPLICAS.append(f"replica_{len(LIBRARY_REPLICAS) + 1}")
+    DATABASES[LIBRARY_REPLICAS[-1]] = dict(
+        DATABASES["default"], NAME=BASE_DIR / name, TEST={"MIRROR": "default"}
+    )
+DATABASE_ROUTERS = ["library.routers.PrimaryReplicaRouter"]
+# Clients who wrote read from the primary this long, more than replication lag
+LIBRARY_REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "library",
+    }
+}
+# file cache is shared by all worker processes of the server
+if os.environ.get("LIBRARY_CACHE_DIR"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ["LIBRARY_CACHE_DIR"],
+    }
+# authenticated users with their password hashes stay in process memory
+CACHES["users"] = {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    "LOCATION": "library-users",
+}
+LIBRARY_CACHE_TIMEOUT = 300
+# Authenticated users are read from cache this long, see library/auth.py
+LIBRARY_USER_CACHE_SECONDS = 60
+LIBRARY_USER_CACHE_ALIAS = "users"
+
+
+# Sessions
+# https://docs.djangoproject.com/en/5.0/topics/http/sessions/
+
+# cached_db reads sessions from cache, writing to the database only on login
+# and changes; signed_cookies keeps them in the client cookie without any
+# table, but can not be revoked on the server before they expire
+SESSION_ENGINE = "django.contrib.sessions.backends." + os.environ.get(
+    "LIBRARY_SESSION_ENGINE", "cached_db"
+)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -132,6 +188,15 @@ USE_TZ = True
 
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
+# collectstatic writes content hashed names, precompressed copies and image
+# variants, served by library.middleware.StaticFilesMiddleware
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "library.storage.PrecompressedManifestStaticFilesStorage"
+    },
+}
+LIBRARY_SERVE_STATIC = os.environ.get("LIBRARY_SERVE_STATIC", "1") == "1"
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -141,6 +206,32 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
+
+# Requests slower than this are logged with their slowest queries, None (empty
+# or "off" LIBRARY_SLOW_REQUEST_MS) disables
+LIBRARY_SLOW_REQUEST_MS = os.environ.get("LIBRARY_SLOW_REQUEST_MS", "500").strip()
+LIBRARY_SLOW_REQUEST_MS = (
+    None
+    if LIBRARY_SLOW_REQUEST_MS.lower() in ("", "off")
+    else int(LIBRARY_SLOW_REQUEST_MS)
+)
+# Serve read only library views with async views, for ASGI deployments
+LIBRARY_ASYNC_VIEWS = os.environ.get("LIBRARY_ASYNC_VIEWS") == "1"
+# Addresses allowed to read /metrics/, defaults to INTERNAL_IPS
+LIBRARY_METRICS_ALLOWED_IPS = INTERNAL_IPS
+# Closed rents returned more days ago are moved to archive by archive_rents
+LIBRARY_ARCHIVE_AFTER_DAYS = 365
+# Rents are due this many days after borrowing
+LIBRARY_LOAN_PERIOD_DAYS = 30
+# Backend of overdue reminders and other notifications, see library/outbox.py
+LIBRARY_OUTBOX = {"BACKEND": "library.outbox.ConsoleBackend"}
+if os.environ.get("LIBRARY_OUTBOX_FILE"):
+    LIBRARY_OUTBOX = {
+        "BACKEND": "library.outbox.FileBackend",
+        "OPTIONS": {"path": os.environ["LIBRARY_OUTBOX_FILE"]},
+    }
+# Checkouts and returns are retried this many times while the database is locked
+LIBRARY_LOCKED_RETRIES = 5
 # jeszcze mniejsza zmiana
 BOOTSTRAP3 = {
     "include_jquery": True,
@@ -18,14 +18,20 @@ Including another URLconf
 from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
-from library.views import LoginView, LogoutView, test
+from library.views import LoginView, LogoutView, metrics_export, test
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("library/", include("library.urls")),
+    path(
+        "library/",
+        include(
+            "library.async_urls" if settings.LIBRARY_ASYNC_VIEWS else "library.urls"
+        ),
+    ),
     path("accounts/login/", LoginView.as_view(), name="login"),
     path("accounts/logout/", LogoutView.as_view(), name="logout"),
     path("test/", test, name="test"),
+    path("metrics/", metrics_export, name="metrics"),
 ]
 
 if settings.DEBUG: